@@ -0,0 +1,50 @@
+import argparse
+import dataclasses
+import time
+from datetime import datetime
+
+from inbound.core.job import Job
+from inbound.core.models import Metadata
+
+metadata = Metadata(
+    source_env="bench",
+    run_id="bench",
+    job_name="bench",
+    inbound_version="bench",
+    load_time=datetime(2020, 1, 1),
+)
+
+
+def synthetic_batches(rows: int, batch_size: int):
+    batch = [(i, "foo", 1.5, datetime(2020, 1, 1)) for i in range(batch_size)]
+    for _ in range(rows // batch_size):
+        yield batch
+
+
+def per_row_astuple(data_generator):
+    # Implementasjonen før metadata ble beregnet én gang per jobb
+    for data in data_generator:
+        yield [tuple(row) + dataclasses.astuple(metadata) for row in data]
+
+
+def precomputed(data_generator):
+    job = Job(tap=None, sink=None, metadata=metadata)
+    return job.metadata_generator(data_generator)
+
+
+def measure(name: str, generator, rows: int, batch_size: int):
+    start = time.perf_counter()
+    for _ in generator(synthetic_batches(rows, batch_size)):
+        pass
+    elapsed = time.perf_counter() - start
+    print(f"{name:>16}: {rows / elapsed:>14,.0f} rows/sec ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    measure("per-row astuple", per_row_astuple, args.rows, args.batch_size)
+    measure("precomputed", precomputed, args.rows, args.batch_size)
@@ -0,0 +1,66 @@
+import argparse
+import time
+
+from jinja2 import Environment
+
+from inbound.core.models import Description
+from inbound.sdk.utils import compile_template, get_query_list, render_all
+from inbound.sinks.snowflake import SnowSink
+
+QUERY_TEMPLATE = """
+select * from {{ highwatermark['schema'] }}.foo
+where updated > to_date('{{ highwatermark['from'] }}', 'YYYY-MM-DD')
+and updated <= to_date('{{ highwatermark['to'] }}', 'YYYY-MM-DD')
+"""
+
+column_descriptions = [
+    Description(name=f"col_{i}", type="number", precision=38, scale=0, nullable=True)
+    for i in range(50)
+]
+
+
+def uncached_query_list(query_template: str, highwatermarks: list[dict]):
+    # Implementasjonen før malene ble cachet
+    jinja_template = Environment().from_string(source=query_template)
+    return [jinja_template.render(highwatermark=hw) for hw in highwatermarks]
+
+
+def measure(name: str, function, calls: int):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:>24}: {calls / elapsed:>12,.0f} calls/sec ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2_000)
+    parser.add_argument("--highwatermarks", type=int, default=1)
+    args = parser.parse_args()
+
+    highwatermarks = [
+        {"schema": "bar", "from": "2020-01-01", "to": "2020-01-02"}
+    ] * args.highwatermarks
+
+    measure(
+        "uncached get_query_list",
+        lambda: uncached_query_list(QUERY_TEMPLATE, highwatermarks),
+        args.calls,
+    )
+    measure(
+        "cached get_query_list",
+        lambda: get_query_list(QUERY_TEMPLATE, highwatermarks),
+        args.calls,
+    )
+    measure(
+        "render_all",
+        lambda: render_all(QUERY_TEMPLATE, highwatermarks),
+        args.calls,
+    )
+    measure(
+        "create_ddl",
+        lambda: SnowSink.create_ddl("foo.bar.baz", column_descriptions, True),
+        args.calls,
+    )
+    print(compile_template.cache_info())
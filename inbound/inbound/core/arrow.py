@@ -0,0 +1,46 @@
+from io import BytesIO
+
+
+def is_arrow_batch(data) -> bool:
+    # pyarrow.Table eller pyarrow.RecordBatch. Sjekker attributter i stedet for
+    # type så pyarrow bare må være installert når Arrow-batcher faktisk brukes.
+    return hasattr(data, "schema") and hasattr(data, "num_rows")
+
+
+def to_arrow_table(data):
+    import pyarrow as pa
+
+    if isinstance(data, pa.Table):
+        return data
+    if isinstance(data, pa.RecordBatch):
+        return pa.Table.from_batches([data])
+    if hasattr(data, "__arrow_c_stream__"):
+        return pa.table(data)
+    # python-oracledb 2.x leverer bare dataframe interchange-protokollen
+    return pa.interchange.from_dataframe(data)
+
+
+def with_constant_columns(data, names: list[str], values: tuple):
+    import pyarrow as pa
+
+    table = to_arrow_table(data)
+    for name, value in zip(names, values):
+        table = table.append_column(name, pa.repeat(value, table.num_rows))
+    return table
+
+
+def arrow_to_rows(data) -> list[tuple]:
+    table = to_arrow_table(data)
+    return list(zip(*(column.to_pylist() for column in table.columns)))
+
+
+def arrow_to_csv(data) -> str:
+    import pyarrow.csv as pa_csv
+
+    buffer = BytesIO()
+    pa_csv.write_csv(
+        to_arrow_table(data),
+        buffer,
+        write_options=pa_csv.WriteOptions(include_header=False),
+    )
+    return buffer.getvalue().decode("utf-8")
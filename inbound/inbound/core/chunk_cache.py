@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+_safe_name = re.compile(r"^[\w.-]+$")
+
+
+def _file_name(name: str) -> str:
+    name = str(name)
+    if _safe_name.match(name) and name not in (".", ".."):
+        return name
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()
+
+
+def _write_atomic(path: str, data: bytes):
+    # Skriv til en midlertidig fil og flytt den på plass, så en avbrutt
+    # skriving aldri etterlater en halv chunk
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ChunkCache:
+    # Lagrer nedlastede chunks på disk, så en jobb som feiler etter
+    # nedlastingen kan kjøres på nytt uten å hente alt igjen. Hver nøkkel
+    # (f.eks. workspace/modell/eksport/fil) har én oppgave (task) om gangen.
+    # Chunks sjekkes mot en sha256 når de leses, og oppgaver eldre enn
+    # ttl_seconds slettes.
+    def __init__(self, directory: str, ttl_seconds: Optional[float] = 60 * 60 * 6):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(self.directory, exist_ok=True)
+        self.evict()
+
+    def _key_directory(self, key: tuple) -> str:
+        name = "/".join(str(part) for part in key)
+        return os.path.join(
+            self.directory, hashlib.sha256(name.encode("utf-8")).hexdigest()
+        )
+
+    def _task_directory(self, key: tuple, task_id: str) -> str:
+        return os.path.join(self._key_directory(key), _file_name(task_id))
+
+    def _manifest(self, key: tuple) -> Optional[dict]:
+        path = os.path.join(self._key_directory(key), "task.json")
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, key: tuple, manifest: dict):
+        path = os.path.join(self._key_directory(key), "task.json")
+        _write_atomic(path, json.dumps(manifest).encode("utf-8"))
+
+    def _expired(self, manifest: dict) -> bool:
+        if self.ttl_seconds is None:
+            return False
+        return time.time() - manifest["created_at"] > self.ttl_seconds
+
+    def task(self, key: tuple) -> Optional[str]:
+        manifest = self._manifest(key)
+        if manifest is None or self._expired(manifest):
+            return None
+        return manifest["task_id"]
+
+    def start(self, key: tuple, task_id: str):
+        # Samme oppgave beholder chunks og alder, en ny oppgave erstatter den gamle
+        manifest = self._manifest(key)
+        if manifest is not None and manifest["task_id"] == task_id:
+            return
+        self.invalidate(key)
+        os.makedirs(self._task_directory(key, task_id), exist_ok=True)
+        self._write_manifest(
+            key, {"key": list(key), "task_id": task_id, "created_at": time.time()}
+        )
+
+    def chunk_ids(self, key: tuple, task_id: str) -> Optional[list]:
+        manifest = self._manifest(key)
+        if manifest is None or manifest["task_id"] != task_id:
+            return None
+        return manifest.get("chunk_ids")
+
+    def set_chunk_ids(self, key: tuple, task_id: str, chunk_ids: list):
+        manifest = self._manifest(key)
+        if manifest is None or manifest["task_id"] != task_id:
+            return
+        manifest["chunk_ids"] = chunk_ids
+        self._write_manifest(key, manifest)
+
+    def get(self, key: tuple, task_id: str, chunk_id: str) -> Optional[bytes]:
+        path = os.path.join(self._task_directory(key, task_id), _file_name(chunk_id))
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            with open(f"{path}.sha256") as f:
+                checksum = f.read()
+        except OSError:
+            return None
+        if hashlib.sha256(data).hexdigest() != checksum:
+            # Ødelagt chunk, hentes på nytt
+            os.remove(path)
+            return None
+        return data
+
+    def put(self, key: tuple, task_id: str, chunk_id: str, data: bytes):
+        task_directory = self._task_directory(key, task_id)
+        if not os.path.isdir(task_directory):
+            return
+        path = os.path.join(task_directory, _file_name(chunk_id))
+        _write_atomic(path, data)
+        _write_atomic(f"{path}.sha256", hashlib.sha256(data).hexdigest().encode())
+
+    def invalidate(self, key: tuple):
+        shutil.rmtree(self._key_directory(key), ignore_errors=True)
+        os.makedirs(self._key_directory(key), exist_ok=True)
+
+    def evict(self):
+        for name in os.listdir(self.directory):
+            key_directory = os.path.join(self.directory, name)
+            path = os.path.join(key_directory, "task.json")
+            try:
+                with open(path) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                # Uten task.json brukes alderen på mappen
+                try:
+                    manifest = {"created_at": os.path.getmtime(key_directory)}
+                except OSError:
+                    continue
+            if self._expired(manifest):
+                shutil.rmtree(key_directory, ignore_errors=True)
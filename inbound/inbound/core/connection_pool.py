@@ -0,0 +1,264 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable
+
+logger = logging.getLogger("inbound.core.connection_pool")
+
+
+def ping(connection, query: str = "select 1") -> bool:
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query)
+        cursor.fetchall()
+    finally:
+        cursor.close()
+    return True
+
+
+class ConnectionPool:
+    # Gjenbruker tilkoblinger på tvers av jobber i samme prosess. Tilkoblinger
+    # som har ligget ubrukt lenger enn max_idle_seconds lukkes, og en
+    # tilkobling som har ligget lenger enn health_check_interval sjekkes før
+    # den lånes ut.
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        max_size: int = 4,
+        max_idle_seconds: float = 300,
+        health_check: Callable[[Any], bool] = ping,
+        health_check_interval: float = 60,
+        acquire_timeout: float = None,
+    ):
+        self.connect = connect
+        self.max_size = max_size
+        self.max_idle_seconds = max_idle_seconds
+        self.health_check = health_check
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.condition = threading.Condition()
+        self.idle = []  # (connection, released_at), sist brukte til slutt
+        self.size = 0
+        self.closed = False
+
+    def acquire(self):
+        with self.condition:
+            self._evict_idle()
+            if not self.condition.wait_for(
+                lambda: self.closed or self.idle or self.size < self.max_size,
+                timeout=self.acquire_timeout,
+            ):
+                raise TimeoutError("Timed out waiting for a pooled connection")
+            if self.closed:
+                raise RuntimeError("Connection pool is closed")
+            if self.idle:
+                connection, released_at = self.idle.pop()
+            else:
+                connection, released_at = None, None
+                self.size = self.size + 1
+        if connection is not None:
+            if time.monotonic() - released_at < self.health_check_interval:
+                return connection
+            if self._is_healthy(connection):
+                return connection
+            self._discard(connection)
+            with self.condition:
+                self.size = self.size + 1
+        try:
+            return self.connect()
+        except BaseException:
+            with self.condition:
+                self.size = self.size - 1
+                self.condition.notify()
+            raise
+
+    def release(self, connection, discard: bool = False):
+        if discard or self.closed:
+            self._discard(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        except BaseException:
+            # Tilkoblingen kan være i en ukjent tilstand etter en feil
+            self.release(connection, discard=not self._is_healthy(connection))
+            raise
+        else:
+            self.release(connection)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.condition.notify_all()
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def _evict_idle(self):
+        expired_before = time.monotonic() - self.max_idle_seconds
+        expired = [item for item in self.idle if item[1] < expired_before]
+        self.idle = [item for item in self.idle if item[1] >= expired_before]
+        for connection, _ in expired:
+            self.size = self.size - 1
+            self._close(connection)
+
+    def _is_healthy(self, connection) -> bool:
+        if self.health_check is None:
+            return True
+        try:
+            return bool(self.health_check(connection))
+        except Exception as e:
+            logger.warning(f"Pooled connection failed health check: {e}")
+            return False
+
+    def _discard(self, connection):
+        with self.condition:
+            self.size = self.size - 1
+            self.condition.notify()
+        self._close(connection)
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception as e:
+            logger.warning(f"Could not close pooled connection: {e}")
+
+
+class OraclePool(ConnectionPool):
+    # Bruker poolen i python-oracledb, som selv har ping_interval og timeout
+    # for helsesjekk og lukking av ubrukte tilkoblinger.
+    def __init__(
+        self,
+        max_size: int = 4,
+        max_idle_seconds: float = 300,
+        health_check_interval: float = 60,
+        **connect_kwargs,
+    ):
+        import oracledb
+
+        self.pool = oracledb.create_pool(
+            min=0,
+            max=max_size,
+            increment=1,
+            timeout=int(max_idle_seconds),
+            ping_interval=int(health_check_interval),
+            getmode=oracledb.POOL_GETMODE_WAIT,
+            **connect_kwargs,
+        )
+
+    def acquire(self):
+        return self.pool.acquire()
+
+    def release(self, connection, discard: bool = False):
+        if discard:
+            self.pool.drop(connection)
+            return
+        self.pool.release(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self):
+        self.pool.close(force=True)
+
+
+def create_pyodbc_pool(connection_string: str, **pool_kwargs) -> ConnectionPool:
+    import pyodbc
+
+    return ConnectionPool(
+        connect=partial(pyodbc.connect, connection_string), **pool_kwargs
+    )
+
+
+def _snowflake_health_check(connection) -> bool:
+    return not connection.is_closed() and ping(connection)
+
+
+def create_snowflake_pool(pool_kwargs: dict = None, **connect_kwargs) -> ConnectionPool:
+    import snowflake.connector
+
+    return ConnectionPool(
+        connect=partial(snowflake.connector.connect, **connect_kwargs),
+        health_check=_snowflake_health_check,
+        **(pool_kwargs or {}),
+    )
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def get_pool(name: str, create: Callable[[], ConnectionPool]) -> ConnectionPool:
+    # Én pool per navn og prosess. Pooler arvet fra en forelder ved fork brukes
+    # ikke, siden tilkoblingene deres tilhører den andre prosessen.
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        if name not in _pools:
+            _pools[name] = create()
+        return _pools[name]
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+@contextmanager
+def borrow(connection):
+    # Lar taps, sinks og highwatermarks ta imot enten en tilkobling eller en pool
+    if isinstance(connection, ConnectionPool):
+        with connection.connection() as pooled_connection:
+            yield pooled_connection
+    else:
+        yield connection
+
+
+@contextmanager
+def borrow_cursor(connection, *args):
+    with borrow(connection) as borrowed_connection:
+        with borrowed_connection.cursor(*args) as cursor:
+            yield cursor
+
+
+@contextmanager
+def borrow_or_connect(connection, connection_factory: Callable[[], Any] = None):
+    # Parallelle lesere trenger hver sin tilkobling: en ny fra connection_factory
+    # som lukkes etterpå, ellers en lånt fra poolen
+    if connection_factory is None:
+        with borrow(connection) as borrowed_connection:
+            yield borrowed_connection
+        return
+    new_connection = connection_factory()
+    try:
+        yield new_connection
+    finally:
+        new_connection.close()
+
+
+def check_parallel_connections(connection, connection_factory, when: str):
+    if connection_factory is None and not isinstance(connection, ConnectionPool):
+        raise ValueError(
+            f"connection_factory or a connection pool is required when {when}"
+        )
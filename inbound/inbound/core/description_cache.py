@@ -0,0 +1,75 @@
+import dataclasses
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .models import Description
+
+
+class DescriptionCache:
+    # Kolonnebeskrivelser per (kilde, spørring), så gjentatte jobber i samme
+    # prosess slipper å spørre databasen. Oppføringer utløper etter ttl_seconds
+    # og kan fjernes med invalidate, f.eks. etter en skjemaendring.
+    def __init__(self, ttl_seconds: Optional[float] = 60 * 60, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(source: str, query: str) -> tuple[str, str]:
+        return source, hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+    def get(self, source: str, query: str) -> Optional[list[Description]]:
+        key = self.key(source, query)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            descriptions, stored_at = entry
+            if (
+                self.ttl_seconds is not None
+                and time.monotonic() - stored_at > self.ttl_seconds
+            ):
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        # Job utvider listen den får, så hver jobb får sine egne kopier
+        return [dataclasses.replace(description) for description in descriptions]
+
+    def put(self, source: str, query: str, descriptions: list[Description]):
+        descriptions = [
+            dataclasses.replace(description) for description in descriptions
+        ]
+        with self.lock:
+            self.entries[self.key(source, query)] = (descriptions, time.monotonic())
+            self.entries.move_to_end(self.key(source, query))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, source: str = None, query: str = None):
+        with self.lock:
+            if source is not None and query is not None:
+                self.entries.pop(self.key(source, query), None)
+                return
+            for key in list(self.entries):
+                if source is None or key[0] == source:
+                    del self.entries[key]
+
+
+description_cache = DescriptionCache()
+
+
+def description_from_cursor(cursor_description) -> list[Description]:
+    return [
+        Description(
+            name=col[0],
+            type=str(col[1]),
+            precision=col[4],
+            scale=col[5],
+            nullable=col[6],
+        )
+        for col in cursor_description
+    ]
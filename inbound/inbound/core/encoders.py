@@ -0,0 +1,55 @@
+import datetime
+import json
+import logging
+from decimal import Decimal
+
+logger = logging.getLogger("inbound.core.encoders")
+
+_NATIVE_TYPES = (str, int, float, bool)
+
+
+def to_json_value(value):
+    if value is None or isinstance(value, _NATIVE_TYPES):
+        return value
+    # Samme tekstformat som json.dumps(..., default=str) ga tidligere
+    if isinstance(value, (datetime.date, datetime.time, Decimal)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    if hasattr(value, "read"):
+        # LOB fra oracledb
+        return to_json_value(value.read())
+    return str(value)
+
+
+class RawEncoder:
+    def __init__(self, names: list[str], fast_json: bool = False):
+        self.names = tuple(names)
+        self.convert_columns = None
+        self._stdlib_dumps = json.JSONEncoder().encode
+        self._dumps = self._stdlib_dumps
+        if fast_json:
+            try:
+                import orjson
+
+                self._dumps = lambda obj: orjson.dumps(obj).decode("utf-8")
+            except ImportError:
+                logger.warning("orjson is not installed, falling back to json")
+
+    def encode(self, row: tuple) -> str:
+        if self.convert_columns is None:
+            # Kolonner som ikke er native JSON-typer i første rad konverteres
+            # for hver rad. Resten sendes rett til JSON-biblioteket.
+            self.convert_columns = tuple(
+                i
+                for i, value in enumerate(row)
+                if value is None or not isinstance(value, _NATIVE_TYPES)
+            )
+        values = list(row)
+        for i in self.convert_columns:
+            values[i] = to_json_value(values[i])
+        try:
+            return self._dumps(dict(zip(self.names, values)))
+        except (TypeError, OverflowError):
+            values = [to_json_value(value) for value in row]
+            return self._stdlib_dumps(dict(zip(self.names, values)))
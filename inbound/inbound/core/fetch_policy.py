@@ -0,0 +1,83 @@
+from .prefetch import estimate_batch_size
+
+# Overhead per verdi for et Python-objekt i en tuple
+VALUE_OVERHEAD_BYTES = 56
+
+
+class FetchPolicy:
+    # Bestemmer hvor mange rader som hentes per runde ut fra et minnebudsjett.
+    # Første anslag lages fra cursor.description, og justeres deretter mot
+    # målt størrelse på batchene som faktisk blir hentet.
+    def __init__(
+        self,
+        target_bytes: int = 1024 * 1024 * 64,  # 64MB
+        min_rows: int = 100,
+        max_rows: int = 100000,
+        initial_rows: int = 10000,
+        unknown_column_bytes: int = 4000,
+        smoothing: float = 0.5,
+    ):
+        self.target_bytes = target_bytes
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.unknown_column_bytes = unknown_column_bytes
+        self.smoothing = smoothing
+        self.row_bytes = None
+        self.rows = self._clamp(initial_rows)
+
+    def _clamp(self, rows: int) -> int:
+        return max(self.min_rows, min(self.max_rows, int(rows)))
+
+    def _column_bytes(self, column: tuple) -> int:
+        # DB-API: (name, type_code, display_size, internal_size, precision, scale, null_ok)
+        internal_size = column[3] if len(column) > 3 else None
+        display_size = column[2] if len(column) > 2 else None
+        for size in (internal_size, display_size):
+            if size is not None and 0 < size <= self.unknown_column_bytes:
+                return size + VALUE_OVERHEAD_BYTES
+        # LOB-er og kolonner uten oppgitt størrelse
+        return self.unknown_column_bytes + VALUE_OVERHEAD_BYTES
+
+    def estimate(self, description: list[tuple]) -> int:
+        if self.row_bytes is None and description:
+            self.row_bytes = sum(self._column_bytes(column) for column in description)
+            self.rows = self._clamp(self.target_bytes / self.row_bytes)
+        return self.rows
+
+    def observe(self, data) -> int:
+        if len(data) == 0:
+            return self.rows
+        observed = estimate_batch_size(data) / len(data)
+        if self.row_bytes is None:
+            self.row_bytes = observed
+        else:
+            self.row_bytes = (
+                self.smoothing * observed + (1 - self.smoothing) * self.row_bytes
+            )
+        self.rows = self._clamp(self.target_bytes / max(self.row_bytes, 1))
+        return self.rows
+
+    def apply(self, cursor):
+        # prefetchrows finnes bare i python-oracledb, pyodbc har bare arraysize
+        cursor.arraysize = self.rows
+        if hasattr(cursor, "prefetchrows"):
+            cursor.prefetchrows = self.rows
+
+
+def execute(cursor, query: str, parameters=None):
+    if parameters is None:
+        return cursor.execute(query)
+    return cursor.execute(query, parameters)
+
+
+def fetch_batches(cursor, query: str, policy: FetchPolicy, parameters=None):
+    policy.apply(cursor)
+    execute(cursor, query, parameters)
+    policy.estimate(cursor.description)
+    while True:
+        policy.apply(cursor)
+        data = cursor.fetchmany(policy.rows)
+        if len(data) == 0:
+            break
+        policy.observe(data)
+        yield data
@@ -0,0 +1,93 @@
+import datetime
+from typing import Any, Optional
+
+
+def _default_step(value) -> Optional[Any]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return 1
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return datetime.timedelta(days=1)
+    return None
+
+
+class CoalescingPlanner:
+    # Slår sammen highwatermarks som ligger inntil hverandre (f.eks. én per
+    # dag) til intervaller, så tappen kjører noen få store spørringer i stedet
+    # for mange små. Resultatet har {key}_from, {key}_to og {key}_values, og
+    # malen må bruke dem, f.eks.
+    #   where dato between {{ highwatermark['dato_from'] }}
+    #   and {{ highwatermark['dato_to'] }}
+    # Highwatermarks med ulike verdier i de andre feltene slås aldri sammen.
+    def __init__(
+        self,
+        key: str,
+        step: Any = None,
+        max_values: int = None,
+        max_rows: int = None,
+        rows_key: str = None,
+        allow_gaps: bool = False,
+    ):
+        if max_rows is not None and rows_key is None:
+            raise ValueError("rows_key is required when max_rows is set")
+        self.key = key
+        self.step = step
+        self.max_values = max_values
+        self.max_rows = max_rows
+        self.rows_key = rows_key
+        self.allow_gaps = allow_gaps
+
+    def plan(self, highwatermarks: list[dict]) -> list[dict]:
+        groups = {}
+        for highwatermark in highwatermarks:
+            rest = tuple(
+                sorted(
+                    (name, value)
+                    for name, value in highwatermark.items()
+                    if name not in (self.key, self.rows_key)
+                )
+            )
+            groups.setdefault(rest, []).append(highwatermark)
+
+        planned = []
+        for rest, group in groups.items():
+            group = sorted(group, key=lambda highwatermark: highwatermark[self.key])
+            for values, rows in self._ranges(group):
+                range_highwatermark = dict(rest)
+                range_highwatermark[f"{self.key}_from"] = values[0]
+                range_highwatermark[f"{self.key}_to"] = values[-1]
+                range_highwatermark[f"{self.key}_values"] = values
+                if self.rows_key is not None:
+                    range_highwatermark[self.rows_key] = rows
+                planned.append(range_highwatermark)
+        return planned
+
+    def _ranges(self, highwatermarks: list[dict]):
+        values = []
+        rows = 0
+        for highwatermark in highwatermarks:
+            value = highwatermark[self.key]
+            value_rows = 0
+            if self.rows_key is not None:
+                value_rows = highwatermark.get(self.rows_key) or 0
+            if values and not self._fits(values, rows, value, value_rows):
+                yield values, rows
+                values = []
+                rows = 0
+            values.append(value)
+            rows = rows + value_rows
+        if values:
+            yield values, rows
+
+    def _fits(self, values: list, rows: int, value, value_rows: int) -> bool:
+        if self.max_values is not None and len(values) >= self.max_values:
+            return False
+        if self.max_rows is not None and rows + value_rows > self.max_rows:
+            return False
+        if self.allow_gaps:
+            return True
+        step = self.step if self.step is not None else _default_step(value)
+        if step is None:
+            return False
+        return value - values[-1] <= step
@@ -0,0 +1,186 @@
+import datetime
+import json
+from abc import ABC, abstractmethod
+from decimal import Decimal
+from typing import Any, Generator, Optional
+
+from .arrow import is_arrow_batch, to_arrow_table
+from .connection_pool import borrow_cursor
+from .models import Description
+from .sqlite import ThreadLocalSqlite
+
+
+def encode_highwatermark(values: dict) -> str:
+    # Typen lagres sammen med verdien så datoer og desimaltall kommer tilbake
+    # som samme type neste gang malen rendres
+    encoded = {}
+    for name, value in values.items():
+        if isinstance(value, datetime.datetime):
+            encoded[name] = {"type": "datetime", "value": value.isoformat()}
+        elif isinstance(value, datetime.date):
+            encoded[name] = {"type": "date", "value": value.isoformat()}
+        elif isinstance(value, Decimal):
+            encoded[name] = {"type": "decimal", "value": str(value)}
+        else:
+            encoded[name] = {"type": "json", "value": value}
+    return json.dumps(encoded)
+
+
+def decode_highwatermark(text: str) -> dict:
+    decoders = {
+        "datetime": datetime.datetime.fromisoformat,
+        "date": datetime.date.fromisoformat,
+        "decimal": Decimal,
+        "json": lambda value: value,
+    }
+    return {
+        name: decoders[encoded["type"]](encoded["value"])
+        for name, encoded in json.loads(text).items()
+    }
+
+
+class HighwatermarkStore(ABC):
+    @abstractmethod
+    def get(self, job_name: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def set(self, job_name: str, values: dict):
+        pass
+
+
+class SqliteHighwatermarkStore(ThreadLocalSqlite, HighwatermarkStore):
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("""
+                create table if not exists highwatermark (
+                    job_name text primary key,
+                    highwatermark text not null,
+                    updated_at text not null
+                )
+                """)
+
+    def get(self, job_name: str) -> Optional[dict]:
+        row = (
+            self._connect()
+            .execute(
+                "select highwatermark from highwatermark where job_name = ?",
+                (job_name,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return decode_highwatermark(row[0])
+
+    def set(self, job_name: str, values: dict):
+        with self._connect() as connection:
+            connection.execute(
+                "insert or replace into highwatermark values (?, ?, ?)",
+                (
+                    job_name,
+                    encode_highwatermark(values),
+                    datetime.datetime.now().isoformat(),
+                ),
+            )
+
+
+class SnowHighwatermarkStore(HighwatermarkStore):
+    # Tar imot en tilkobling eller en pool, som SnowHandler
+    def __init__(self, connection, table: str):
+        self.connection = connection
+        self.table = table
+        with borrow_cursor(self.connection) as cur:
+            cur.execute(f"""
+                create table if not exists {self.table} (
+                    job_name varchar primary key,
+                    highwatermark varchar not null,
+                    updated_at timestamp_ntz not null
+                )
+                """)
+
+    def get(self, job_name: str) -> Optional[dict]:
+        with borrow_cursor(self.connection) as cur:
+            cur.execute(
+                f"select highwatermark from {self.table} where job_name = %s",
+                (job_name,),
+            )
+            row = cur.fetchone()
+        if row is None:
+            return None
+        return decode_highwatermark(row[0])
+
+    def set(self, job_name: str, values: dict):
+        with borrow_cursor(self.connection) as cur:
+            cur.execute(
+                f"""
+                merge into {self.table} t
+                using (select %s as job_name, %s as highwatermark) s
+                on t.job_name = s.job_name
+                when matched then update set
+                    highwatermark = s.highwatermark,
+                    updated_at = current_timestamp()
+                when not matched then insert (job_name, highwatermark, updated_at)
+                    values (s.job_name, s.highwatermark, current_timestamp())
+                """,
+                (job_name, encode_highwatermark(values)),
+            )
+
+
+def _max(values: list) -> Any:
+    values = [value for value in values if value is not None]
+    if len(values) == 0:
+        return None
+    return max(values)
+
+
+class HighwatermarkTracker:
+    # Finner max av cursor-kolonnene mens batchene strømmer forbi, og lagrer
+    # resultatet først når lastingen er ferdig (commit), så en feilet jobb
+    # ikke flytter highwatermarken.
+    def __init__(self, store: HighwatermarkStore, job_name: str, columns: list[str]):
+        self.store = store
+        self.job_name = job_name
+        self.columns = columns
+        self.values = {}
+
+    def track(
+        self, data_generator, column_description: list[Description]
+    ) -> Generator[list[tuple], Any, None]:
+        names = [col.name for col in column_description]
+        missing = [column for column in self.columns if column not in names]
+        if missing:
+            raise ValueError(f"Highwatermark columns not found in tap: {missing}")
+        indexes = {column: names.index(column) for column in self.columns}
+        self.values = {}
+        for data in data_generator:
+            if is_arrow_batch(data):
+                import pyarrow.compute as pc
+
+                table = to_arrow_table(data)
+                batch_max = {
+                    column: pc.max(table.column(index)).as_py()
+                    for column, index in indexes.items()
+                }
+            else:
+                batch_max = {
+                    column: _max([row[index] for row in data])
+                    for column, index in indexes.items()
+                }
+            for column, value in batch_max.items():
+                self.values[column] = _max([self.values.get(column), value])
+            yield data
+
+    def commit(self) -> Optional[dict]:
+        previous = self.store.get(self.job_name) or {}
+        values = {
+            column: _max([previous.get(column), self.values.get(column)])
+            for column in self.columns
+        }
+        values = {
+            column: value for column, value in values.items() if value is not None
+        }
+        if values and values != previous:
+            self.store.set(self.job_name, values)
+        return values or None
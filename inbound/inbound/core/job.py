@@ -1,11 +1,14 @@
 import dataclasses
-import json
 from datetime import datetime
 
 from ..sdk.mapper import Mapper
 from ..sdk.sink import Sink
 from ..sdk.tap import Tap
+from .arrow import arrow_to_rows, is_arrow_batch, with_constant_columns
+from .encoders import RawEncoder
+from .highwatermark_store import HighwatermarkTracker
 from .models import Description, Metadata
+from .prefetch import prefetch
 
 
 class Job:
@@ -16,28 +19,57 @@ class Job:
         description_mapper: Mapper = None,
         metadata: Metadata = None,
         raw: bool = False,
+        prefetch_batches: int = 0,
+        prefetch_max_bytes: int = 1024 * 1024 * 256,  # 256MB
+        raw_only: bool = False,
+        fast_json: bool = False,
+        highwatermark_tracker: HighwatermarkTracker = None,
     ) -> None:
         self.tap = tap
         self.sink = sink
         self.mapper = description_mapper
         self.metadata = metadata
         self.raw = raw
+        self.prefetch_batches = prefetch_batches
+        self.prefetch_max_bytes = prefetch_max_bytes
+        self.raw_only = raw_only
+        self.fast_json = fast_json
+        self.highwatermark_tracker = highwatermark_tracker
 
     def metadata_generator(
         self, data_generator, column_description: list[Description] = None
     ):
+        # astuple gjør en rekursiv deepcopy, så metadata beregnes én gang per jobb
+        metadata = dataclasses.astuple(self.metadata)
         if column_description is None:
+            metadata_names = [col.name for col in self.metadata.get_description()]
             for data in data_generator:
-                yield [tuple(row) + dataclasses.astuple(self.metadata) for row in data]
+                if is_arrow_batch(data):
+                    # Arrow-batcher får metadata som konstante kolonner
+                    yield with_constant_columns(data, metadata_names, metadata)
+                    continue
+                yield [tuple(row) + metadata for row in data]
+        elif self.raw_only:
+            encode = self._raw_encoder(column_description).encode
+            for data in self._rows(data_generator):
+                yield [(encode(row),) + metadata for row in data]
         else:
-            desc = tuple(row.name for row in column_description)
-            for data in data_generator:
-                yield [
-                    row
-                    + (json.dumps(dict(zip(desc, row)), default=str),)
-                    + dataclasses.astuple(self.metadata)
-                    for row in data
-                ]
+            encode = self._raw_encoder(column_description).encode
+            for data in self._rows(data_generator):
+                yield [tuple(row) + (encode(row),) + metadata for row in data]
+
+    @staticmethod
+    def _rows(data_generator):
+        # Raw-kolonnen lages per rad, så Arrow-batcher gjøres om til tupler her
+        for data in data_generator:
+            if is_arrow_batch(data):
+                data = arrow_to_rows(data)
+            yield data
+
+    def _raw_encoder(self, column_description: list[Description]) -> RawEncoder:
+        return RawEncoder(
+            names=[col.name for col in column_description], fast_json=self.fast_json
+        )
 
     def run(self):
         run_start = datetime.now()
@@ -45,8 +77,21 @@ class Job:
             run_start = self.metadata.load_time
 
         tap_data_generator = self.tap.data_generator()
+        if self.prefetch_batches > 0:
+            # Henter batcher fra kilden i en egen tråd mens sinken skriver
+            tap_data_generator = prefetch(
+                tap_data_generator,
+                max_batches=self.prefetch_batches,
+                max_bytes=self.prefetch_max_bytes,
+            )
+        prefetched_data_generator = tap_data_generator
         tap_desc = self.tap.column_descriptions()
 
+        if self.highwatermark_tracker is not None:
+            tap_data_generator = self.highwatermark_tracker.track(
+                tap_data_generator, column_description=tap_desc
+            )
+
         sink_desc = tap_desc
         if self.mapper is not None:
             sink_desc = [self.mapper.map(desc) for desc in tap_desc]
@@ -56,24 +101,34 @@ class Job:
             tap_data_generator = self.metadata_generator(tap_data_generator)
 
         if self.raw:
-            sink_desc.append(
-                Description(
-                    name="_inbound__raw",
-                    type="variant",
-                    precision=None,
-                    scale=None,
-                    nullable=False,
-                )
+            tap_data_generator = self.metadata_generator(
+                tap_data_generator, column_description=list(sink_desc)
+            )
+            raw_desc = Description(
+                name="_inbound__raw",
+                type="variant",
+                precision=None,
+                scale=None,
+                nullable=False,
             )
+            if self.raw_only:
+                sink_desc = [raw_desc]
+            else:
+                sink_desc.append(raw_desc)
             sink_desc.extend(self.metadata.get_description())
-            tap_data_generator = self.metadata_generator(
-                tap_data_generator, column_description=sink_desc
+
+        try:
+            batch_results = self.sink.ingest(
+                data_generator=tap_data_generator, column_description=sink_desc
             )
+        finally:
+            prefetched_data_generator.close()
 
+        highwatermark = None
+        if self.highwatermark_tracker is not None:
+            highwatermark = self.highwatermark_tracker.commit()
 
-        batch_results = self.sink.ingest(
-            data_generator=tap_data_generator, column_description=sink_desc
-        )
+        self.tap.on_success()
 
         return {
             "tap": self.tap.__class__.__name__,
@@ -82,4 +137,6 @@ class Job:
             "stop": datetime.now(),
             "columns": [col.name for col in sink_desc],
             "batches": batch_results,
+            "tap_result": self.tap.run_result(),
+            "highwatermark": highwatermark,
         }
@@ -1,19 +1,36 @@
+import importlib
+import logging
+import queue
+import resource
+import sys
 import uuid
 from dataclasses import dataclass
 from datetime import datetime
-from multiprocessing import Manager, Process, Queue
+from multiprocessing import Manager, Pipe, Process, Queue
+from multiprocessing.connection import Connection, wait
 from typing import Callable, Optional, Type
 
+from .job_status_store import JobStatusStore, ManagerJobStatusStore
+from .models import JobStatus
 from .secrets import *
 
+job_management_logger = logging.getLogger("inbound.core.job_management")
 
-@dataclass
-class JobStatus:
-    job_id: str
-    status: str
-    created_at: datetime
-    updated_at: datetime
-    job_result: Optional[dict] = None
+DEFAULT_PRELOAD_MODULES = ("oracledb", "snowflake.connector", "pyodbc", "requests")
+
+# Jobben som kjører i denne prosessen, så taps kan rapportere fremdrift
+_current_job: Optional[tuple[JobStatusStore, str]] = None
+
+
+def report_progress(progress: float):
+    # Gjør ingenting når koden ikke kjører som en jobb under JobClerk
+    if _current_job is None:
+        return
+    job_statuses, job_id = _current_job
+    try:
+        job_statuses.update(job_id, progress=progress)
+    except Exception as e:
+        job_management_logger.warning(f"Could not report progress for {job_id}: {e}")
 
 
 @dataclass
@@ -21,60 +38,223 @@ class Job:
     id: str
     job: Callable[[], Optional[dict]]
 
-    def run(self, job_statuses: dict[str, JobStatus]):
-        set_env_variables_from_secrets()
+    def run(self, job_statuses: JobStatusStore, load_secrets: bool = True):
+        global _current_job
+        if load_secrets:
+            set_env_variables_from_secrets()
+        _current_job = (job_statuses, self.id)
         try:
             job_result = self.job()
             status = "done"
         except Exception as e:
             job_result = {"error_message": str(e)}
             status = "error"
-        job_status = job_statuses.get(self.id)
-        job_status.job_result = job_result
-        job_status.status = status
-        job_status.updated_at = datetime.now()
-        job_statuses[self.id] = job_status
+        finally:
+            _current_job = None
+        job_statuses.update(self.id, status=status, job_result=job_result)
 
 
 class WorkerManager(Process):
-    def __init__(self, job_queue: Queue, job_statuses: dict[str, JobStatus]):
+    def __init__(
+        self,
+        job_queue: Queue,
+        job_statuses: JobStatusStore,
+        max_workers: int = 1,
+        poll_interval: float = 1.0,
+    ):
         super(WorkerManager, self).__init__()
         self.job_queue = job_queue
         self.job_statuses = job_statuses
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
 
     def run(self):
+        workers: dict[Process, Job] = {}
         while True:
-            worker, job = self._assign_work()
-            self._wait_for_worker_to_finnish(worker, job)
+            self._reap_finished_workers(workers)
+            if len(workers) >= self.max_workers:
+                wait([worker.sentinel for worker in workers])
+                continue
+            # Med jobber i gang venter vi bare kort på køen, slik at ferdige
+            # arbeidere plukkes opp selv om det ikke kommer nye jobber
+            timeout = self.poll_interval if workers else None
+            try:
+                worker, job = self._assign_work(timeout=timeout)
+            except queue.Empty:
+                continue
+            workers[worker] = job
 
-    def _assign_work(self):
-        job: Job = self.job_queue.get()
+    def _assign_work(self, timeout: float = None):
+        job: Job = self.job_queue.get(timeout=timeout)
         worker_process = Process(
             target=job.run, kwargs=dict(job_statuses=self.job_statuses)
         )
-        worker_process.start()
+        # Settes før start slik at en rask jobb ikke får "done" overskrevet
         self._update_job_status(job, "running")
+        worker_process.start()
         return worker_process, job
 
+    def _reap_finished_workers(self, workers: dict[Process, Job]):
+        for worker in [worker for worker in workers if not worker.is_alive()]:
+            self._wait_for_worker_to_finnish(worker, workers.pop(worker))
+
     def _wait_for_worker_to_finnish(self, worker: Process, job: Job):
         worker.join()
         if worker.exitcode != 0:
             self._update_job_status(job, "error")
 
     def _update_job_status(self, job: Job, new_status: str):
-        job_status = self.job_statuses.get(job.id)
-        job_status.status = new_status
-        job_status.updated_at = datetime.now()
-        self.job_statuses[job.id] = job_status
+        self.job_statuses.update(job.id, status=new_status)
+
+
+def _peak_memory_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024  # bytes på macOS
+    return peak / 1024  # kilobytes på linux
+
+
+def _run_warm_worker(
+    connection: Connection,
+    manager_connection: Connection,
+    job_statuses: dict[str, JobStatus],
+    preload_modules: tuple[str],
+    max_jobs: int,
+    max_memory_mb: Optional[float],
+):
+    # Ved fork arves også managerens ende av pipen. Den må lukkes for at
+    # recv() skal få EOF når manageren avsluttes.
+    manager_connection.close()
+    for module in preload_modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            job_management_logger.info(f"could not preload {module}")
+    set_env_variables_from_secrets()
+
+    jobs_done = 0
+    while True:
+        try:
+            job: Job = connection.recv()
+        except EOFError:
+            return
+        job.run(job_statuses=job_statuses, load_secrets=False)
+        jobs_done = jobs_done + 1
+        recycle = jobs_done >= max_jobs or (
+            max_memory_mb is not None and _peak_memory_mb() > max_memory_mb
+        )
+        connection.send(recycle)
+        if recycle:
+            return
+
+
+@dataclass
+class WarmWorker:
+    process: Process
+    connection: Connection
+    job: Optional[Job] = None
+
+
+class WarmWorkerManager(WorkerManager):
+    # Holder arbeidsprosessene i live mellom jobber, med tunge moduler
+    # allerede importert. En prosess som krasjer gir feilstatus på jobben den
+    # kjørte og erstattes, som når hver jobb har sin egen prosess.
+    def __init__(
+        self,
+        job_queue: Queue,
+        job_statuses: JobStatusStore,
+        max_workers: int = 1,
+        poll_interval: float = 1.0,
+        preload_modules: tuple[str] = DEFAULT_PRELOAD_MODULES,
+        max_jobs_per_worker: int = 100,
+        max_memory_mb: Optional[float] = None,
+    ):
+        super(WarmWorkerManager, self).__init__(
+            job_queue=job_queue,
+            job_statuses=job_statuses,
+            max_workers=max_workers,
+            poll_interval=poll_interval,
+        )
+        self.preload_modules = preload_modules
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_memory_mb = max_memory_mb
+
+    def run(self):
+        workers: list[WarmWorker] = []
+        while True:
+            workers = [worker for worker in workers if self._check_worker(worker)]
+            while len(workers) < self.max_workers:
+                workers.append(self._start_warm_worker())
+
+            idle_workers = [worker for worker in workers if worker.job is None]
+            if len(idle_workers) == 0:
+                wait(
+                    [worker.connection for worker in workers]
+                    + [worker.process.sentinel for worker in workers]
+                )
+                continue
+
+            timeout = self.poll_interval if len(idle_workers) < len(workers) else None
+            try:
+                job: Job = self.job_queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            self._update_job_status(job, "running")
+            idle_workers[0].job = job
+            idle_workers[0].connection.send(job)
+
+    def _start_warm_worker(self) -> WarmWorker:
+        parent_connection, child_connection = Pipe()
+        process = Process(
+            target=_run_warm_worker,
+            kwargs=dict(
+                connection=child_connection,
+                manager_connection=parent_connection,
+                job_statuses=self.job_statuses,
+                preload_modules=self.preload_modules,
+                max_jobs=self.max_jobs_per_worker,
+                max_memory_mb=self.max_memory_mb,
+            ),
+        )
+        process.start()
+        child_connection.close()
+        return WarmWorker(process=process, connection=parent_connection)
+
+    def _check_worker(self, worker: WarmWorker) -> bool:
+        if worker.job is None:
+            return worker.process.is_alive()
+        if not worker.connection.poll():
+            return True
+        try:
+            recycle = worker.connection.recv()
+        except EOFError:
+            # Prosessen døde midt i jobben
+            worker.process.join()
+            self._update_job_status(worker.job, "error")
+            return False
+        worker.job = None
+        if recycle:
+            worker.process.join()
+            return False
+        return True
 
 
 class JobClerk:
-    def __init__(self, worker_manager: Type[WorkerManager] = WorkerManager):
+    def __init__(
+        self,
+        worker_manager: Type[WorkerManager] = WorkerManager,
+        max_workers: int = 1,
+        status_store: JobStatusStore = None,
+    ):
         self.job_manager = Manager()
         self.job_queue = self.job_manager.Queue()
-        self.job_statuses = self.job_manager.dict()
+        if status_store is None:
+            status_store = ManagerJobStatusStore(manager=self.job_manager)
+        self.job_statuses = status_store
         self.worker_manager_process = worker_manager(
-            job_queue=self.job_queue, job_statuses=self.job_statuses
+            job_queue=self.job_queue,
+            job_statuses=self.job_statuses,
+            max_workers=max_workers,
         )
         self.worker_manager_process.start()
 
@@ -91,7 +271,7 @@ class JobClerk:
             updated_at=created_at,
         )
         task = Job(id=job_id, job=job)
-        self.job_statuses[job_id] = job_status
+        self.job_statuses.add(job_status)
         self.job_queue.put(task)
         return job_status
 
@@ -99,5 +279,8 @@ class JobClerk:
         status = self.job_statuses.get(job_id)
         return status
 
+    def get_job_statuses(self, status: str) -> list[JobStatus]:
+        return self.job_statuses.list_by_status(status)
+
     def id_generator(self) -> str:
         return str(uuid.uuid1())
@@ -0,0 +1,193 @@
+import pickle
+from abc import ABC, abstractmethod
+from dataclasses import replace
+from datetime import datetime, timedelta
+from multiprocessing.managers import SyncManager
+from typing import Optional
+
+from .models import JobStatus
+from .sqlite import ThreadLocalSqlite
+
+FINISHED_STATUSES = ("done", "error")
+
+
+class JobStatusStore(ABC):
+    @abstractmethod
+    def add(self, job_status: JobStatus):
+        pass
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[JobStatus]:
+        pass
+
+    @abstractmethod
+    def update(self, job_id: str, **fields):
+        pass
+
+    @abstractmethod
+    def list_by_status(self, status: str) -> list[JobStatus]:
+        pass
+
+    @abstractmethod
+    def evict_finished(self) -> int:
+        pass
+
+
+class ManagerJobStatusStore(JobStatusStore):
+    # Lagrer statusene i en Manager().dict(), slik JobClerk alltid har gjort.
+    # Oppdateringer skjer under en delt lås så de ikke overskriver hverandre.
+    def __init__(self, manager: SyncManager, ttl_seconds: Optional[float] = None):
+        self.job_statuses = manager.dict()
+        self.lock = manager.Lock()
+        self.ttl_seconds = ttl_seconds
+
+    def add(self, job_status: JobStatus):
+        self.evict_finished()
+        self.job_statuses[job_status.job_id] = job_status
+
+    def get(self, job_id: str) -> Optional[JobStatus]:
+        return self.job_statuses.get(job_id)
+
+    def update(self, job_id: str, **fields):
+        with self.lock:
+            job_status = self.job_statuses.get(job_id)
+            fields.setdefault("updated_at", datetime.now())
+            self.job_statuses[job_id] = replace(job_status, **fields)
+
+    def list_by_status(self, status: str) -> list[JobStatus]:
+        return [
+            job_status
+            for job_status in self.job_statuses.values()
+            if job_status.status == status
+        ]
+
+    def evict_finished(self) -> int:
+        if self.ttl_seconds is None:
+            return 0
+        expired_before = datetime.now() - timedelta(seconds=self.ttl_seconds)
+        with self.lock:
+            expired = [
+                job_status.job_id
+                for job_status in self.job_statuses.values()
+                if job_status.status in FINISHED_STATUSES
+                and job_status.updated_at < expired_before
+            ]
+            for job_id in expired:
+                del self.job_statuses[job_id]
+        return len(expired)
+
+
+class SqliteJobStatusStore(ThreadLocalSqlite, JobStatusStore):
+    # Hver prosess åpner sin egen tilkobling. WAL gjør at lesere ikke blokkerer
+    # skrivere, og hver oppdatering er én atomisk UPDATE.
+    _columns = (
+        "job_id",
+        "status",
+        "created_at",
+        "updated_at",
+        "job_result",
+        "progress",
+    )
+
+    def __init__(self, path: str, ttl_seconds: Optional[float] = 60 * 60 * 24):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        with self._connect() as connection:
+            connection.execute("""
+                create table if not exists job_status (
+                    job_id text primary key,
+                    status text not null,
+                    created_at text not null,
+                    updated_at text not null,
+                    job_result blob,
+                    progress real
+                )
+                """)
+            columns = [
+                row[1] for row in connection.execute("pragma table_info(job_status)")
+            ]
+            if "progress" not in columns:
+                # Databaser laget før progress ble lagt til
+                connection.execute("alter table job_status add column progress real")
+            connection.execute(
+                "create index if not exists job_status_status on job_status (status)"
+            )
+            connection.execute(
+                "create index if not exists job_status_updated_at "
+                "on job_status (updated_at)"
+            )
+
+    def add(self, job_status: JobStatus):
+        self.evict_finished()
+        with self._connect() as connection:
+            connection.execute(
+                "insert or replace into job_status values (?, ?, ?, ?, ?, ?)",
+                (
+                    job_status.job_id,
+                    job_status.status,
+                    job_status.created_at.isoformat(),
+                    job_status.updated_at.isoformat(),
+                    pickle.dumps(job_status.job_result),
+                    job_status.progress,
+                ),
+            )
+
+    def get(self, job_id: str) -> Optional[JobStatus]:
+        row = (
+            self._connect()
+            .execute("select * from job_status where job_id = ?", (job_id,))
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return self._to_job_status(row)
+
+    def update(self, job_id: str, **fields):
+        fields.setdefault("updated_at", datetime.now())
+        assignments = []
+        values = []
+        for name, value in fields.items():
+            if name not in self._columns or name == "job_id":
+                raise ValueError(f"Unknown job status field: {name}")
+            if name == "job_result":
+                value = pickle.dumps(value)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            assignments.append(f"{name} = ?")
+            values.append(value)
+        with self._connect() as connection:
+            connection.execute(
+                f"update job_status set {', '.join(assignments)} where job_id = ?",
+                (*values, job_id),
+            )
+
+    def list_by_status(self, status: str) -> list[JobStatus]:
+        rows = (
+            self._connect()
+            .execute("select * from job_status where status = ?", (status,))
+            .fetchall()
+        )
+        return [self._to_job_status(row) for row in rows]
+
+    def evict_finished(self) -> int:
+        if self.ttl_seconds is None:
+            return 0
+        expired_before = datetime.now() - timedelta(seconds=self.ttl_seconds)
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "delete from job_status where status in (?, ?) and updated_at < ?",
+                (*FINISHED_STATUSES, expired_before.isoformat()),
+            )
+            return cursor.rowcount
+
+    @staticmethod
+    def _to_job_status(row: tuple) -> JobStatus:
+        job_id, status, created_at, updated_at, job_result, progress = row
+        return JobStatus(
+            job_id=job_id,
+            status=status,
+            created_at=datetime.fromisoformat(created_at),
+            updated_at=datetime.fromisoformat(updated_at),
+            job_result=pickle.loads(job_result),
+            progress=progress,
+        )
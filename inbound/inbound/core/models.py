@@ -1,6 +1,7 @@
 import datetime
 from dataclasses import dataclass, field
 from importlib.metadata import version
+from typing import Optional
 
 
 @dataclass
@@ -12,6 +13,16 @@ class Description:
     nullable: bool
 
 
+@dataclass
+class JobStatus:
+    job_id: str
+    status: str
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
+    job_result: Optional[dict] = None
+    progress: Optional[float] = None
+
+
 @dataclass
 class Metadata:
     source_env: str
@@ -0,0 +1,137 @@
+import sys
+import threading
+from collections import deque
+from typing import Any, Generator
+
+from .arrow import is_arrow_batch
+
+_DONE = object()
+
+
+def estimate_batch_size(data: list[tuple]) -> int:
+    # Grovt anslag basert på første rad, godt nok til å begrense minnebruk
+    if is_arrow_batch(data):
+        return data.nbytes
+    if len(data) == 0:
+        return 0
+    row = data[0]
+    row_size = sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return row_size * len(data)
+
+
+class BatchBuffer:
+    def __init__(self, max_batches: int, max_bytes: int, producers: int = 1):
+        self.max_batches = max_batches
+        self.max_bytes = max_bytes
+        self.condition = threading.Condition()
+        self.batches = deque()
+        self.size_bytes = 0
+        self.producers = producers
+        self.closed = False
+        self.error = None
+
+    @property
+    def finished(self) -> bool:
+        return self.producers == 0 or self.error is not None
+
+    def put(self, batch: list[tuple]) -> bool:
+        size = estimate_batch_size(batch)
+        with self.condition:
+            # Slipper alltid inn én batch når bufferet er tomt, selv om den
+            # alene er større enn max_bytes
+            self.condition.wait_for(
+                lambda: self.closed
+                or self.error is not None
+                or len(self.batches) == 0
+                or (
+                    len(self.batches) < self.max_batches
+                    and self.size_bytes + size <= self.max_bytes
+                )
+            )
+            if self.closed or self.error is not None:
+                return False
+            self.batches.append((batch, size))
+            self.size_bytes = self.size_bytes + size
+            self.condition.notify_all()
+            return True
+
+    def get(self):
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.batches) > 0 or self.finished)
+            if len(self.batches) == 0:
+                if self.error is not None:
+                    raise self.error
+                return _DONE
+            batch, size = self.batches.popleft()
+            self.size_bytes = self.size_bytes - size
+            self.condition.notify_all()
+            return batch
+
+    def finish(self, error: BaseException = None):
+        with self.condition:
+            self.producers = self.producers - 1
+            if error is not None and self.error is None:
+                self.error = error
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.batches.clear()
+            self.size_bytes = 0
+            self.condition.notify_all()
+
+
+def _produce(data_generator: Generator[list[tuple], Any, None], buffer: BatchBuffer):
+    try:
+        for data in data_generator:
+            if not buffer.put(data):
+                break
+    except BaseException as e:
+        buffer.finish(error=e)
+    else:
+        buffer.finish()
+    finally:
+        data_generator.close()
+
+
+def interleave(
+    data_generators: list[Generator[list[tuple], Any, None]],
+    max_batches: int = 4,
+    max_bytes: int = 1024 * 1024 * 256,  # 256MB
+) -> Generator[list[tuple], Any, None]:
+    # Kjører hver generator i sin egen tråd og gir batchene videre i den
+    # rekkefølgen de blir klare. Feil i én generator stopper de andre, og
+    # feilen kastes når bufferet er tømt.
+    buffer = BatchBuffer(
+        max_batches=max_batches, max_bytes=max_bytes, producers=len(data_generators)
+    )
+    producers = [
+        threading.Thread(
+            target=_produce,
+            kwargs=dict(data_generator=data_generator, buffer=buffer),
+            name=f"inbound-prefetch-{i}",
+            daemon=True,
+        )
+        for i, data_generator in enumerate(data_generators)
+    ]
+    for producer in producers:
+        producer.start()
+    try:
+        while True:
+            data = buffer.get()
+            if data is _DONE:
+                return
+            yield data
+    finally:
+        buffer.close()
+        for producer in producers:
+            producer.join()
+
+
+def prefetch(
+    data_generator: Generator[list[tuple], Any, None],
+    max_batches: int = 4,
+    max_bytes: int = 1024 * 1024 * 256,  # 256MB
+) -> Generator[list[tuple], Any, None]:
+    return interleave([data_generator], max_batches=max_batches, max_bytes=max_bytes)
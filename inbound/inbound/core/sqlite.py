@@ -0,0 +1,34 @@
+import os
+import sqlite3
+import threading
+
+_local_lock = threading.Lock()
+
+
+class ThreadLocalSqlite:
+    # sqlite3-tilkoblinger kan bare brukes i tråden som lagde dem, så hver
+    # tråd (og prosess) får sin egen tilkobling til self.path. Tilkoblingene
+    # tas ikke med når objektet pickles til en annen prosess.
+    path: str
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_local", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def _thread_local(self) -> threading.local:
+        with _local_lock:
+            if "_local" not in self.__dict__:
+                self._local = threading.local()
+            return self._local
+
+    def _connect(self) -> sqlite3.Connection:
+        local = self._thread_local()
+        if getattr(local, "connection", None) is None or local.pid != os.getpid():
+            local.connection = sqlite3.connect(self.path, timeout=30)
+            local.connection.execute("pragma journal_mode=wal")
+            local.pid = os.getpid()
+        return local.connection
@@ -0,0 +1,17 @@
+from inbound.core.highwatermark_store import HighwatermarkStore
+from inbound.sdk.highwatermark import Highwatermark
+
+
+class StoredHighwatermark(Highwatermark):
+    # Leser highwatermarken som HighwatermarkTracker lagret forrige kjøring, i
+    # stedet for å spørre måltabellen. Første kjøring gir initial.
+    def __init__(self, store: HighwatermarkStore, job_name: str, initial: dict = {}):
+        self.store = store
+        self.job_name = job_name
+        self.initial = initial
+
+    def generate_query_list(self) -> list[dict]:
+        highwatermark = self.store.get(self.job_name)
+        if highwatermark is None:
+            return [dict(self.initial)]
+        return [highwatermark]
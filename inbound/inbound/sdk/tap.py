@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, Generator
+from typing import Any, Generator, Optional
 
 from ..core.models import Description
 
@@ -13,3 +13,11 @@ class Tap(ABC):
     @abstractmethod
     def data_generator(self) -> Generator[list[tuple], Any, None]:
         pass
+
+    def run_result(self) -> Optional[dict]:
+        # Ekstra resultat fra kilden som tas med i jobbresultatet
+        return None
+
+    def on_success(self):
+        # Kalles av Job når sinken har lastet alle dataene
+        pass
@@ -1,9 +1,61 @@
-from jinja2 import Environment
+import re
+from functools import lru_cache
+
+from jinja2 import Environment, Template
+
+BIND_PARAMSTYLES = ("named", "qmark")
+_BIND_NAME = re.compile(r"^[A-Za-z][A-Za-z0-9_]*$")
+
+_environment = Environment()
+
+
+@lru_cache(maxsize=256)
+def compile_template(source: str) -> Template:
+    # Kompilerte maler deles mellom kall. Template.render er trådsikker.
+    return _environment.from_string(source=source)
+
+
+def render_all(
+    template_source: str, values: list[dict], name: str = "highwatermark"
+) -> list[str]:
+    # Rendrer samme mal for mange verdier. Malen kompileres bare én gang.
+    render = compile_template(template_source).render
+    return [render({name: value}) for value in values]
 
 
 def get_query_list(query_template: str, highwatermarks: list[dict] = [{}]) -> list[str]:
-    jinja_template = Environment().from_string(source=query_template)
-    queries = []
+    return render_all(query_template, highwatermarks)
+
+
+def get_bind_query(query_template: str, paramstyle: str = "named") -> tuple[str, list]:
+    # Malen rendres én gang. {{ bind('navn') }} blir en plassholder (:navn for
+    # Oracle, ? for SQL Server), og navnene returneres i rekkefølgen de brukes.
+    if paramstyle not in BIND_PARAMSTYLES:
+        raise ValueError(f"paramstyle must be one of {BIND_PARAMSTYLES}")
+    names = []
+
+    def bind(name: str) -> str:
+        if not _BIND_NAME.match(name):
+            raise ValueError(f"Invalid bind parameter name: {name}")
+        names.append(name)
+        if paramstyle == "named":
+            return f":{name}"
+        return "?"
+
+    query = compile_template(query_template).render(bind=bind)
+    return query, names
+
+
+def get_bind_parameters(
+    names: list[str], highwatermarks: list[dict] = [{}], paramstyle: str = "named"
+) -> list:
+    parameters = []
     for highwatermark in highwatermarks:
-        queries.append(jinja_template.render(highwatermark=highwatermark))
-    return queries
+        missing = [name for name in names if name not in highwatermark]
+        if missing:
+            raise KeyError(f"Highwatermark is missing bind parameters: {missing}")
+        if paramstyle == "named":
+            parameters.append({name: highwatermark[name] for name in names})
+        else:
+            parameters.append(tuple(highwatermark[name] for name in names))
+    return parameters
@@ -1,5 +1,6 @@
 from typing import Any, Generator
 
+from ..core.arrow import arrow_to_rows, is_arrow_batch
 from ..core.models import Description
 from ..sdk.sink import Sink
 
@@ -16,4 +17,7 @@ class CsvSink(Sink):
         col_names = tuple(c.name for c in column_description)
         self.csv_writer.writerow(col_names)
         for data in data_generator:
+            # csv.writer går gjennom en Arrow-tabell kolonne for kolonne
+            if is_arrow_batch(data):
+                data = arrow_to_rows(data)
             self.csv_writer.writerows(data)
@@ -0,0 +1,127 @@
+from decimal import ROUND_HALF_UP, Context, Decimal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ..core.arrow import is_arrow_batch, to_arrow_table
+from ..core.models import Description
+
+
+def arrow_type(column: Description) -> pa.DataType:
+    column_type = (column.type or "").lower()
+    if column_type == "number":
+        if column.scale and column.scale > 0 and 0 < (column.precision or 0) <= 38:
+            # decimal(38,2) fra SQL Server kommer som Decimal og må ikke miste
+            # presisjon på veien
+            return pa.decimal128(column.precision, column.scale)
+        if column.scale:
+            # NUMBER uten presisjon eller med negativ skala fra Oracle
+            return pa.float64()
+        return pa.decimal128(min(column.precision or 38, 38), 0)
+    if column_type in ("float", "double"):
+        return pa.float64()
+    if column_type in ("datetime", "timestamp", "timestamp_ntz"):
+        return pa.timestamp("us")
+    if column_type == "date":
+        return pa.date32()
+    if column_type == "boolean":
+        return pa.bool_()
+    if column_type == "variant":
+        raise ValueError(
+            f"Column {column.name} is a variant, which can not be staged as parquet"
+        )
+    return pa.string()
+
+
+# Nok sifre til at quantize aldri feiler for decimal128
+_decimal_context = Context(prec=76, rounding=ROUND_HALF_UP)
+
+
+def _fallback_value(value, data_type: pa.DataType):
+    if value is None:
+        return None
+    if pa.types.is_string(data_type):
+        return str(value)
+    if pa.types.is_floating(data_type):
+        return float(value)
+    if pa.types.is_decimal(data_type):
+        if isinstance(value, float):
+            # Korteste desimalform, som i CSV, ikke den eksakte binærverdien
+            value = repr(value)
+        return Decimal(value).quantize(
+            Decimal(1).scaleb(-data_type.scale), context=_decimal_context
+        )
+    return value
+
+
+class ParquetWriter:
+    def __init__(
+        self,
+        file,
+        column_description: list[Description],
+        compression: str = "snappy",
+        row_group_rows: int = 100000,
+    ):
+        self.schema = pa.schema(
+            [pa.field(column.name, arrow_type(column)) for column in column_description]
+        )
+        self.row_group_rows = row_group_rows
+        self.rows = []
+        self.writer = pq.ParquetWriter(file, self.schema, compression=compression)
+
+    def writerows(self, data: list[tuple]):
+        if is_arrow_batch(data):
+            self.write_arrow(data)
+            return
+        self.rows.extend(data)
+        if len(self.rows) >= self.row_group_rows:
+            self.flush()
+
+    def flush(self):
+        if len(self.rows) == 0:
+            return
+        columns = list(zip(*self.rows))
+        arrays = [
+            self._to_array(values, field.type)
+            for values, field in zip(columns, self.schema)
+        ]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.rows = []
+
+    def write_arrow(self, data):
+        # Arrow-batcher skrives som egne row groups uten å gå via Python-objekter
+        self.flush()
+        table = to_arrow_table(data)
+        if table.num_rows == 0:
+            return
+        arrays = [
+            self._cast(column, field.type)
+            for column, field in zip(table.columns, self.schema)
+        ]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    @classmethod
+    def _cast(cls, column: pa.ChunkedArray, data_type: pa.DataType) -> pa.ChunkedArray:
+        # Arrow avrunder fra den binære float-verdien, så float til decimal
+        # går via Python for å runde likt med CSV
+        if not (pa.types.is_floating(column.type) and pa.types.is_decimal(data_type)):
+            try:
+                return column.cast(data_type)
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+                pass
+        return pa.chunked_array(
+            [cls._to_array(column.to_pylist(), data_type)], type=data_type
+        )
+
+    @staticmethod
+    def _to_array(values, data_type: pa.DataType) -> pa.Array:
+        try:
+            return pa.array(values, type=data_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return pa.array(
+                [_fallback_value(value, data_type) for value in values], type=data_type
+            )
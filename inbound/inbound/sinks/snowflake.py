@@ -1,92 +1,256 @@
 import csv
 import os
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import partial
 from pathlib import Path
-from typing import Any, Generator
+from typing import Any, Generator, Union
 import logging
 
-from jinja2 import Environment
 from snowflake.connector import DictCursor, SnowflakeConnection
 
+from ..core.arrow import arrow_to_csv, is_arrow_batch
+from ..core.connection_pool import ConnectionPool, borrow_cursor
 from ..core.models import Description
 from ..sdk.sink import Sink
+from ..sdk.utils import compile_template
 
 logger = logging.getLogger("inbound.sinks.snowflake")
 
+CSV_FILE_FORMAT = (
+    "(TYPE = 'CSV' FIELD_OPTIONALLY_ENCLOSED_BY = '\"' PARSE_HEADER = TRUE)"
+)
+PARQUET_FILE_FORMAT = "(TYPE = PARQUET USE_LOGICAL_TYPE = TRUE)"
+STAGING_FORMATS = ("csv", "parquet")
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def _staging_format(file_name: str, staging_format: str = None) -> str:
+    # Formatet sinken skrev bestemmer, filendelsen brukes bare når det ikke
+    # er oppgitt
+    if staging_format is not None:
+        return staging_format
+    if file_name.endswith(".parquet"):
+        return "parquet"
+    return "csv"
+
+
+def file_format_for(file_name: str, staging_format: str = None) -> str:
+    if _staging_format(file_name, staging_format) == "parquet":
+        return PARQUET_FILE_FORMAT
+    return CSV_FILE_FORMAT
+
+
+def put_options_for(file_name: str, staging_format: str = None) -> str:
+    if _staging_format(file_name, staging_format) == "parquet":
+        # Parquet er komprimert internt og skal ikke gzippes på nytt
+        return "AUTO_COMPRESS=FALSE"
+    if file_name.endswith(".gz"):
+        return "AUTO_COMPRESS=FALSE SOURCE_COMPRESSION=GZIP"
+    if file_name.endswith(".zst"):
+        return "AUTO_COMPRESS=FALSE SOURCE_COMPRESSION=ZSTD"
+    return "AUTO_COMPRESS=TRUE"
+
+
 class SnowHandler:
-    def __init__(self, connection: SnowflakeConnection) -> None:
+    def __init__(self, connection: Union[SnowflakeConnection, ConnectionPool]) -> None:
         self.connection = connection
 
     def create_table(self, ddl: str):
-        with self.connection.cursor() as cur:
+        with borrow_cursor(self.connection) as cur:
             print(f"Executing query: {ddl}")
             cur.execute(ddl)
 
-    def ingest_file_to_table(
+    def put_file(
         self,
         table: str,
         database: str,
         schema: str,
         file_path: str,
         file_name: str,
+        stage_path: str = None,
+        staging_format: str = None,
     ):
-        with self.connection.cursor() as cur:
+        if stage_path is None:
+            stage_path = file_name
+        with borrow_cursor(self.connection) as cur:
             put_query = f"""
                 PUT file://{file_path}/{file_name}
-                @{database}.{schema}.%{table}/{file_name}
-                AUTO_COMPRESS=TRUE OVERWRITE = TRUE
+                @{database}.{schema}.%{table}/{stage_path}
+                {put_options_for(file_name, staging_format)} OVERWRITE = TRUE
             """
+            logger.debug(f"Executing query: {put_query}")
+            cur.execute(put_query)
+
+    def copy_into_table(
+        self,
+        table: str,
+        database: str,
+        schema: str,
+        stage_path: str,
+        pattern: str = None,
+        file_format: str = CSV_FILE_FORMAT,
+    ):
+        pattern_option = ""
+        if pattern is not None:
+            pattern_option = f"PATTERN = '{pattern}'"
+        with borrow_cursor(self.connection) as cur:
             copy_into_query = f"""
                 COPY INTO {database}.{schema}.{table}
-                FROM @{database}.{schema}.%{table}/{file_name}
-                FILE_FORMAT = (TYPE = 'CSV' FIELD_OPTIONALLY_ENCLOSED_BY = '"' PARSE_HEADER = TRUE)
+                FROM @{database}.{schema}.%{table}/{stage_path}
+                {pattern_option}
+                FILE_FORMAT = {file_format}
                 MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE
             """
-            logger.debug(f"Executing query: {put_query}")
             logger.debug(f"Executing query: {copy_into_query}")
-            cur.execute(put_query)
             cur.execute(copy_into_query)
 
+    def ingest_file_to_table(
+        self,
+        table: str,
+        database: str,
+        schema: str,
+        file_path: str,
+        file_name: str,
+        staging_format: str = None,
+    ):
+        self.put_file(
+            table=table,
+            database=database,
+            schema=schema,
+            file_path=file_path,
+            file_name=file_name,
+            staging_format=staging_format,
+        )
+        self.copy_into_table(
+            table=table,
+            database=database,
+            schema=schema,
+            stage_path=file_name,
+            file_format=file_format_for(file_name, staging_format),
+        )
+
     def swap_tables(self, old_table: str, new_table: str):
         rename_old_table_query = (
             f"alter table if exists {old_table} rename to {old_table}__old"
         )
         rename_new_table_query = f"alter table {new_table} rename to {old_table}"
         drop_query = f"drop table if exists {old_table}__old"
-        with self.connection.cursor() as cur:
+        with borrow_cursor(self.connection) as cur:
             cur.execute(rename_old_table_query)
             cur.execute(rename_new_table_query)
             cur.execute(drop_query)
 
     def ingest_from_table(self, table: str, to_table: str):
         query = f"insert into {to_table} select * from {table}"
-        with self.connection.cursor() as cur:
+        with borrow_cursor(self.connection) as cur:
             cur.execute(query)
 
     def drop_table(self, table: str):
         query = f"drop table if exists {table}"
-        with self.connection.cursor() as cur:
+        with borrow_cursor(self.connection) as cur:
             cur.execute(query)
 
 
+class CompressedFile:
+    # Tekstfil som komprimeres mens den skrives. tell() gir antall
+    # komprimerte bytes skrevet til disk.
+    def __init__(self, file, compressor, buffer_size: int = 1024 * 256):
+        self.file = file
+        self.compressor = compressor
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, text: str) -> int:
+        self.buffer.append(text)
+        self.buffered = self.buffered + len(text)
+        if self.buffered >= self.buffer_size:
+            self._compress_buffer()
+        return len(text)
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def close(self):
+        self._compress_buffer()
+        self.file.write(self.compressor.flush())
+        self.file.close()
+
+    def _compress_buffer(self):
+        data = "".join(self.buffer).encode("utf-8")
+        self.file.write(self.compressor.compress(data))
+        self.buffer = []
+        self.buffered = 0
+
+
+def create_compressor(compression: str):
+    if compression == "gzip":
+        return zlib.compressobj(wbits=31)
+    if compression == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor().compressobj()
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
 class FileHandler:
-    def __init__(self, file_path: str = "/tmp/inbound", file_name: str = "inbound.csv"):
+    def __init__(
+        self,
+        file_path: str = "/tmp/inbound",
+        file_name: str = "inbound.csv",
+        compression: str = None,
+    ):
+        if compression is not None:
+            if compression not in COMPRESSION_SUFFIXES:
+                raise ValueError(
+                    f"compression must be one of {tuple(COMPRESSION_SUFFIXES)}"
+                )
+            file_name = f"{file_name}{COMPRESSION_SUFFIXES[compression]}"
         self.file_path = file_path
         self.file_name = file_name
         self.full_file_name = f"{file_path}/{file_name}"
+        self.compression = compression
 
     def create_dir(self):
         Path(self.file_path).mkdir(exist_ok=True)
 
-    def create_file(self):
-        return open(file=self.full_file_name, mode="w", encoding="utf-8", newline="")
+    def numbered_file_name(self, number: int) -> str:
+        stem, dot, suffix = self.file_name.partition(".")
+        return f"{stem}_{number}{dot}{suffix}"
+
+    def numbered_file_pattern(self) -> str:
+        # Regex for COPY INTO ... PATTERN. Bruker [.] i stedet for \. siden
+        # backslash er et escape-tegn i Snowflake-strenger.
+        stem, dot, suffix = self.file_name.partition(".")
+        suffix = f"{dot}{suffix}".replace(".", "[.]")
+        return f".*{stem}_[0-9]+{suffix}([.]gz)?"
+
+    def create_file(self, file_name: str = None, binary: bool = False):
+        full_file_name = self.full_file_name
+        if file_name is not None:
+            full_file_name = f"{self.file_path}/{file_name}"
+        if binary:
+            if self.compression is not None:
+                raise ValueError("Binary files can not be compressed by FileHandler")
+            return open(file=full_file_name, mode="wb")
+        if self.compression is not None:
+            return CompressedFile(
+                file=open(file=full_file_name, mode="wb"),
+                compressor=create_compressor(self.compression),
+            )
+        return open(file=full_file_name, mode="w", encoding="utf-8", newline="")
 
     def close_file(self, file):
         file.close()
 
-    def delete_file(self):
-        os.remove(self.full_file_name)
+    def delete_file(self, file_name: str = None):
+        full_file_name = self.full_file_name
+        if file_name is not None:
+            full_file_name = f"{self.file_path}/{file_name}"
+        os.remove(full_file_name)
 
 
 class SnowSink(Sink):
@@ -101,7 +265,14 @@ class SnowSink(Sink):
         file_handler: FileHandler = None,
         transient_table_postfix: str = "__transient",
         quote_identifiers: bool = False,
+        max_uploads_in_flight: int = 0,
+        single_copy: bool = False,
+        staging_format: str = "csv",
     ):
+        if staging_format not in STAGING_FORMATS:
+            raise ValueError(
+                f"staging_format must be one of {STAGING_FORMATS}, got {staging_format}"
+            )
         self.table = table
         self.transient_table = f"{table}{transient_table_postfix}"
         self.transient_table_postfix = transient_table_postfix
@@ -110,9 +281,12 @@ class SnowSink(Sink):
         self.csv_writer = csv_writer
         self.ddl = ddl
         self.quote_identifiers = quote_identifiers
+        self.max_uploads_in_flight = max_uploads_in_flight
+        self.single_copy = single_copy
+        self.staging_format = staging_format
         self.snow_handler = connection_handler
         if file_handler is None:
-            file_handler = FileHandler()
+            file_handler = FileHandler(file_name=f"inbound.{staging_format}")
         self.file_handler = file_handler
 
     def ingest(
@@ -146,52 +320,63 @@ class SnowSink(Sink):
         self.snow_handler.drop_table(temp_table)
         self.snow_handler.create_table(temp_ddl)
 
-        batch_results = []
-        batch_counter = -1
-        data_exists = True
-        while data_exists:
-            batch_counter = batch_counter + 1
-            batch_rows = 0
-            batch_start = datetime.now()
-            file_size_bytes = 0
-            file = self.file_handler.create_file()
-            writer = self.csv_writer(file)
-            col_names = tuple(c.name for c in column_description)
-            writer.writerow(col_names)
-            try:
-                while True:
-                    print("fetching data")
-                    data = next(data_generator)
-                    writer.writerows(data)
-                    batch_rows = batch_rows + len(data)
-                    print(f"writed {batch_rows} rows to tmp-file")
-                    file_size_bytes = file.tell()
-                    if file_size_bytes > self.tmp_file_max_size:
-                        break
-            except StopIteration:
-                data_exists = False
-            batch_stop = datetime.now()
-            batch_results.append(
-                {
-                    "number": batch_counter,
-                    "start": batch_start,
-                    "stop": batch_stop,
-                    "rows": batch_rows,
-                    "size_bytes": file_size_bytes,
-                }
+        database, schema, table = temp_table.split(".")
+        if self.single_copy:
+            stage_path = self.file_handler.file_name.partition(".")[0]
+            upload = partial(
+                self.snow_handler.put_file,
+                database=database,
+                schema=schema,
+                table=table,
+                file_path=self.file_handler.file_path,
+                stage_path=stage_path,
+                staging_format=self.staging_format,
             )
-            print(f"Uploading new batch to snow: {batch_results}")
-            self.file_handler.close_file(file=file)
-            database, schema, table = temp_table.split(".")
-            self.snow_handler.ingest_file_to_table(
+            batch_results = self._ingest_pipelined(
+                data_generator=data_generator,
+                column_description=column_description,
+                upload=upload,
+            )
+            print("copying all staged files into snow")
+            self.snow_handler.copy_into_table(
+                database=database,
+                schema=schema,
+                table=table,
+                stage_path=stage_path,
+                pattern=self.file_handler.numbered_file_pattern(),
+                file_format=file_format_for(
+                    self.file_handler.file_name, self.staging_format
+                ),
+            )
+        elif self.max_uploads_in_flight > 0:
+            upload = partial(
+                self.snow_handler.ingest_file_to_table,
                 database=database,
                 schema=schema,
                 table=table,
                 file_path=self.file_handler.file_path,
-                file_name=self.file_handler.file_name,
+                staging_format=self.staging_format,
+            )
+            batch_results = self._ingest_pipelined(
+                data_generator=data_generator,
+                column_description=column_description,
+                upload=upload,
+                spool_files=self.max_uploads_in_flight + 1,
+            )
+        else:
+            upload = partial(
+                self.snow_handler.ingest_file_to_table,
+                database=database,
+                schema=schema,
+                table=table,
+                file_path=self.file_handler.file_path,
+                staging_format=self.staging_format,
+            )
+            batch_results = self._ingest_sequential(
+                data_generator=data_generator,
+                column_description=column_description,
+                upload=upload,
             )
-            print("batch uploaded")
-        self.file_handler.delete_file()
 
         if not self.transient:
             self.snow_handler.ingest_from_table(table=temp_table, to_table=self.table)
@@ -200,6 +385,129 @@ class SnowSink(Sink):
 
         return batch_results
 
+    def _ingest_sequential(self, data_generator, column_description, upload):
+        batch_results = []
+        batch_counter = -1
+        data_exists = True
+        while data_exists:
+            batch_counter = batch_counter + 1
+            file = self._create_file()
+            batch_result, data_exists = self._write_batch(
+                file=file,
+                data_generator=data_generator,
+                column_description=column_description,
+                number=batch_counter,
+            )
+            batch_results.append(batch_result)
+            print(f"Uploading new batch to snow: {batch_results}")
+            self.file_handler.close_file(file=file)
+            upload(file_name=self.file_handler.file_name)
+            print("batch uploaded")
+        self.file_handler.delete_file()
+        return batch_results
+
+    def _ingest_pipelined(
+        self, data_generator, column_description, upload, spool_files=None
+    ):
+        # Skriver neste batch til en egen spool-fil mens tidligere batcher
+        # lastes opp. Med spool_files gjenbrukes et fast antall filer (én mer
+        # enn antall opplastinger som kan være i gang samtidig). Uten får hver
+        # batch sin egen nummererte fil som slettes så snart den er lastet opp.
+        max_uploads_in_flight = max(self.max_uploads_in_flight, 1)
+        spool_files_used = set()
+        uploads = deque()
+        batch_results = []
+        batch_counter = -1
+        data_exists = True
+        with ThreadPoolExecutor(max_workers=max_uploads_in_flight) as executor:
+            while data_exists:
+                batch_counter = batch_counter + 1
+                file_number = batch_counter
+                if spool_files is not None:
+                    file_number = batch_counter % spool_files
+                file_name = self.file_handler.numbered_file_name(file_number)
+                file = self._create_file(file_name=file_name)
+                batch_result, data_exists = self._write_batch(
+                    file=file,
+                    data_generator=data_generator,
+                    column_description=column_description,
+                    number=batch_counter,
+                )
+                batch_results.append(batch_result)
+                self.file_handler.close_file(file=file)
+                print(f"Uploading batch {batch_counter} to snow in background")
+                if spool_files is None:
+                    uploads.append(
+                        executor.submit(
+                            self._upload_and_delete, upload=upload, file_name=file_name
+                        )
+                    )
+                else:
+                    spool_files_used.add(file_name)
+                    uploads.append(executor.submit(upload, file_name=file_name))
+                while len(uploads) > max_uploads_in_flight:
+                    uploads.popleft().result()
+            while uploads:
+                uploads.popleft().result()
+        print("all batches uploaded")
+        for file_name in spool_files_used:
+            self.file_handler.delete_file(file_name=file_name)
+        return batch_results
+
+    def _upload_and_delete(self, upload, file_name):
+        upload(file_name=file_name)
+        self.file_handler.delete_file(file_name=file_name)
+
+    def _create_file(self, file_name: str = None):
+        kwargs = {}
+        if file_name is not None:
+            kwargs["file_name"] = file_name
+        if self.staging_format == "parquet":
+            kwargs["binary"] = True
+        return self.file_handler.create_file(**kwargs)
+
+    def _create_writer(self, file, column_description: list[Description]):
+        if self.staging_format == "parquet":
+            from .parquet import ParquetWriter
+
+            return ParquetWriter(file=file, column_description=column_description)
+        writer = self.csv_writer(file)
+        writer.writerow(tuple(c.name for c in column_description))
+        return writer
+
+    def _write_batch(self, file, data_generator, column_description, number):
+        batch_rows = 0
+        batch_start = datetime.now()
+        file_size_bytes = 0
+        data_exists = True
+        writer = self._create_writer(file=file, column_description=column_description)
+        try:
+            while True:
+                print("fetching data")
+                data = next(data_generator)
+                if is_arrow_batch(data) and self.staging_format == "csv":
+                    file.write(arrow_to_csv(data))
+                else:
+                    writer.writerows(data)
+                batch_rows = batch_rows + len(data)
+                print(f"writed {batch_rows} rows to tmp-file")
+                file_size_bytes = file.tell()
+                if file_size_bytes > self.tmp_file_max_size:
+                    break
+        except StopIteration:
+            data_exists = False
+        if self.staging_format == "parquet":
+            writer.close()
+            file_size_bytes = file.tell()
+        batch_result = {
+            "number": number,
+            "start": batch_start,
+            "stop": datetime.now(),
+            "rows": batch_rows,
+            "size_bytes": file_size_bytes,
+        }
+        return batch_result, data_exists
+
     @staticmethod
     def create_ddl(
         table: str,
@@ -224,7 +532,7 @@ class SnowSink(Sink):
                     {%- endfor -%}
                     )
                 """.strip()
-        ddl_template = Environment().from_string(source=ddl_jinja)
+        ddl_template = compile_template(ddl_jinja)
 
         return ddl_template.render(
             table=table,
@@ -233,7 +541,9 @@ class SnowSink(Sink):
         )
 
 
-def snow_generate_highwatermark(connection: SnowflakeConnection, query) -> list[dict]:
-    with connection.cursor(DictCursor) as cur:
+def snow_generate_highwatermark(
+    connection: Union[SnowflakeConnection, ConnectionPool], query
+) -> list[dict]:
+    with borrow_cursor(connection, DictCursor) as cur:
         cur.execute(query)
         return cur.fetchall()
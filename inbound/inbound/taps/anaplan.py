@@ -1,12 +1,20 @@
 import base64
+import codecs
 import csv
 import io
 import json
+import random
+import threading
 import time
-from typing import Any, Generator, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Any, Callable, Generator, Optional
 
 import requests
 
+from ..core.chunk_cache import ChunkCache
+from ..core.job_management import report_progress
 from ..core.models import Description
 from ..sdk.tap import Tap
 
@@ -15,8 +23,50 @@ class AnaplanAuthException(Exception):
     pass
 
 
+class AnaplanExportException(Exception):
+    pass
+
+
+class AnaplanExportTimeout(AnaplanExportException):
+    pass
+
+
+class PollingPolicy:
+    # Venter initial_delay sekunder før første nye sjekk, og dobler ventetiden
+    # opp til max_delay. Jitter legges på så parallelle jobber ikke spør
+    # samtidig. Med deadline_seconds gis eksporten opp etter så mange
+    # sekunder, uten venter den så lenge eksporten tar.
+    def __init__(
+        self,
+        initial_delay: float = 1.0,
+        max_delay: float = 30.0,
+        multiplier: float = 2.0,
+        jitter: float = 0.1,
+        deadline_seconds: Optional[float] = None,
+    ):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline_seconds = deadline_seconds
+
+    def delay(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.initial_delay * self.multiplier**attempt)
+        return delay * (1 + random.uniform(0, self.jitter))
+
+
 class AnaplanIntegrationService:
-    def __init__(self, workspaceID, modelID, exportID, fileID, username, password):
+    def __init__(
+        self,
+        workspaceID,
+        modelID,
+        exportID,
+        fileID,
+        username,
+        password,
+        session: Optional[requests.Session] = None,
+        token_refresh_margin: float = 300,
+    ):
         self.workspaceID = workspaceID
         self.modelID = modelID
         self.exportID = exportID
@@ -27,41 +77,72 @@ class AnaplanIntegrationService:
             f"https://api.anaplan.com/2/0/workspaces/{workspaceID}/models/{modelID}"
         )
         self.auth_url = "https://auth.anaplan.com/token/authenticate"
+        self.refresh_url = "https://auth.anaplan.com/token/refresh"
+        # Én sesjon med keep-alive for alle kall, i stedet for en ny
+        # TCP/TLS-tilkobling per kall
+        self.session = session or requests.Session()
+        # Tokenet gjenbrukes til det er token_refresh_margin sekunder igjen
+        # før det utløper, og fornyes da før neste kall
+        self.token_refresh_margin = token_refresh_margin
+        self._token_value = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+    def for_export(self, exportID, fileID) -> "AnaplanIntegrationService":
+        # Samme modell og sesjon, men en annen eksport
+        return AnaplanIntegrationService(
+            workspaceID=self.workspaceID,
+            modelID=self.modelID,
+            exportID=exportID,
+            fileID=fileID,
+            username=self.username,
+            password=self.password,
+            session=self.session,
+            token_refresh_margin=self.token_refresh_margin,
+        )
 
     def export_information(self) -> dict:
         url = f"{self.base_url}/exports/{self.exportID}"
-        respons = requests.get(
-            url, headers=self._headers(), data=json.dumps({"localeName": "en_US"})
-        )
+        respons = self._request("GET", url)
         return respons.json()
 
     def trigger_export_task(self) -> dict:
         url = f"{self.base_url}/exports/{self.exportID}/tasks"
-        return requests.post(
-            url, headers=self._headers(), data=json.dumps({"localeName": "en_US"})
-        ).json()
+        return self._request("POST", url).json()
 
     def export_task_status(self, taskID) -> dict:
         status_url = f"{self.base_url}/exports/{self.exportID}/tasks/{taskID}"
-        return requests.get(
-            status_url,
-            headers=self._headers(),
-            data=json.dumps({"localeName": "en_US"}),
-        ).json()
+        return self._request("GET", status_url).json()
 
     def number_of_file_chunks(self) -> dict:
         url = f"{self.base_url}/files/{self.fileID}/chunks/"
-        return requests.get(
-            url, headers=self._headers(), data=json.dumps({"localeName": "en_US"})
-        ).json()
+        return self._request("GET", url).json()
 
     def file_chunk(self, chunkID) -> bytes:
         url = f"{self.base_url}/files/{self.fileID}/chunks/{chunkID}"
-        respons = requests.get(
-            url, headers=self._headers(), data=json.dumps({"localeName": "en_US"})
-        )
+        respons = self._request("GET", url)
+        # En feilside må ikke tolkes som CSV eller lagres i chunk_cache
+        respons.raise_for_status()
         return respons.content
 
+    def _request(self, method: str, url: str) -> requests.Response:
+        respons = self.session.request(
+            method,
+            url,
+            headers=self._headers(),
+            data=json.dumps({"localeName": "en_US"}),
+        )
+        if respons.status_code == 401:
+            # Tokenet kan være trukket tilbake før det utløper
+            self._invalidate_token()
+            respons = self.session.request(
+                method,
+                url,
+                headers=self._headers(),
+                data=json.dumps({"localeName": "en_US"}),
+            )
+        return respons
+
     def _auth_response(self) -> requests.Response:
         user = "Basic " + str(
             base64.b64encode(
@@ -70,19 +151,56 @@ class AnaplanIntegrationService:
         )
         auth_header = {"Authorization": user, "Content-Type": "application/json"}
 
-        return requests.post(
+        return self.session.post(
             url=self.auth_url,
             headers=auth_header,
             data=json.dumps({"localeName": "en_US"}),
         )
 
-    def _headers(self, auth_response: Optional[requests.Response] = None):
-        auth_response = auth_response or self._auth_response()
+    def _refresh_response(self) -> requests.Response:
+        return self.session.post(
+            url=self.refresh_url,
+            headers={
+                "Authorization": f"AnaplanAuthToken {self._token_value}",
+                "Content-Type": "application/json",
+            },
+        )
+
+    def _store_token(self, auth_response: requests.Response) -> str:
         if not auth_response.ok:
             raise AnaplanAuthException(
                 f"Authentication against Anaplan failed: {auth_response.text}"
             )
-        token_value = auth_response.json()["tokenInfo"]["tokenValue"]
+        token_info = auth_response.json()["tokenInfo"]
+        self._token_value = token_info["tokenValue"]
+        # expiresAt er millisekunder siden epoch
+        self._token_expires_at = token_info.get("expiresAt", 0) / 1000
+        return self._token_value
+
+    def _invalidate_token(self):
+        with self._token_lock:
+            self._token_value = None
+            self._token_expires_at = 0.0
+
+    def _token(self) -> str:
+        with self._token_lock:
+            now = time.time()
+            if (
+                self._token_value is not None
+                and now < self._token_expires_at - self.token_refresh_margin
+            ):
+                return self._token_value
+            if self._token_value is not None and now < self._token_expires_at:
+                refresh_response = self._refresh_response()
+                if refresh_response.ok:
+                    return self._store_token(refresh_response)
+            return self._store_token(self._auth_response())
+
+    def _headers(self, auth_response: Optional[requests.Response] = None):
+        if auth_response is None:
+            token_value = self._token()
+        else:
+            token_value = self._store_token(auth_response)
 
         return {
             "Authorization": f"AnaplanAuthToken {token_value}",
@@ -101,7 +219,18 @@ class AnaplanTap(Tap):
         username,
         password,
         integration_service: Optional[AnaplanIntegrationService] = None,
+        download_workers: int = 4,
+        batch_size: int = 10000,
+        polling_policy: Optional[PollingPolicy] = None,
+        progress_callback: Optional[Callable[[float], None]] = report_progress,
+        parallel_exports: Optional[list[tuple[str, str]]] = None,
+        chunk_cache: Optional[ChunkCache] = None,
     ):
+        self.download_workers = download_workers
+        self.chunk_cache = chunk_cache
+        self.batch_size = batch_size
+        self.polling_policy = polling_policy or PollingPolicy()
+        self.progress_callback = progress_callback
         self.integration_service = integration_service or AnaplanIntegrationService(
             workspaceID=workspaceID,
             modelID=modelID,
@@ -110,6 +239,12 @@ class AnaplanTap(Tap):
             username=username,
             password=password,
         )
+        # Ekstra (exportID, fileID) som startes samtidig og må ha samme
+        # kolonner. Radene fra hver eksport gis videre når den er ferdig.
+        self.integration_services = [self.integration_service] + [
+            self.integration_service.for_export(exportID=export_id, fileID=file_id)
+            for export_id, file_id in parallel_exports or []
+        ]
 
     def column_descriptions(self) -> list[Description]:
         export = self.integration_service.export_information()
@@ -131,32 +266,185 @@ class AnaplanTap(Tap):
     def data_generator(
         self,
     ) -> Generator[list[tuple], Any, None]:
-        trigger_response = self.integration_service.trigger_export_task()
-        taskID = trigger_response["task"]["taskId"]
-
-        while (
-            self.integration_service.export_task_status(taskID=taskID)["task"][
-                "taskState"
-            ]
-            != "COMPLETE"
-        ):
-            time.sleep(1)
-
-        file_chunks_response = self.integration_service.number_of_file_chunks()
-        file_chunks = file_chunks_response.get("chunks") or [{"id": "0"}]
-        file = bytes()
-        for chunk in file_chunks:
-            chunkID = chunk["id"]
-            file = file + self.integration_service.file_chunk(chunkID=chunkID)
-        bytes_to_file = io.StringIO(file.decode("utf-8"))
+        # Eksporter som allerede er ferdige og ligger i chunk_cache startes
+        # ikke på nytt
+        cached_tasks = []
+        tasks = []
+        for service in self.integration_services:
+            taskID = self._cached_task(service)
+            if taskID is not None:
+                cached_tasks.append((service, taskID))
+            else:
+                tasks.append((service, service.trigger_export_task()["task"]["taskId"]))
+
         data = []
-        with bytes_to_file as f:
-            reader = csv.reader(f)
+        batches = 0
+        for service, taskID in chain(cached_tasks, self._completed_exports(tasks)):
+            if self.chunk_cache is not None:
+                self.chunk_cache.start(self._cache_key(service), taskID)
+            for row in self._export_rows(service, taskID):
+                data.append(row)
+                if len(data) >= self.batch_size:
+                    yield data
+                    batches = batches + 1
+                    data = []
+        if data or batches == 0:
+            yield data
 
-            # Skip header
-            next(reader, None)
+    def _completed_exports(
+        self, tasks: list[tuple[AnaplanIntegrationService, str]]
+    ) -> Generator[tuple[AnaplanIntegrationService, str], Any, None]:
+        policy = self.polling_policy
+        deadline = None
+        if policy.deadline_seconds is not None:
+            deadline = time.monotonic() + policy.deadline_seconds
+        pending = dict(enumerate(tasks))
+        progress = {index: 0.0 for index in pending}
+        attempt = 0
+        while pending:
+            completed = []
+            for index, (service, taskID) in list(pending.items()):
+                task = service.export_task_status(taskID=taskID)["task"]
+                state = task["taskState"]
+                if state == "COMPLETE":
+                    result = task.get("result") or {}
+                    if result.get("successful") is False:
+                        raise AnaplanExportException(
+                            f"Anaplan export {service.exportID} failed: {result}"
+                        )
+                    progress[index] = 1.0
+                    completed.append((service, taskID))
+                    del pending[index]
+                elif state == "CANCELLED":
+                    raise AnaplanExportException(
+                        f"Anaplan export {service.exportID} was cancelled"
+                    )
+                else:
+                    progress[index] = task.get("progress") or progress[index]
+            self._report_progress(sum(progress.values()) / len(progress))
+            yield from completed
+            if not pending:
+                break
+            delay = policy.delay(attempt)
+            attempt = attempt + 1
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise AnaplanExportTimeout(
+                        "Anaplan exports not complete after "
+                        f"{policy.deadline_seconds} seconds: "
+                        f"{[service.exportID for service, _ in pending.values()]}"
+                    )
+                delay = min(delay, remaining)
+            time.sleep(delay)
 
-            for row in reader:
-                data.append(tuple(row))
+    def on_success(self):
+        # Chunks gjenbrukes bare når en jobb kjøres på nytt etter en feil.
+        # Etter en vellykket lasting skal neste kjøring starte en ny eksport.
+        if self.chunk_cache is None:
+            return
+        for service in self.integration_services:
+            self.chunk_cache.invalidate(self._cache_key(service))
+
+    def _report_progress(self, progress: float):
+        if self.progress_callback is not None:
+            self.progress_callback(progress)
+
+    @staticmethod
+    def _cache_key(integration_service: AnaplanIntegrationService) -> tuple:
+        return (
+            integration_service.workspaceID,
+            integration_service.modelID,
+            integration_service.exportID,
+            integration_service.fileID,
+        )
+
+    def _cached_task(
+        self, integration_service: AnaplanIntegrationService
+    ) -> Optional[str]:
+        if self.chunk_cache is None:
+            return None
+        return self.chunk_cache.task(self._cache_key(integration_service))
+
+    def _file_chunks(
+        self, integration_service: AnaplanIntegrationService, taskID: str
+    ) -> list[dict]:
+        key = self._cache_key(integration_service)
+        if self.chunk_cache is not None:
+            chunk_ids = self.chunk_cache.chunk_ids(key, taskID)
+            if chunk_ids is not None:
+                return [{"id": chunk_id} for chunk_id in chunk_ids]
+        file_chunks_response = integration_service.number_of_file_chunks()
+        file_chunks = file_chunks_response.get("chunks") or [{"id": "0"}]
+        if self.chunk_cache is not None:
+            self.chunk_cache.set_chunk_ids(
+                key, taskID, [chunk["id"] for chunk in file_chunks]
+            )
+        return file_chunks
+
+    def _file_chunk(
+        self, integration_service: AnaplanIntegrationService, taskID: str, chunkID
+    ) -> bytes:
+        if self.chunk_cache is None:
+            return integration_service.file_chunk(chunkID=chunkID)
+        key = self._cache_key(integration_service)
+        data = self.chunk_cache.get(key, taskID, chunkID)
+        if data is None:
+            data = integration_service.file_chunk(chunkID=chunkID)
+            self.chunk_cache.put(key, taskID, chunkID, data)
+        return data
+
+    def _export_rows(
+        self, integration_service: AnaplanIntegrationService, taskID: str
+    ) -> Generator[tuple, Any, None]:
+        file_chunks = self._file_chunks(integration_service, taskID)
+        reader = csv.reader(
+            self._lines(self._chunks(integration_service, taskID, file_chunks))
+        )
+
+        # Skip header
+        next(reader, None)
+
+        for row in reader:
+            yield tuple(row)
+
+    def _chunks(
+        self,
+        integration_service: AnaplanIntegrationService,
+        taskID: str,
+        file_chunks: list[dict],
+    ) -> Generator[bytes, Any, None]:
+        # Laster ned opptil download_workers chunks samtidig, men gir dem
+        # videre i rekkefølge
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            pending = deque()
+            try:
+                for chunk in file_chunks:
+                    pending.append(
+                        executor.submit(
+                            self._file_chunk, integration_service, taskID, chunk["id"]
+                        )
+                    )
+                    if len(pending) >= self.download_workers:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
 
-        yield data
+    @staticmethod
+    def _lines(chunks) -> Generator[str, Any, None]:
+        # Dekoder UTF-8 fortløpende og deler kun på "\n", som io.StringIO.
+        # Et tegn eller en linje som er delt mellom to chunks holdes igjen til
+        # resten kommer.
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        pending = ""
+        for chunk in chunks:
+            text = pending + decoder.decode(chunk)
+            end = text.rfind("\n") + 1
+            pending = text[end:]
+            yield from io.StringIO(text[:end])
+        text = pending + decoder.decode(b"", final=True)
+        if text:
+            yield text
@@ -1,5 +1,7 @@
+import codecs
 import json
-from typing import Any, Generator
+import re
+from typing import Any, Generator, Iterable, Optional
 from urllib.parse import urljoin
 
 import requests
@@ -7,9 +9,188 @@ import requests
 from ..core.models import Description
 from ..sdk.tap import Tap
 
+
 class MainManagerError(Exception):
     pass
 
+
+_whitespace = re.compile(r"[ \t\n\r]*")
+_string_content = re.compile(r'[^"\\]*(?:\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})[^"\\]*)*')
+_decoder = json.JSONDecoder()
+
+
+def _decode(chunks: Iterable[bytes]) -> Generator[str, Any, None]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+class _TextBuffer:
+    # Leser JSON-tekst fra en strøm av biter og holder bare på det som ikke
+    # er lest ennå
+    def __init__(self, pieces: Iterable[str]):
+        self.pieces = iter(pieces)
+        self.text = ""
+        self.pos = 0
+
+    def fill(self) -> bool:
+        piece = next(self.pieces, None)
+        if piece is None:
+            return False
+        self.text = self.text[self.pos :] + piece
+        self.pos = 0
+        return True
+
+    def at_end(self) -> bool:
+        while True:
+            self.pos = _whitespace.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return False
+            if not self.fill():
+                return True
+
+    def peek(self) -> str:
+        if self.at_end():
+            raise MainManagerError("Unexpected end of response from MainManager")
+        return self.text[self.pos]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise MainManagerError(
+                f"Invalid response from MainManager: expected {char!r} "
+                f"at {self.text[self.pos : self.pos + 20]!r}"
+            )
+        self.pos = self.pos + 1
+
+    def skip_separator(self, end: str) -> bool:
+        # Hopper over et komma, og sier fra om objektet eller listen er slutt
+        char = self.peek()
+        if char == ",":
+            self.pos = self.pos + 1
+            return False
+        self.expect(end)
+        return True
+
+    def _raw_decode(self) -> tuple[Any, int]:
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise MainManagerError("Invalid JSON in response from MainManager")
+                continue
+            # Et tall på slutten av bufferet kan fortsette i neste bit
+            if end == len(self.text) and self.fill():
+                continue
+            return value, end
+
+    def value(self) -> Any:
+        value, self.pos = self._raw_decode()
+        return value
+
+    def raw_value(self) -> str:
+        # Teksten verdien hadde i svaret, så den kan sendes videre som den er
+        _, end = self._raw_decode()
+        raw = self.text[self.pos : end]
+        self.pos = end
+        return raw
+
+    def string_pieces(self) -> Generator[str, Any, None]:
+        # Dekoder en JSON-streng bit for bit. Kalles rett etter åpnings-"
+        while True:
+            end = _string_content.match(self.text, self.pos).end()
+            held_back = 0
+            if end > self.pos:
+                piece = json.loads(f'"{self.text[self.pos : end]}"')
+                if (
+                    "\ud800" <= piece[-1] <= "\udbff"
+                    and len(self.text) - end < 6
+                    and not self.text.startswith('"', end)
+                ):
+                    # Første halvdel av et surrogatpar der andre halvdel ikke
+                    # er kommet helt ennå, vent på resten
+                    end = end - 6
+                    piece = piece[:-1]
+                    held_back = 6
+                if piece:
+                    yield piece
+                self.pos = end
+            if self.pos < len(self.text) and self.text[self.pos] == '"':
+                self.pos = self.pos + 1
+                return
+            # En gyldig escape som er delt mellom to biter er høyst 6 tegn
+            if len(self.text) - self.pos > 6 + held_back:
+                raise MainManagerError(
+                    "Invalid string escape in response from MainManager"
+                )
+            if not self.fill():
+                raise MainManagerError("Unexpected end of response from MainManager")
+
+
+def _table_rows(buffer: _TextBuffer) -> Generator[str, Any, None]:
+    buffer.expect("{")
+    if buffer.peek() == "}":
+        buffer.pos = buffer.pos + 1
+        return
+    while True:
+        name = buffer.value()
+        buffer.expect(":")
+        if name == "table":
+            buffer.expect("[")
+            if buffer.peek() == "]":
+                buffer.pos = buffer.pos + 1
+            else:
+                while True:
+                    yield buffer.raw_value()
+                    if buffer.skip_separator("]"):
+                        break
+        else:
+            buffer.value()
+        if buffer.skip_separator("}"):
+            return
+
+
+def iter_table_rows(chunks: Iterable[bytes]) -> Generator[str, Any, None]:
+    # Strømmer radene i DataTable som rå JSON-tekst. DataTable er selv en
+    # JSON-streng, som dekodes underveis i stedet for å lastes inn i minnet.
+    outer = _TextBuffer(_decode(chunks))
+    success = None
+    message = None
+    outer.expect("{")
+    if outer.peek() == "}":
+        raise MainManagerError("Empty response from MainManager")
+    while True:
+        name = outer.value()
+        outer.expect(":")
+        if name == "DataTable" and outer.peek() in '"{':
+            if success is False:
+                raise MainManagerError(message)
+            if outer.peek() == '"':
+                outer.pos = outer.pos + 1
+                table = _TextBuffer(outer.string_pieces())
+                yield from _table_rows(table)
+                if not table.at_end():
+                    raise MainManagerError("Unexpected data after DataTable")
+            else:
+                yield from _table_rows(outer)
+        else:
+            value = outer.value()
+            if name == "Success":
+                success = value
+            elif name == "Message":
+                message = value
+        if outer.skip_separator("}"):
+            break
+    if success is False:
+        raise MainManagerError(message)
+
+
 class MainManagerDataSupplier:
     def __init__(
         self,
@@ -31,9 +212,22 @@ class MainManagerDataSupplier:
         response = requests.get(urljoin(self.base_url, self.endpoint), headers=headers)
 
         payload = response.json()
-        if payload['Success'] is False:
-            raise MainManagerError(payload['Message'])
-        return response.json()
+        if payload["Success"] is False:
+            raise MainManagerError(payload["Message"])
+        return payload
+
+    def stream(self, chunk_size: int = 1024 * 1024) -> Generator[bytes, Any, None]:
+        token = self._get_mainmanager_token()
+        headers = {"Authorization": f"Bearer {token}"}
+
+        with requests.get(
+            urljoin(self.base_url, self.endpoint), headers=headers, stream=True
+        ) as response:
+            if not response.ok:
+                raise MainManagerError(
+                    f"MainManager returned {response.status_code}: {response.text}"
+                )
+            yield from response.iter_content(chunk_size=chunk_size)
 
     # Autentisering mot MainManager-APIet
     def _get_mainmanager_token(self):
@@ -47,8 +241,8 @@ class MainManagerDataSupplier:
 
         payload = response.json()
         if response.status_code != 200:
-            raise MainManagerError(payload['error_description'])
-        return response.json().get("access_token")
+            raise MainManagerError(payload["error_description"])
+        return payload.get("access_token")
 
 
 class MainManagerTap(Tap):
@@ -60,7 +254,16 @@ class MainManagerTap(Tap):
         password: str,
         base_url: str = "https://nav-test.mainmanager.no",
         data_supplier=None,
+        streaming: bool = False,
+        batch_size: int = 10000,
+        passthrough: bool = True,
     ):
+        # streaming leser svaret bit for bit og gir rader i batcher på
+        # batch_size. Med passthrough sendes hver rad videre som teksten den
+        # var i svaret, uten json.loads og json.dumps.
+        self.streaming = streaming
+        self.batch_size = batch_size
+        self.passthrough = passthrough
         self.data_supplier = data_supplier
         if data_supplier is None:
             self.data_supplier = MainManagerDataSupplier(
@@ -76,6 +279,9 @@ class MainManagerTap(Tap):
 
     # Henter ut json-data fra APIet og deler opp i én record per rad
     def data_generator(self) -> Generator[list[tuple], Any, None]:
+        if self.streaming:
+            yield from self._streaming_batches()
+            return
 
         eiendomsdata = self.data_supplier.get_data()
 
@@ -85,3 +291,17 @@ class MainManagerTap(Tap):
         table_content = json.loads(eiendomsdata.get("DataTable"))
 
         yield [(json.dumps(item),) for item in table_content["table"]]
+
+    def _streaming_batches(self) -> Generator[list[tuple], Any, None]:
+        data = []
+        batches = 0
+        for raw in iter_table_rows(self.data_supplier.stream()):
+            if not self.passthrough:
+                raw = json.dumps(json.loads(raw))
+            data.append((raw,))
+            if len(data) >= self.batch_size:
+                yield data
+                batches = batches + 1
+                data = []
+        if data or batches == 0:
+            yield data
@@ -1,25 +1,155 @@
-from typing import Any, Generator
+import copy
+import queue
+from datetime import datetime
+from typing import Any, Callable, Generator, Union
 
 import pyodbc
 
+from ..core.connection_pool import (
+    ConnectionPool,
+    borrow_cursor,
+    borrow_or_connect,
+    check_parallel_connections,
+)
+from ..core.description_cache import description_cache, description_from_cursor
+from ..core.fetch_policy import FetchPolicy, execute, fetch_batches
+from ..core.highwatermark_planner import CoalescingPlanner
 from ..core.models import Description
+from ..core.prefetch import interleave
 from ..sdk.tap import Tap
-from ..sdk.utils import get_query_list
+from ..sdk.utils import get_bind_parameters, get_bind_query, get_query_list
+
+# Python-typene pyodbc oppgir i cursor.description for hver SQL Server-type, så
+# beskrivelser fra sp_describe_first_result_set blir like de fra en spørring
+SQL_SERVER_TYPES = {
+    "bit": "<class 'bool'>",
+    "tinyint": "<class 'int'>",
+    "smallint": "<class 'int'>",
+    "int": "<class 'int'>",
+    "bigint": "<class 'int'>",
+    "decimal": "<class 'decimal.Decimal'>",
+    "numeric": "<class 'decimal.Decimal'>",
+    "money": "<class 'decimal.Decimal'>",
+    "smallmoney": "<class 'decimal.Decimal'>",
+    "float": "<class 'float'>",
+    "real": "<class 'float'>",
+    "date": "<class 'datetime.date'>",
+    "time": "<class 'datetime.time'>",
+    "datetime": "<class 'datetime.datetime'>",
+    "datetime2": "<class 'datetime.datetime'>",
+    "smalldatetime": "<class 'datetime.datetime'>",
+    "char": "<class 'str'>",
+    "varchar": "<class 'str'>",
+    "text": "<class 'str'>",
+    "nchar": "<class 'str'>",
+    "nvarchar": "<class 'str'>",
+    "ntext": "<class 'str'>",
+    "xml": "<class 'str'>",
+    "uniqueidentifier": "<class 'str'>",
+    "binary": "<class 'bytes'>",
+    "varbinary": "<class 'bytes'>",
+    "image": "<class 'bytes'>",
+    "timestamp": "<class 'bytes'>",
+}
+
+
+def description_from_result_set(row: dict) -> Description:
+    type_name = row["system_type_name"].split("(")[0].lower()
+    if type_name not in SQL_SERVER_TYPES:
+        raise ValueError(f"Unknown SQL Server type: {row['system_type_name']}")
+    precision = row["precision"]
+    if SQL_SERVER_TYPES[type_name] == "<class 'str'>":
+        # pyodbc oppgir antall tegn som presisjon for tekst, 0 for (max)
+        precision = max(row["max_length"], 0)
+        if type_name in ("nchar", "nvarchar", "ntext"):
+            precision = precision // 2
+    return Description(
+        name=row["name"],
+        type=SQL_SERVER_TYPES[type_name],
+        precision=precision,
+        scale=row["scale"],
+        nullable=bool(row["is_nullable"]),
+    )
 
 
 class MSSQLTap(Tap):
     def __init__(
-        self, connection: pyodbc.Connection, query: str, highwatermarks: list[dict] = [{}]
+        self,
+        connection: Union[pyodbc.Connection, ConnectionPool],
+        query: str,
+        highwatermarks: list[dict] = [{}],
+        fetch_policy: FetchPolicy = None,
+        bind_highwatermarks: bool = False,
+        description_source: str = None,
+        parallel_queries: int = 1,
+        connection_factory: Callable[[], pyodbc.Connection] = None,
+        max_buffered_batches: int = 8,
+        highwatermark_planner: CoalescingPlanner = None,
     ):
         if len(highwatermarks) == 0:
             raise ValueError("highwatermarks should not be an empty list")
+        if highwatermark_planner is not None:
+            highwatermarks = highwatermark_planner.plan(highwatermarks)
+        if parallel_queries > 1:
+            check_parallel_connections(
+                connection, connection_factory, "parallel_queries > 1"
+            )
         self.connection = connection
-        self.queries = get_query_list(
-            query_template=query, highwatermarks=highwatermarks
-        )
+        self.query = query
+        self.parallel_queries = parallel_queries
+        self.connection_factory = connection_factory
+        self.max_buffered_batches = max_buffered_batches
+        self.query_results = []
+        self.fetch_policy = fetch_policy
+        self.description_source = description_source
+        self.bind_highwatermarks = bind_highwatermarks
+        if bind_highwatermarks:
+            # Én spørring med ? som kjøres med ulike parametre per highwatermark
+            bind_query, names = get_bind_query(query, paramstyle="qmark")
+            self.parameters = get_bind_parameters(
+                names, highwatermarks=highwatermarks, paramstyle="qmark"
+            )
+            self.queries = [bind_query] * len(self.parameters)
+        else:
+            self.parameters = [None] * len(highwatermarks)
+            self.queries = get_query_list(
+                query_template=query, highwatermarks=highwatermarks
+            )
 
     def column_descriptions(self) -> list[Description]:
-        query = self.queries[0]
+        # Beskriv malen, ikke spørringen for første highwatermark, så cachen
+        # treffer selv om highwatermarkene endrer seg mellom kjøringer
+        query = self._describe_query()
+        if self.description_source is not None:
+            cached = description_cache.get(self.description_source, query)
+            if cached is not None:
+                return cached
+        try:
+            column_descriptions = self._describe_first_result_set(query)
+        except (pyodbc.Error, ValueError) as e:
+            print(f"could not describe query, describing with where 1=2: {e}")
+            column_descriptions = self._execute_column_descriptions(query)
+        if self.description_source is not None:
+            description_cache.put(self.description_source, query, column_descriptions)
+        return column_descriptions
+
+    def _describe_query(self) -> str:
+        if self.bind_highwatermarks:
+            return get_bind_query(self.query, paramstyle="qmark")[0]
+        return get_query_list(self.query, [{}])[0]
+
+    def _describe_first_result_set(self, query: str) -> list[Description]:
+        # Beskriver spørringen uten å kjøre den. Spørringer med ? feiler her,
+        # siden parametrene ikke er deklarert.
+        with borrow_cursor(self.connection) as cur:
+            cur.execute("exec sp_describe_first_result_set @tsql = ?", query)
+            names = [col[0] for col in cur.description]
+            rows = [dict(zip(names, row)) for row in cur.fetchall()]
+        return [
+            description_from_result_set(row) for row in rows if not row["is_hidden"]
+        ]
+
+    def _execute_column_descriptions(self, query: str) -> list[Description]:
         q_lowercase_where = query.replace("WHERE", "where")
         query_split = q_lowercase_where.split(sep="where", maxsplit=1)
         query_select = query_split[0]
@@ -48,35 +178,72 @@ class MSSQLTap(Tap):
 
         print(f"desc_query: {desc_query}")
 
-        column_descriptions = []
         # TODO: Isoler IO
-        with self.connection.cursor() as cur:
+        with borrow_cursor(self.connection) as cur:
             cur.execute(desc_query)
+            return description_from_cursor(cur.description)
 
-            for col in cur.description:
-                column_descriptions.append(
-                    Description(
-                        name=col[0],
-                        type=str(col[1]),
-                        precision=col[4],
-                        scale=col[5],
-                        nullable=col[6],
-                    )
-                )
-        return column_descriptions
+    def run_result(self) -> dict:
+        return {"queries": [result for result in self.query_results if result]}
 
     def data_generator(self) -> Generator[list[tuple], Any, None]:
+        self.query_results = [None] * len(self.queries)
+        if self.parallel_queries > 1 and len(self.queries) > 1:
+            # Hver tråd har sin egen tilkobling og tar neste spørring fra køen
+            # når den er ferdig med den forrige
+            pending = queue.SimpleQueue()
+            for number in range(len(self.queries)):
+                pending.put(number)
+            workers = min(self.parallel_queries, len(self.queries))
+            yield from interleave(
+                [self._query_worker(pending) for _ in range(workers)],
+                max_batches=self.max_buffered_batches,
+            )
+            return
+
         # TODO: Isoler IO
-        with self.connection.cursor() as cur:
+        with borrow_cursor(self.connection) as cur:
+
+            for number in range(len(self.queries)):
+                yield from self._fetch(cur, number)
+
+    def _query_worker(self, pending: queue.SimpleQueue):
+        with borrow_or_connect(self.connection, self.connection_factory) as connection:
+            yield from self._run_pending(connection, pending)
 
-            for query in self.queries:
-                # TODO: Isoler IO
-                cur.execute(query)
+    def _run_pending(self, connection, pending: queue.SimpleQueue):
+        with connection.cursor() as cur:
+            while True:
+                try:
+                    number = pending.get_nowait()
+                except queue.Empty:
+                    return
+                yield from self._fetch(cur, number)
+
+    def _fetch(self, cur, number: int) -> Generator[list[tuple], Any, None]:
+        query, parameters = self.queries[number], self.parameters[number]
+        result = {"number": number, "start": datetime.now(), "rows": 0}
+        if self.fetch_policy is not None:
+            batches = fetch_batches(
+                cur, query, copy.copy(self.fetch_policy), parameters
+            )
+        else:
+            batches = self._fetchmany(cur, query, parameters)
+        for data in batches:
+            result["rows"] = result["rows"] + len(data)
+            yield data
+        result["stop"] = datetime.now()
+        self.query_results[number] = result
+
+    @staticmethod
+    def _fetchmany(cur, query: str, parameters=None):
+        # TODO: Isoler IO
+        execute(cur, query, parameters)
 
-                while True:
-                    # TODO: Isoler IO
-                    data = cur.fetchmany(10000)
+        while True:
+            # TODO: Isoler IO
+            data = cur.fetchmany(10000)
 
-                    if len(data) == 0:
-                        break
-                    yield data
+            if len(data) == 0:
+                break
+            yield data
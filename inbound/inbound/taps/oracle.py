@@ -1,11 +1,25 @@
-from typing import Any, Generator
+import copy
+import math
+from typing import Any, Callable, Generator, Union
 
-from oracledb import Connection
+from oracledb import Connection, DatabaseError
 
+from ..core.arrow import to_arrow_table
+from ..core.connection_pool import (
+    ConnectionPool,
+    borrow,
+    borrow_cursor,
+    borrow_or_connect,
+    check_parallel_connections,
+)
+from ..core.description_cache import description_cache, description_from_cursor
+from ..core.fetch_policy import FetchPolicy, execute, fetch_batches
+from ..core.highwatermark_planner import CoalescingPlanner
 from ..core.models import Description
+from ..core.prefetch import interleave
 from ..sdk.highwatermark import Highwatermark
 from ..sdk.tap import Tap
-from ..sdk.utils import get_query_list
+from ..sdk.utils import get_bind_parameters, get_bind_query, get_query_list
 
 #
 # select tbl.*,
@@ -24,15 +38,115 @@ from ..sdk.utils import get_query_list
 #
 
 
+PARTITION_METHODS = ("ora_hash", "range")
+FETCH_MODES = ("tuples", "arrow")
+
+
+def ora_hash_partition_queries(query: str, key: str, partitions: int) -> list[str]:
+    # ora_hash(null) er null, så rader uten nøkkel legges i første partisjon
+    queries = []
+    for i in range(partitions):
+        condition = f"ora_hash({key}, {partitions - 1}) = {i}"
+        if i == 0:
+            condition = f"{condition} or {key} is null"
+        queries.append(f"select * from ({query}) where {condition}")
+    return queries
+
+
+def range_partition_queries(
+    query: str, key: str, partitions: int, min_value: int, max_value: int
+) -> list[str]:
+    # Første partisjon er åpen nedover og siste oppover, så ingen rader
+    # faller utenfor grensene selv om nøkkelen ikke er et heltall
+    if partitions == 1:
+        return [query]
+    queries = []
+    step = (max_value - min_value + 1) / partitions
+    bounds = [min_value + int(step * i) for i in range(partitions)]
+    for i, lower in enumerate(bounds):
+        if i == 0:
+            condition = f"{key} < {bounds[i + 1]}"
+        elif i == len(bounds) - 1:
+            condition = f"{key} >= {lower} or {key} is null"
+        else:
+            condition = f"{key} >= {lower} and {key} < {bounds[i + 1]}"
+        queries.append(f"select * from ({query}) where {condition}")
+    return queries
+
+
 class OraTap(Tap):
     def __init__(
-        self, connection: Connection, query: str, highwatermark: Highwatermark = None
+        self,
+        connection: Union[Connection, ConnectionPool],
+        query: str,
+        highwatermark: Highwatermark = None,
+        partitions: int = 1,
+        partition_by: str = "ora_hash",
+        partition_key: str = None,
+        connection_factory: Callable[[], Connection] = None,
+        max_buffered_batches: int = 8,
+        fetch_mode: str = "tuples",
+        batch_size: int = 10000,
+        fetch_policy: FetchPolicy = None,
+        bind_highwatermarks: bool = False,
+        description_source: str = None,
+        highwatermark_planner: CoalescingPlanner = None,
     ):
+        if fetch_mode not in FETCH_MODES:
+            raise ValueError(f"fetch_mode must be one of {FETCH_MODES}")
+        if partitions > 1:
+            if partition_by not in PARTITION_METHODS:
+                raise ValueError(f"partition_by must be one of {PARTITION_METHODS}")
+            if partition_key is None:
+                raise ValueError("partition_key is required when partitions > 1")
+            check_parallel_connections(connection, connection_factory, "partitions > 1")
         self.connection = connection
         self.query = query
         self.highwatermark = highwatermark
+        self.partitions = partitions
+        self.partition_by = partition_by
+        self.partition_key = partition_key
+        self.connection_factory = connection_factory
+        self.max_buffered_batches = max_buffered_batches
+        self.fetch_mode = fetch_mode
+        self.batch_size = batch_size
+        self.fetch_policy = fetch_policy
+        self.bind_highwatermarks = bind_highwatermarks
+        # Navn på kilden (f.eks. dsn) som beskrivelsene caches under. Uten
+        # navn caches ingenting, siden samme spørring kan gi ulike kolonner
+        # i ulike databaser.
+        self.description_source = description_source
+        self.highwatermark_planner = highwatermark_planner
 
     def column_descriptions(self) -> list[Description]:
+        describe_query = self._describe_query()
+        if self.description_source is not None:
+            cached = description_cache.get(self.description_source, describe_query)
+            if cached is not None:
+                return cached
+        try:
+            column_descriptions = self._parse_column_descriptions(describe_query)
+        except DatabaseError as e:
+            print(f"could not parse query, describing with where 1=2: {e}")
+            column_descriptions = self._execute_column_descriptions()
+        if self.description_source is not None:
+            description_cache.put(
+                self.description_source, describe_query, column_descriptions
+            )
+        return column_descriptions
+
+    def _describe_query(self) -> str:
+        if self.bind_highwatermarks:
+            return get_bind_query(self.query, paramstyle="named")[0]
+        return get_query_list(self.query, [{}])[0]
+
+    def _parse_column_descriptions(self, query: str) -> list[Description]:
+        # parse() beskriver spørringen uten å kjøre den
+        with borrow_cursor(self.connection) as cur:
+            cur.parse(query)
+            return description_from_cursor(cur.description)
+
+    def _execute_column_descriptions(self) -> list[Description]:
         query = self.query
         q_lowercase_where = query.replace("WHERE", "where")
         query_split = q_lowercase_where.split(sep="where", maxsplit=1)
@@ -62,39 +176,128 @@ class OraTap(Tap):
 
         print(f"desc_query: {desc_query}")
 
-        column_descriptions = []
         # TODO: Isoler IO
-        with self.connection.cursor() as cur:
+        with borrow_cursor(self.connection) as cur:
             cur.execute(desc_query)
+            return description_from_cursor(cur.description)
 
-            for col in cur.description:
-                column_descriptions.append(
-                    Description(
-                        name=col[0],
-                        type=str(col[1]),
-                        precision=col[4],
-                        scale=col[5],
-                        nullable=col[6],
-                    )
-                )
-        return column_descriptions
-
-    def data_generator(self) -> Generator[list[tuple], Any, None]:
-        queries = [self.query]
+    def statements(self) -> list[tuple[str, Any]]:
+        # (spørring, bind-parametre). Uten bind_highwatermarks rendres én
+        # spørring per highwatermark, og parametrene er None.
+        highwatermark_list = [{}]
         if self.highwatermark is not None:
             highwatermark_list = self.highwatermark.generate_query_list()
-            queries = get_query_list(self.query, highwatermark_list)
+            if self.highwatermark_planner is not None:
+                highwatermark_list = self.highwatermark_planner.plan(highwatermark_list)
+        if self.bind_highwatermarks:
+            query, names = get_bind_query(self.query, paramstyle="named")
+            if self.highwatermark is None:
+                return [(query, None)]
+            parameter_list = get_bind_parameters(names, highwatermark_list)
+            return [(query, bind_parameters) for bind_parameters in parameter_list]
+        if self.highwatermark is None:
+            return [(self.query, None)]
+        queries = get_query_list(self.query, highwatermark_list)
+        return [(query, None) for query in queries]
+
+    def data_generator(self) -> Generator[list[tuple], Any, None]:
+        statements = self.statements()
+
+        if self.partitions > 1:
+            for query, parameters in statements:
+                yield from interleave(
+                    [
+                        self._partition_generator(partition_query, parameters)
+                        for partition_query in self.partition_queries(query, parameters)
+                    ],
+                    max_batches=self.max_buffered_batches,
+                )
+            return
+
+        if self.fetch_mode == "arrow":
+            with borrow(self.connection) as connection:
+                for query, parameters in statements:
+                    yield from self._fetch_arrow(connection, query, parameters)
+            return
+
+        # TODO: Isoler IO
+        with borrow_cursor(self.connection) as cur:
+
+            # Med bind-parametre kjøres samme spørring på samme cursor, så
+            # Oracle kan gjenbruke den parsede spørringen
+            for query, parameters in statements:
+                yield from self._fetch(cur, query, parameters)
+
+    def partition_queries(self, query: str, parameters=None) -> list[str]:
+        if self.partition_by == "range":
+            with borrow_cursor(self.connection) as cur:
+                execute(
+                    cur,
+                    f"select min({self.partition_key}), max({self.partition_key}) "
+                    f"from ({query})",
+                    parameters,
+                )
+                min_value, max_value = cur.fetchone()
+            if min_value is None:
+                return [query]
+            return range_partition_queries(
+                query=query,
+                key=self.partition_key,
+                partitions=self.partitions,
+                min_value=math.floor(min_value),
+                max_value=math.ceil(max_value),
+            )
+        return ora_hash_partition_queries(
+            query=query, key=self.partition_key, partitions=self.partitions
+        )
+
+    def _partition_generator(
+        self, query: str, parameters=None
+    ) -> Generator[list[tuple], Any, None]:
+        # Hver partisjon leses på sin egen tilkobling
+        with borrow_or_connect(self.connection, self.connection_factory) as connection:
+            yield from self._fetch_partition(connection, query, parameters)
+
+    def _fetch_partition(
+        self, connection: Connection, query: str, parameters=None
+    ) -> Generator[list[tuple], Any, None]:
+        if self.fetch_mode == "arrow":
+            yield from self._fetch_arrow(connection, query, parameters)
+            return
+        with connection.cursor() as cur:
+            yield from self._fetch(cur, query, parameters)
+
+    def _fetch(
+        self, cur, query: str, parameters=None
+    ) -> Generator[list[tuple], Any, None]:
+        if self.fetch_policy is not None:
+            # Egen kopi per kall så parallelle partisjoner ikke deler tilstand
+            yield from fetch_batches(
+                cur, query, copy.copy(self.fetch_policy), parameters
+            )
+            return
+
         # TODO: Isoler IO
-        with self.connection.cursor() as cur:
+        execute(cur, query, parameters)
 
-            for query in queries:
-                # TODO: Isoler IO
-                cur.execute(query)
+        while True:
+            # TODO: Isoler IO
+            data = cur.fetchmany(self.batch_size)
 
-                while True:
-                    # TODO: Isoler IO
-                    data = cur.fetchmany(10000)
+            if len(data) == 0:
+                break
+            yield data
 
-                    if len(data) == 0:
-                        break
-                    yield data
+    def _fetch_arrow(self, connection: Connection, query: str, parameters=None):
+        # Driveren bygger Arrow-kolonner direkte, uten et Python-objekt per verdi.
+        # Krever python-oracledb med fetch_df_batches og pyarrow.
+        kwargs = {}
+        if parameters is not None:
+            kwargs["parameters"] = parameters
+        for df in connection.fetch_df_batches(
+            statement=query, size=self.batch_size, **kwargs
+        ):
+            table = to_arrow_table(df)
+            if table.num_rows == 0:
+                continue
+            yield table
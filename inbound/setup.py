@@ -42,6 +42,15 @@ setup(
         "mainmanager": [
             "requests",
         ],
+        "parquet": [
+            "pyarrow",
+        ],
+        "zstd": [
+            "zstandard",
+        ],
+        "orjson": [
+            "orjson",
+        ],
         "dev": [
             "black",
             "isort",
@@ -1,14 +1,22 @@
+import tempfile
+import threading
 import time
 from unittest import TestCase
 from unittest.mock import MagicMock
 
 import requests
 
+from inbound.core.chunk_cache import ChunkCache
+from inbound.core.job import Job
 from inbound.core.models import Description
+from inbound.sdk.sink import Sink
 from inbound.taps.anaplan import (
     AnaplanAuthException,
+    AnaplanExportException,
+    AnaplanExportTimeout,
     AnaplanIntegrationService,
     AnaplanTap,
+    PollingPolicy,
 )
 
 
@@ -201,3 +209,332 @@ class TestAnaplan(TestCase):
             ),
         ]
         assert result == expected
+
+
+def token_response(token_value: str, expires_at: float, status_code: int = 201):
+    response = requests.Response()
+    response.status_code = status_code
+    response.json = MagicMock(
+        return_value={
+            "tokenInfo": {"tokenValue": token_value, "expiresAt": expires_at * 1000}
+        }
+    )
+    return response
+
+
+class FakeSession:
+    def __init__(self, tokens, api_status_codes=()):
+        self.tokens = list(tokens)
+        self.api_status_codes = list(api_status_codes)
+        self.posts = []
+        self.requests = []
+
+    def post(self, url, headers, data=None):
+        self.posts.append(url)
+        return self.tokens.pop(0)
+
+    def request(self, method, url, headers, data=None):
+        self.requests.append(headers["Authorization"])
+        response = requests.Response()
+        response.status_code = (
+            self.api_status_codes.pop(0) if self.api_status_codes else 200
+        )
+        response._content = b"{}"
+        return response
+
+
+def service(session):
+    return AnaplanIntegrationService(
+        workspaceID="",
+        modelID="",
+        exportID="",
+        fileID="",
+        username="",
+        password="",
+        session=session,
+    )
+
+
+class TestAnaplanToken(TestCase):
+    def test_token_is_reused_until_close_to_expiry(self):
+        session = FakeSession([token_response("foo", time.time() + 3600)])
+        integration_service = service(session)
+        for chunkID in range(5):
+            integration_service.file_chunk(chunkID=chunkID)
+        assert session.posts == [integration_service.auth_url]
+        assert session.requests == ["AnaplanAuthToken foo"] * 5
+
+    def test_token_is_refreshed_before_it_expires(self):
+        session = FakeSession(
+            [
+                token_response("foo", time.time() + 60),
+                token_response("bar", time.time() + 3600),
+            ]
+        )
+        integration_service = service(session)
+        integration_service.export_information()
+        integration_service.export_information()
+        assert session.posts == [
+            integration_service.auth_url,
+            integration_service.refresh_url,
+        ]
+        assert session.requests == ["AnaplanAuthToken foo", "AnaplanAuthToken bar"]
+
+    def test_unauthorized_response_logs_in_again(self):
+        session = FakeSession(
+            [
+                token_response("foo", time.time() + 3600),
+                token_response("bar", time.time() + 3600),
+            ],
+            api_status_codes=[401],
+        )
+        integration_service = service(session)
+        integration_service.number_of_file_chunks()
+        assert session.requests == ["AnaplanAuthToken foo", "AnaplanAuthToken bar"]
+
+
+class ChunkedExport(DummyIntegrationService):
+    def __init__(self, chunks, delay=0.0):
+        super().__init__()
+        self.chunks = chunks
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def number_of_file_chunks(self):
+        return {"chunks": [{"id": str(i)} for i in range(len(self.chunks))]}
+
+    def file_chunk(self, chunkID):
+        with self.lock:
+            self.running = self.running + 1
+            self.max_running = max(self.max_running, self.running)
+        # Siste chunk er raskest, så rekkefølgen må gjenopprettes
+        time.sleep(self.delay * (len(self.chunks) - int(chunkID)))
+        with self.lock:
+            self.running = self.running - 1
+        return self.chunks[int(chunkID)]
+
+
+def chunked_tap(integration_service, **kwargs):
+    return AnaplanTap(
+        workspaceID="",
+        modelID="",
+        exportID="",
+        fileID="",
+        username="",
+        password="",
+        integration_service=integration_service,
+        **kwargs,
+    )
+
+
+class TestAnaplanChunks(TestCase):
+    def test_chunks_are_downloaded_concurrently_and_parsed_in_order(self):
+        content = "header\n" + "".join(f"row{i}\n" for i in range(20))
+        data = content.encode("utf-8")
+        chunks = [data[i : i + 7] for i in range(0, len(data), 7)]
+        integration_service = ChunkedExport(chunks, delay=0.005)
+        tap = chunked_tap(integration_service, download_workers=3, batch_size=8)
+        result = list(tap.data_generator())
+        assert [len(data) for data in result] == [8, 8, 4]
+        assert [row for data in result for row in data] == [
+            (f"row{i}",) for i in range(20)
+        ]
+        assert 1 < integration_service.max_running <= 3
+
+    def test_characters_and_quoted_fields_split_across_chunks(self):
+        data = 'header\n"æ\nø",å\n'.encode("utf-8")
+        chunks = [data[i : i + 1] for i in range(len(data))]
+        tap = chunked_tap(ChunkedExport(chunks))
+        result = list(tap.data_generator())
+        assert result == [[("æ\nø", "å")]]
+
+    def test_last_line_without_newline(self):
+        tap = chunked_tap(ChunkedExport([b"header\nfirst\nsec", b"ond"]))
+        result = list(tap.data_generator())
+        assert result == [[("first",), ("second",)]]
+
+
+class PollingExport(DummyIntegrationService):
+    def __init__(self, exportID, polls_until_complete, rows, progress=None):
+        super().__init__()
+        self.exportID = exportID
+        self.polls_until_complete = polls_until_complete
+        self.rows = rows
+        self.progress = progress or []
+        self.polls = 0
+
+    def export_task_status(self, taskID):
+        self.polls = self.polls + 1
+        if self.polls > self.polls_until_complete:
+            return {"task": {"taskState": "COMPLETE", "result": {"successful": True}}}
+        progress = self.progress[self.polls - 1] if self.progress else 0.0
+        return {"task": {"taskState": "IN_PROGRESS", "progress": progress}}
+
+    def file_chunk(self, chunkID):
+        return ("header\n" + "".join(f"{row}\n" for row in self.rows)).encode()
+
+
+fast_polling = PollingPolicy(initial_delay=0.001, max_delay=0.004, jitter=0.0)
+
+
+class TestAnaplanPolling(TestCase):
+    def test_delay_grows_exponentially_up_to_max_delay(self):
+        policy = PollingPolicy(initial_delay=1, max_delay=5, multiplier=2, jitter=0)
+        assert [policy.delay(attempt) for attempt in range(5)] == [1, 2, 4, 5, 5]
+
+    def test_jitter_only_adds_to_delay(self):
+        policy = PollingPolicy(initial_delay=1, max_delay=5, jitter=0.5)
+        delays = [policy.delay(0) for _ in range(50)]
+        assert all(1 <= delay <= 1.5 for delay in delays)
+
+    def test_no_deadline_by_default(self):
+        assert PollingPolicy().deadline_seconds is None
+
+    def test_raises_when_deadline_is_exceeded(self):
+        policy = PollingPolicy(initial_delay=0.01, jitter=0, deadline_seconds=0.05)
+        tap = chunked_tap(PollingExport("a", 1000, ["row"]), polling_policy=policy)
+        with self.assertRaises(AnaplanExportTimeout):
+            list(tap.data_generator())
+
+    def test_raises_when_export_fails(self):
+        class Failing(DummyIntegrationService):
+            def export_task_status(self, taskID):
+                return {
+                    "task": {"taskState": "COMPLETE", "result": {"successful": False}}
+                }
+
+        tap = chunked_tap(Failing(), polling_policy=fast_polling)
+        with self.assertRaises(AnaplanExportException):
+            list(tap.data_generator())
+
+    def test_progress_is_reported(self):
+        reported = []
+        integration_service = PollingExport("a", 2, ["row"], progress=[0.25, 0.5])
+        tap = chunked_tap(
+            integration_service,
+            polling_policy=fast_polling,
+            progress_callback=reported.append,
+        )
+        assert list(tap.data_generator()) == [[("row",)]]
+        assert reported == [0.25, 0.5, 1.0]
+
+    def test_parallel_exports_are_consumed_as_they_complete(self):
+        slow = PollingExport("slow", 3, ["slow"])
+        fast = PollingExport("fast", 1, ["fast"])
+        reported = []
+        tap = chunked_tap(
+            slow, polling_policy=fast_polling, progress_callback=reported.append
+        )
+        tap.integration_services = [slow, fast]
+        result = list(tap.data_generator())
+        assert result == [[("fast",), ("slow",)]]
+        assert reported == [0.0, 0.5, 0.5, 1.0]
+
+    def test_parallel_exports_share_session(self):
+        integration_service = AnaplanIntegrationService(
+            workspaceID="w",
+            modelID="m",
+            exportID="e1",
+            fileID="f1",
+            username="",
+            password="",
+        )
+        tap = chunked_tap(integration_service, parallel_exports=[("e2", "f2")])
+        second = tap.integration_services[1]
+        assert (second.exportID, second.fileID) == ("e2", "f2")
+        assert second.session is integration_service.session
+
+
+class FailingChunkExport(ChunkedExport):
+    def __init__(self, chunks, fail_at=None):
+        super().__init__(chunks)
+        self.fail_at = fail_at
+        self.triggered = 0
+        self.downloaded = []
+
+    def trigger_export_task(self):
+        self.triggered = self.triggered + 1
+        return {"task": {"taskId": f"task{self.triggered}"}}
+
+    def export_information(self):
+        return {"exportMetadata": {"headerNames": ["header"], "dataTypes": ["TEXT"]}}
+
+    def file_chunk(self, chunkID):
+        if chunkID == self.fail_at:
+            raise requests.ConnectionError("broken")
+        self.downloaded.append(chunkID)
+        return super().file_chunk(chunkID)
+
+
+class RowSink(Sink):
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def ingest(self, data_generator, column_description):
+        rows = [row for data in data_generator for row in data]
+        if self.fail:
+            raise ValueError("sink failed")
+        return rows
+
+
+class TestAnaplanChunkCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.chunks = [b"header\n", b"first\n", b"second\n", b"third\n"]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_retry_reuses_task_and_downloads_only_missing_chunks(self):
+        failing = FailingChunkExport(self.chunks, fail_at="2")
+        tap = chunked_tap(
+            failing, download_workers=1, chunk_cache=ChunkCache(self.tmp_dir.name)
+        )
+        with self.assertRaises(requests.ConnectionError):
+            list(tap.data_generator())
+        assert failing.downloaded == ["0", "1"]
+
+        retry = FailingChunkExport(self.chunks)
+        tap = chunked_tap(retry, chunk_cache=ChunkCache(self.tmp_dir.name))
+        result = list(tap.data_generator())
+        assert result == [[("first",), ("second",), ("third",)]]
+        assert retry.triggered == 0
+        assert sorted(retry.downloaded) == ["2", "3"]
+
+    def test_expired_cache_starts_new_export(self):
+        export = FailingChunkExport(self.chunks)
+        cache = ChunkCache(self.tmp_dir.name, ttl_seconds=0)
+        tap = chunked_tap(export, chunk_cache=cache)
+        list(tap.data_generator())
+        list(tap.data_generator())
+        assert export.triggered == 2
+
+    def test_successful_load_starts_new_export_next_run(self):
+        export = FailingChunkExport(self.chunks)
+        tap = chunked_tap(export, chunk_cache=ChunkCache(self.tmp_dir.name))
+        with self.assertRaises(ValueError):
+            Job(tap=tap, sink=RowSink(fail=True)).run()
+        # Ny kjøring etter feil gjenbruker eksporten
+        Job(tap=tap, sink=RowSink()).run()
+        assert export.triggered == 1
+        # Etter en vellykket lasting startes en ny eksport
+        result = Job(tap=tap, sink=RowSink()).run()
+        assert export.triggered == 2
+        assert result["batches"] == [("first",), ("second",), ("third",)]
+
+    def test_failed_chunk_download_is_not_cached(self):
+        session = FakeSession(
+            [token_response("foo", time.time() + 3600)], api_status_codes=[500]
+        )
+        integration_service = service(session)
+        cache = ChunkCache(self.tmp_dir.name)
+        tap = chunked_tap(integration_service, chunk_cache=cache)
+        key = tap._cache_key(integration_service)
+        cache.start(key, "task")
+        with self.assertRaises(requests.HTTPError):
+            tap._file_chunk(integration_service, "task", "0")
+        assert cache.get(key, "task", "0") is None
+        assert tap._file_chunk(integration_service, "task", "0") == b"{}"
+        assert cache.get(key, "task", "0") == b"{}"
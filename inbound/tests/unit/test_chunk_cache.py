@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from inbound.core.chunk_cache import ChunkCache
+
+key = ("workspace", "model", "export", "file")
+
+
+class TestChunkCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ChunkCache(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_chunks_are_stored_per_task(self):
+        self.cache.start(key, "task1")
+        self.cache.put(key, "task1", "0", b"data")
+        assert self.cache.task(key) == "task1"
+        assert self.cache.get(key, "task1", "0") == b"data"
+        assert self.cache.get(key, "task1", "1") is None
+        assert self.cache.get(key, "task2", "0") is None
+
+    def test_new_task_replaces_old_chunks(self):
+        self.cache.start(key, "task1")
+        self.cache.put(key, "task1", "0", b"data")
+        self.cache.start(key, "task2")
+        assert self.cache.task(key) == "task2"
+        assert self.cache.get(key, "task1", "0") is None
+
+    def test_same_task_keeps_chunks(self):
+        self.cache.start(key, "task1")
+        self.cache.put(key, "task1", "0", b"data")
+        self.cache.start(key, "task1")
+        assert self.cache.get(key, "task1", "0") == b"data"
+
+    def test_corrupt_chunk_is_discarded(self):
+        self.cache.start(key, "task1")
+        self.cache.put(key, "task1", "0", b"data")
+        path = os.path.join(self.cache._task_directory(key, "task1"), "0")
+        with open(path, "wb") as f:
+            f.write(b"dat")
+        assert self.cache.get(key, "task1", "0") is None
+        assert not os.path.exists(path)
+
+    def test_chunk_ids_are_stored_with_task(self):
+        self.cache.start(key, "task1")
+        assert self.cache.chunk_ids(key, "task1") is None
+        self.cache.set_chunk_ids(key, "task1", ["0", "1"])
+        assert self.cache.chunk_ids(key, "task1") == ["0", "1"]
+        assert self.cache.chunk_ids(key, "task2") is None
+
+    def test_expired_tasks_are_evicted(self):
+        cache = ChunkCache(self.tmp_dir.name, ttl_seconds=0.05)
+        cache.start(key, "task1")
+        cache.put(key, "task1", "0", b"data")
+        time.sleep(0.1)
+        assert cache.task(key) is None
+        cache.evict()
+        assert os.listdir(self.tmp_dir.name) == []
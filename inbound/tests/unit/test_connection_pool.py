@@ -0,0 +1,169 @@
+import threading
+import time
+from unittest import TestCase
+
+from inbound.core.connection_pool import (
+    ConnectionPool,
+    borrow,
+    borrow_cursor,
+    borrow_or_connect,
+    check_parallel_connections,
+    close_pools,
+    get_pool,
+)
+from inbound.highwatermarks.oracle import OraHighwatermark
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = [("ID",), ("NAME",)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def execute(self, query):
+        if self.connection.broken:
+            raise ConnectionError("broken")
+        self.connection.queries.append(query)
+
+    def fetchall(self):
+        return [(1, "a")]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.broken = False
+        self.closed = False
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+class CountingConnect:
+    def __init__(self):
+        self.connections = []
+
+    def __call__(self):
+        self.connections.append(FakeConnection())
+        return self.connections[-1]
+
+
+class TestConnectionPool(TestCase):
+    def test_connections_are_reused(self):
+        connect = CountingConnect()
+        pool = ConnectionPool(connect=connect)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+        assert first is second
+        assert len(connect.connections) == 1
+
+    def test_idle_connections_are_evicted(self):
+        connect = CountingConnect()
+        pool = ConnectionPool(connect=connect, max_idle_seconds=0)
+        with pool.connection() as first:
+            pass
+        time.sleep(0.01)
+        with pool.connection() as second:
+            pass
+        assert first is not second
+        assert first.closed
+
+    def test_unhealthy_connections_are_replaced(self):
+        connect = CountingConnect()
+        pool = ConnectionPool(connect=connect, health_check_interval=0)
+        with pool.connection() as first:
+            pass
+        first.broken = True
+        with pool.connection() as second:
+            pass
+        assert first is not second
+        assert first.closed
+        assert len(connect.connections) == 2
+
+    def test_acquire_waits_for_a_free_connection(self):
+        pool = ConnectionPool(connect=CountingConnect(), max_size=1)
+        first = pool.acquire()
+        threading.Timer(0.05, pool.release, args=(first,)).start()
+        second = pool.acquire()
+        assert first is second
+
+    def test_acquire_times_out_when_pool_is_exhausted(self):
+        pool = ConnectionPool(
+            connect=CountingConnect(), max_size=1, acquire_timeout=0.01
+        )
+        pool.acquire()
+        with self.assertRaises(TimeoutError):
+            pool.acquire()
+
+    def test_close_closes_idle_connections(self):
+        connect = CountingConnect()
+        pool = ConnectionPool(connect=connect)
+        with pool.connection():
+            pass
+        pool.close()
+        assert connect.connections[0].closed
+        with self.assertRaises(RuntimeError):
+            pool.acquire()
+
+
+class TestBorrow(TestCase):
+    def test_borrow_passes_plain_connections_through(self):
+        connection = FakeConnection()
+        with borrow(connection) as borrowed:
+            assert borrowed is connection
+
+    def test_borrow_cursor_from_pool(self):
+        connect = CountingConnect()
+        pool = ConnectionPool(connect=connect)
+        with borrow_cursor(pool) as cursor:
+            cursor.execute("select 2")
+        assert connect.connections[0].queries == ["select 2"]
+        assert len(pool.idle) == 1
+
+    def test_borrow_or_connect_closes_new_connections(self):
+        connect = CountingConnect()
+        with borrow_or_connect(FakeConnection(), connect) as borrowed:
+            assert borrowed is connect.connections[0]
+            assert not borrowed.closed
+        assert borrowed.closed
+
+    def test_borrow_or_connect_returns_pooled_connections(self):
+        connect = CountingConnect()
+        pool = ConnectionPool(connect=connect)
+        with borrow_or_connect(pool) as borrowed:
+            assert borrowed is connect.connections[0]
+        assert not borrowed.closed
+        assert len(pool.idle) == 1
+
+    def test_parallel_connections_require_factory_or_pool(self):
+        check_parallel_connections(FakeConnection(), CountingConnect(), "x")
+        check_parallel_connections(ConnectionPool(connect=CountingConnect()), None, "x")
+        with self.assertRaises(ValueError):
+            check_parallel_connections(FakeConnection(), None, "x")
+
+    def test_get_pool_returns_one_pool_per_name(self):
+        first = get_pool("foo", lambda: ConnectionPool(connect=CountingConnect()))
+        second = get_pool("foo", lambda: ConnectionPool(connect=CountingConnect()))
+        assert first is second
+        close_pools()
+        assert first.closed
+
+
+class TestOraHighwatermark(TestCase):
+    def test_generate_query_list_from_pool(self):
+        pool = ConnectionPool(connect=CountingConnect())
+        highwatermark = OraHighwatermark(connection=pool, query="select")
+        assert highwatermark.generate_query_list() == [{"ID": 1, "NAME": "a"}]
@@ -3,6 +3,8 @@ import datetime
 import io
 from unittest import TestCase
 
+import pyarrow as pa
+
 from inbound.core.models import Description
 from inbound.sinks.csv import CsvSink
 
@@ -30,3 +32,21 @@ class TestCsvIngest(TestCase):
             expected = "foo\r\n1\r\n2\r\n"
             result = f.getvalue()
             assert expected == result
+
+    def test_csv_ingest_arrow_batches_as_rows(self):
+        with io.StringIO(newline="") as f:
+
+            def gen():
+                yield pa.table({"a": [1, 2], "b": ["x", "y"]})
+                yield [(3, "z")]
+
+            desc = [
+                Description(
+                    name=name, type=None, precision=None, scale=None, nullable=True
+                )
+                for name in ("a", "b")
+            ]
+            sink = CsvSink(csv_writer=csv.writer(f))
+            sink.ingest(data_generator=gen(), column_description=desc)
+
+            assert f.getvalue() == "a,b\r\n1,x\r\n2,y\r\n3,z\r\n"
@@ -0,0 +1,50 @@
+import time
+from unittest import TestCase
+
+from inbound.core.description_cache import DescriptionCache
+from inbound.core.models import Description
+
+descriptions = [
+    Description(name="a", type="number", precision=38, scale=0, nullable=True)
+]
+
+
+class TestDescriptionCache(TestCase):
+    def test_cached_descriptions_are_returned_as_copies(self):
+        cache = DescriptionCache()
+        cache.put("db", "select a from t", descriptions)
+        first = cache.get("db", "select a from t")
+        first.append(descriptions[0])
+        first[0].name = "b"
+        assert cache.get("db", "select a from t") == descriptions
+
+    def test_cache_is_keyed_by_source_and_query(self):
+        cache = DescriptionCache()
+        cache.put("db", "select a from t", descriptions)
+        assert cache.get("other", "select a from t") is None
+        assert cache.get("db", "select b from t") is None
+
+    def test_entries_expire(self):
+        cache = DescriptionCache(ttl_seconds=0)
+        cache.put("db", "select a from t", descriptions)
+        time.sleep(0.01)
+        assert cache.get("db", "select a from t") is None
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = DescriptionCache(max_entries=2)
+        cache.put("db", "q1", descriptions)
+        cache.put("db", "q2", descriptions)
+        cache.get("db", "q1")
+        cache.put("db", "q3", descriptions)
+        assert cache.get("db", "q1") is not None
+        assert cache.get("db", "q2") is None
+
+    def test_invalidate_source(self):
+        cache = DescriptionCache()
+        cache.put("db", "q1", descriptions)
+        cache.put("db", "q2", descriptions)
+        cache.put("other", "q1", descriptions)
+        cache.invalidate(source="db")
+        assert cache.get("db", "q1") is None
+        assert cache.get("db", "q2") is None
+        assert cache.get("other", "q1") is not None
@@ -0,0 +1,45 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from io import StringIO
+from unittest import TestCase
+
+from inbound.core.encoders import RawEncoder, to_json_value
+
+
+class TestRawEncoder(TestCase):
+    def test_encode_matches_json_dumps_with_default_str(self):
+        row = (1, "foo", 1.5, datetime(2020, 1, 1), Decimal("1.50"), None, True)
+        names = ["a", "b", "c", "d", "e", "f", "g"]
+        result = RawEncoder(names=names).encode(row)
+        expected = json.dumps(dict(zip(names, row)), default=str)
+        assert result == expected
+
+    def test_columns_that_are_none_in_first_row_are_converted(self):
+        encoder = RawEncoder(names=["a"])
+        encoder.encode((None,))
+        result = encoder.encode((date(2020, 1, 1),))
+        expected = '{"a": "2020-01-01"}'
+        assert result == expected
+
+    def test_unexpected_types_in_native_columns_are_converted(self):
+        encoder = RawEncoder(names=["a"])
+        encoder.encode((1,))
+        result = encoder.encode((Decimal("2"),))
+        expected = '{"a": "2"}'
+        assert result == expected
+
+    def test_lob_is_read(self):
+        result = RawEncoder(names=["a"]).encode((StringIO("clob"),))
+        expected = '{"a": "clob"}'
+        assert result == expected
+
+    def test_fast_json_produces_equivalent_json(self):
+        row = (1, "foo", datetime(2020, 1, 1), Decimal("1.50"), 10**30)
+        names = ["a", "b", "c", "d", "e"]
+        result = RawEncoder(names=names, fast_json=True).encode(row)
+        expected = json.dumps(dict(zip(names, row)), default=str)
+        assert json.loads(result) == json.loads(expected)
+
+    def test_bytes_are_hex_encoded(self):
+        assert to_json_value(b"\x01\xff") == "01ff"
@@ -0,0 +1,62 @@
+from unittest import TestCase
+
+from inbound.core.fetch_policy import FetchPolicy, fetch_batches
+
+
+def column(internal_size):
+    return ("col", str, None, internal_size, None, None, True)
+
+
+class FakeCursor:
+    def __init__(self, rows, description):
+        self.rows = rows
+        self.description = description
+        self.arraysize = 1
+        self.prefetchrows = 2
+        self.fetch_sizes = []
+
+    def execute(self, query):
+        self.result = list(self.rows)
+
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        data, self.result = self.result[:size], self.result[size:]
+        return data
+
+
+class TestFetchPolicy(TestCase):
+    def test_narrow_tables_fetch_more_rows_than_wide_tables(self):
+        narrow = FetchPolicy(target_bytes=1024 * 1024, max_rows=1000000)
+        wide = FetchPolicy(target_bytes=1024 * 1024, max_rows=1000000)
+        narrow_rows = narrow.estimate([column(22)] * 3)
+        wide_rows = wide.estimate([column(4000)] * 300)
+        assert narrow_rows > wide_rows
+        assert wide_rows == wide.min_rows
+
+    def test_columns_without_size_use_unknown_column_bytes(self):
+        policy = FetchPolicy(target_bytes=1000 * 100, min_rows=1)
+        rows = policy.estimate([column(None)])
+        assert rows == 100000 // (policy.unknown_column_bytes + 56)
+
+    def test_observed_batches_adjust_rows(self):
+        policy = FetchPolicy(target_bytes=1024 * 1024, smoothing=1.0, min_rows=1)
+        policy.estimate([column(4000)])
+        before = policy.rows
+        after = policy.observe([(1,)] * 10)
+        assert after > before
+
+    def test_rows_are_clamped(self):
+        policy = FetchPolicy(target_bytes=1024 * 1024 * 1024, max_rows=500)
+        assert policy.estimate([column(1)]) == 500
+
+    def test_fetch_batches_sets_driver_sizes_and_yields_all_rows(self):
+        rows = [(i,) for i in range(1000)]
+        cursor = FakeCursor(rows, [column(22)])
+        policy = FetchPolicy(target_bytes=100 * 78, min_rows=10)
+        result = [
+            row for data in fetch_batches(cursor, "select", policy) for row in data
+        ]
+        assert result == rows
+        assert cursor.arraysize == policy.rows
+        assert cursor.prefetchrows == policy.rows
+        assert cursor.fetch_sizes[0] == 100
@@ -1,6 +1,12 @@
 from unittest import TestCase
 
-from inbound.sdk.utils import get_query_list
+from inbound.sdk.utils import (
+    compile_template,
+    get_bind_parameters,
+    get_bind_query,
+    get_query_list,
+    render_all,
+)
 
 
 class TestGetQueryList(TestCase):
@@ -40,3 +46,45 @@ class TestGetQueryList(TestCase):
         result = get_query_list(query_template=query_template)
         expected = ["select 1"]
         assert result == expected
+
+
+class TestTemplateCache(TestCase):
+    def test_templates_are_compiled_once(self):
+        assert compile_template("select {{ x }}") is compile_template("select {{ x }}")
+
+    def test_render_all(self):
+        result = render_all("{{ hw['a'] }}", [{"a": 1}, {"a": 2}], name="hw")
+        assert result == ["1", "2"]
+
+
+class TestGetBindQuery(TestCase):
+    def test_named_bind_query(self):
+        query_template = (
+            "select * from t where a > {{ bind('a') }} and b = {{ bind('b') }}"
+        )
+        result = get_bind_query(query_template=query_template, paramstyle="named")
+        expected = ("select * from t where a > :a and b = :b", ["a", "b"])
+        assert result == expected
+
+    def test_qmark_bind_query(self):
+        query_template = (
+            "select * from t where a > {{ bind('a') }} or a < {{ bind('a') }}"
+        )
+        result = get_bind_query(query_template=query_template, paramstyle="qmark")
+        expected = ("select * from t where a > ? or a < ?", ["a", "a"])
+        assert result == expected
+
+    def test_invalid_bind_name_raises(self):
+        with self.assertRaises(ValueError):
+            get_bind_query("{{ bind('a; drop table t') }}")
+
+    def test_bind_parameters(self):
+        highwatermarks = [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}]
+        named = get_bind_parameters(["a", "b"], highwatermarks, paramstyle="named")
+        qmark = get_bind_parameters(["a", "b", "a"], highwatermarks, paramstyle="qmark")
+        assert named == [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}]
+        assert qmark == [(1, "x", 1), (2, "y", 2)]
+
+    def test_bind_parameters_missing_value_raises(self):
+        with self.assertRaises(KeyError):
+            get_bind_parameters(["a"], [{"b": 1}])
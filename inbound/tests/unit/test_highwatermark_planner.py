@@ -0,0 +1,62 @@
+from datetime import date, timedelta
+from unittest import TestCase
+
+from inbound.core.highwatermark_planner import CoalescingPlanner
+from inbound.sdk.utils import get_query_list
+
+days = [{"DATO": date(2020, 1, 1) + timedelta(days=i)} for i in range(10)]
+
+
+class TestCoalescingPlanner(TestCase):
+    def test_contiguous_days_are_merged(self):
+        result = CoalescingPlanner(key="DATO").plan(days)
+        assert len(result) == 1
+        assert result[0]["DATO_from"] == date(2020, 1, 1)
+        assert result[0]["DATO_to"] == date(2020, 1, 10)
+        assert len(result[0]["DATO_values"]) == 10
+
+    def test_gaps_split_ranges(self):
+        highwatermarks = [{"ID": 1}, {"ID": 2}, {"ID": 5}, {"ID": 3}]
+        result = CoalescingPlanner(key="ID").plan(highwatermarks)
+        assert [(hw["ID_from"], hw["ID_to"]) for hw in result] == [(1, 3), (5, 5)]
+
+    def test_allow_gaps_merges_into_value_lists(self):
+        highwatermarks = [{"ID": 1}, {"ID": 5}, {"ID": 9}]
+        result = CoalescingPlanner(key="ID", allow_gaps=True, max_values=2).plan(
+            highwatermarks
+        )
+        assert [hw["ID_values"] for hw in result] == [[1, 5], [9]]
+
+    def test_ranges_are_capped_by_max_values(self):
+        result = CoalescingPlanner(key="DATO", max_values=4).plan(days)
+        assert [len(hw["DATO_values"]) for hw in result] == [4, 4, 2]
+
+    def test_ranges_are_capped_by_source_row_counts(self):
+        highwatermarks = [
+            {"DATO": hw["DATO"], "ANTALL": rows}
+            for hw, rows in zip(days, [10, 10, 10, 100, 5, 5, 5, 5, 5, 5])
+        ]
+        result = CoalescingPlanner(key="DATO", max_rows=30, rows_key="ANTALL").plan(
+            highwatermarks
+        )
+        assert [hw["ANTALL"] for hw in result] == [30, 100, 30]
+
+    def test_other_fields_are_never_merged(self):
+        highwatermarks = [
+            {"SKJEMA": "a", "ID": 1},
+            {"SKJEMA": "b", "ID": 2},
+            {"SKJEMA": "a", "ID": 2},
+        ]
+        result = CoalescingPlanner(key="ID").plan(highwatermarks)
+        assert [(hw["SKJEMA"], hw["ID_from"], hw["ID_to"]) for hw in result] == [
+            ("a", 1, 2),
+            ("b", 2, 2),
+        ]
+
+    def test_planned_ranges_render_as_range_predicates(self):
+        template = (
+            "where dato between '{{ highwatermark['DATO_from'] }}' "
+            "and '{{ highwatermark['DATO_to'] }}'"
+        )
+        result = get_query_list(template, CoalescingPlanner(key="DATO").plan(days))
+        assert result == ["where dato between '2020-01-01' and '2020-01-10'"]
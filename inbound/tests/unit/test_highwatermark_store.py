@@ -0,0 +1,148 @@
+import os
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from unittest import TestCase
+
+import pyarrow as pa
+
+from inbound.core.highwatermark_store import (
+    HighwatermarkTracker,
+    SqliteHighwatermarkStore,
+    decode_highwatermark,
+    encode_highwatermark,
+)
+from inbound.core.job import Job
+from inbound.core.models import Description
+from inbound.highwatermarks.stored import StoredHighwatermark
+from inbound.sdk.sink import Sink
+from inbound.sdk.tap import Tap
+
+desc = [
+    Description(name="ID", type=None, precision=None, scale=None, nullable=True),
+    Description(name="UPDATED", type=None, precision=None, scale=None, nullable=True),
+]
+
+
+class ListTap(Tap):
+    def __init__(self, batches):
+        self.batches = batches
+
+    def column_descriptions(self):
+        return list(desc)
+
+    def data_generator(self):
+        yield from self.batches
+
+
+class StoredHighwatermarkTap(ListTap):
+    # Leser highwatermarken i data_generator, som kjører i prefetch-tråden
+    def __init__(self, highwatermark, rows):
+        self.highwatermark = highwatermark
+        self.rows = rows
+        self.queries = []
+
+    def data_generator(self):
+        self.queries.append(self.highwatermark.generate_query_list())
+        (highwatermark,) = self.queries[-1]
+        yield [row for row in self.rows if row[1] > highwatermark["UPDATED"]]
+
+
+class ListSink(Sink):
+    def ingest(self, data_generator, column_description):
+        return [list(data) for data in data_generator]
+
+
+class FailingSink(Sink):
+    def ingest(self, data_generator, column_description):
+        list(data_generator)
+        raise ValueError("sink failed")
+
+
+class TestHighwatermarkStore(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = SqliteHighwatermarkStore(
+            os.path.join(self.directory.name, "highwatermark.db")
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_values_keep_their_type(self):
+        values = {
+            "a": datetime(2020, 1, 1, 12),
+            "b": date(2020, 1, 2),
+            "c": Decimal("1.50"),
+            "d": 7,
+            "e": "x",
+        }
+        assert decode_highwatermark(encode_highwatermark(values)) == values
+
+    def test_store_get_and_set(self):
+        assert self.store.get("job") is None
+        self.store.set("job", {"UPDATED": datetime(2020, 1, 1)})
+        assert self.store.get("job") == {"UPDATED": datetime(2020, 1, 1)}
+
+    def test_job_stores_max_of_loaded_data(self):
+        tracker = HighwatermarkTracker(self.store, "job", columns=["UPDATED"])
+        tap = ListTap(
+            [
+                [(1, datetime(2020, 1, 3)), (2, None)],
+                pa.table({"ID": [3], "UPDATED": [datetime(2020, 1, 2)]}),
+            ]
+        )
+        result = Job(tap=tap, sink=ListSink(), highwatermark_tracker=tracker).run()
+        expected = {"UPDATED": datetime(2020, 1, 3)}
+        assert result["highwatermark"] == expected
+        assert self.store.get("job") == expected
+
+    def test_empty_load_keeps_previous_highwatermark(self):
+        self.store.set("job", {"UPDATED": datetime(2020, 1, 1)})
+        tracker = HighwatermarkTracker(self.store, "job", columns=["UPDATED"])
+        Job(tap=ListTap([]), sink=ListSink(), highwatermark_tracker=tracker).run()
+        assert self.store.get("job") == {"UPDATED": datetime(2020, 1, 1)}
+
+    def test_failed_load_does_not_move_highwatermark(self):
+        tracker = HighwatermarkTracker(self.store, "job", columns=["UPDATED"])
+        tap = ListTap([[(1, datetime(2020, 1, 3))]])
+        job = Job(tap=tap, sink=FailingSink(), highwatermark_tracker=tracker)
+        with self.assertRaises(ValueError):
+            job.run()
+        assert self.store.get("job") is None
+
+    def test_unknown_column_raises(self):
+        tracker = HighwatermarkTracker(self.store, "job", columns=["FOO"])
+        tap = ListTap([[(1, datetime(2020, 1, 3))]])
+        with self.assertRaises(ValueError):
+            Job(tap=tap, sink=ListSink(), highwatermark_tracker=tracker).run()
+
+    def test_stored_highwatermark_feeds_next_run(self):
+        highwatermark = StoredHighwatermark(
+            self.store, "job", initial={"UPDATED": datetime(1900, 1, 1)}
+        )
+        assert highwatermark.generate_query_list() == [
+            {"UPDATED": datetime(1900, 1, 1)}
+        ]
+        self.store.set("job", {"UPDATED": datetime(2020, 1, 1)})
+        assert highwatermark.generate_query_list() == [
+            {"UPDATED": datetime(2020, 1, 1)}
+        ]
+
+    def test_tracker_and_stored_highwatermark_with_prefetch(self):
+        highwatermark = StoredHighwatermark(
+            self.store, "job", initial={"UPDATED": datetime(1900, 1, 1)}
+        )
+        rows = [(1, datetime(2020, 1, 1)), (2, datetime(2020, 1, 2))]
+        for expected_rows in (2, 0):
+            tap = StoredHighwatermarkTap(highwatermark, rows)
+            tracker = HighwatermarkTracker(self.store, "job", columns=["UPDATED"])
+            result = Job(
+                tap=tap,
+                sink=ListSink(),
+                prefetch_batches=2,
+                highwatermark_tracker=tracker,
+            ).run()
+            assert sum(len(data) for data in result["batches"]) == expected_rows
+        assert tap.queries == [[{"UPDATED": datetime(2020, 1, 2)}]]
+        assert self.store.get("job") == {"UPDATED": datetime(2020, 1, 2)}
@@ -2,6 +2,8 @@ from datetime import datetime
 from typing import Any, Generator
 from unittest import TestCase
 
+import pyarrow as pa
+
 from inbound.core.job import Job
 from inbound.core.models import Description, Metadata
 from inbound.sdk.sink import Sink
@@ -88,6 +90,16 @@ class TestJob(TestCase):
         ]
         assert result == expected
 
+    def test_job_result_tap_result(self):
+        class ResultTap(MockTap):
+            def run_result(self):
+                return {"queries": [{"number": 0, "rows": 1}]}
+
+        job = Job(tap=ResultTap(), sink=MockSink(), metadata=metadata)
+        result = job.run()["tap_result"]
+        assert result == {"queries": [{"number": 0, "rows": 1}]}
+        assert Job(tap=MockTap(), sink=MockSink()).run()["tap_result"] is None
+
     def test_job_result_start(self):
         tap = MockTap()
         sink = MockSink()
@@ -254,6 +266,94 @@ class TestJob(TestCase):
         ]
         assert result == expected
 
+    def test_raw_only_should_generate_only_raw_data(self):
+        tap = MockTap()
+        sink = MockSink()
+        job = Job(tap=tap, sink=sink, metadata=metadata, raw=True, raw_only=True)
+        job.run()
+        result = sink.captured_result
+        expected = [
+            [('{"foo": 1}', "foo", "bar", "baz", "foobar", datetime(2020, 1, 1, 0, 0))]
+        ]
+        assert result == expected
+
+    def test_raw_only_should_generate_only_raw_column_descriptions(self):
+        tap = MockTap()
+        sink = MockSink()
+        job = Job(tap=tap, sink=sink, metadata=metadata, raw=True, raw_only=True)
+        result = job.run()["columns"]
+        expected = [
+            "_inbound__raw",
+            "_inbound__source_env",
+            "_inbound__run_id",
+            "_inbound__job_name",
+            "_inbound__version",
+            "_inbound__load_time",
+        ]
+        assert result == expected
+
+    def test_prefetch_should_generate_same_data(self):
+        tap = MockTap()
+        sink = MockSink()
+        job = Job(tap=tap, sink=sink, metadata=metadata, prefetch_batches=2)
+        job.run()
+        result = sink.captured_result
+        expected = [[(1, "foo", "bar", "baz", "foobar", datetime(2020, 1, 1, 0, 0))]]
+        assert result == expected
+
+    def test_prefetch_should_pass_on_sink_errors(self):
+        class FailingSink(MockSink):
+            def ingest(self, data_generator, column_description):
+                next(data_generator)
+                raise ValueError("sink failed")
+
+        job = Job(tap=MockTap(), sink=FailingSink(), prefetch_batches=2)
+        with self.assertRaises(ValueError):
+            job.run()
+
+    def test_arrow_batches_get_metadata_columns(self):
+        class ArrowTap(MockTap):
+            def data_generator(self):
+                yield pa.table({"foo": [1, 2]})
+
+        sink = MockSink()
+        job = Job(tap=ArrowTap(), sink=sink, metadata=metadata)
+        job.run()
+        result = sink.captured_result[0]
+        assert result.column_names == [
+            "foo",
+            "_inbound__source_env",
+            "_inbound__run_id",
+            "_inbound__job_name",
+            "_inbound__version",
+            "_inbound__load_time",
+        ]
+        assert result.column("_inbound__run_id").to_pylist() == ["bar", "bar"]
+
+    def test_arrow_batches_with_raw_should_generate_raw_data(self):
+        class ArrowTap(MockTap):
+            def data_generator(self):
+                yield pa.table({"foo": [1]})
+
+        sink = MockSink()
+        job = Job(tap=ArrowTap(), sink=sink, metadata=metadata, raw=True)
+        job.run()
+        result = sink.captured_result
+        expected = [
+            [
+                (
+                    1,
+                    '{"foo": 1}',
+                    "foo",
+                    "bar",
+                    "baz",
+                    "foobar",
+                    datetime(2020, 1, 1, 0, 0),
+                )
+            ]
+        ]
+        assert result == expected
+
     def test_metadata_load_time_should_update(self):
         meta1 = Metadata(source_env="foo", run_id="bar", job_name="baz")
         meta2 = Metadata(source_env="foo", run_id="bar", job_name="baz")
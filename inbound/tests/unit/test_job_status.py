@@ -1,8 +1,17 @@
+import os
+import tempfile
+from functools import partial
 from multiprocessing import Manager
-from time import sleep
+from time import sleep, time
 from unittest import TestCase
 
-from inbound.core.job_management import JobClerk, WorkerManager
+from inbound.core.job_management import (
+    JobClerk,
+    WarmWorkerManager,
+    WorkerManager,
+    report_progress,
+)
+from inbound.core.job_status_store import SqliteJobStatusStore
 
 
 def dummy_job():
@@ -21,6 +30,32 @@ def failing_job():
     raise Exception("feil")
 
 
+def short_running_job():
+    sleep(3)
+
+
+def pid_job():
+    return {"pid": os.getpid()}
+
+
+def crashing_job():
+    os._exit(1)
+
+
+def progress_job():
+    report_progress(0.5)
+
+
+def wait_for_status(clerk, job_ids, status, timeout=2.5):
+    deadline = time() + timeout
+    while time() < deadline:
+        statuses = [clerk.get_job_status(job_id).status for job_id in job_ids]
+        if all(s == status for s in statuses):
+            return True
+        sleep(0.05)
+    return False
+
+
 class RunOnceWorkerManager(WorkerManager):
     def run(self):
         worker, job = self._assign_work()
@@ -101,3 +136,97 @@ class TestJobStatus(TestCase):
         result = new_status.job_id
         expected = job_id
         assert result == expected
+
+    def test_worker_pool_runs_jobs_concurrently(self):
+        clerk = JobClerk(max_workers=2)
+        first = clerk.run_job(short_running_job)
+        second = clerk.run_job(short_running_job)
+        try:
+            assert wait_for_status(clerk, [first.job_id, second.job_id], "running")
+        finally:
+            clerk.worker_manager_process.terminate()
+
+    def test_worker_pool_queues_jobs_above_max_workers(self):
+        clerk = JobClerk(max_workers=1)
+        first = clerk.run_job(short_running_job)
+        second = clerk.run_job(short_running_job)
+        try:
+            assert wait_for_status(clerk, [first.job_id], "running")
+            assert clerk.get_job_status(second.job_id).status == "in_queue"
+        finally:
+            clerk.worker_manager_process.terminate()
+
+    def test_worker_pool_updates_status_of_every_job(self):
+        clerk = JobClerk(max_workers=2)
+        job_ids = [clerk.run_job(dummy_job_result).job_id for _ in range(4)]
+        try:
+            assert wait_for_status(clerk, job_ids, "done", timeout=10)
+        finally:
+            clerk.worker_manager_process.terminate()
+
+
+class TestWarmWorkerJobStatus(TestCase):
+    def test_warm_worker_is_reused_between_jobs(self):
+        clerk = JobClerk(worker_manager=partial(WarmWorkerManager, preload_modules=()))
+        job_ids = [clerk.run_job(pid_job).job_id for _ in range(2)]
+        try:
+            assert wait_for_status(clerk, job_ids, "done", timeout=10)
+            pids = {
+                clerk.get_job_status(job_id).job_result["pid"] for job_id in job_ids
+            }
+            assert len(pids) == 1
+        finally:
+            clerk.worker_manager_process.terminate()
+
+    def test_warm_worker_is_recycled_after_max_jobs(self):
+        clerk = JobClerk(
+            worker_manager=partial(
+                WarmWorkerManager, preload_modules=(), max_jobs_per_worker=1
+            )
+        )
+        job_ids = [clerk.run_job(pid_job).job_id for _ in range(2)]
+        try:
+            assert wait_for_status(clerk, job_ids, "done", timeout=10)
+            pids = {
+                clerk.get_job_status(job_id).job_result["pid"] for job_id in job_ids
+            }
+            assert len(pids) == 2
+        finally:
+            clerk.worker_manager_process.terminate()
+
+    def test_crashing_job_is_error_and_worker_is_replaced(self):
+        clerk = JobClerk(worker_manager=partial(WarmWorkerManager, preload_modules=()))
+        crashing = clerk.run_job(crashing_job)
+        following = clerk.run_job(dummy_job_result)
+        try:
+            assert wait_for_status(clerk, [crashing.job_id], "error", timeout=10)
+            assert wait_for_status(clerk, [following.job_id], "done", timeout=10)
+        finally:
+            clerk.worker_manager_process.terminate()
+
+
+class TestSqliteJobStatus(TestCase):
+    def test_job_status_is_done_after_job_is_done(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            clerk = JobClerk(
+                worker_manager=RunOnceWorkerManager,
+                status_store=SqliteJobStatusStore(path=f"{tmp_dir}/job_status.db"),
+            )
+            job_status = clerk.run_job(dummy_job_result)
+            clerk.worker_manager_process.join()
+            new_status = clerk.get_job_status(job_status.job_id)
+            assert new_status.status == "done"
+            assert new_status.job_result == dummy_job_result()
+            assert clerk.get_job_statuses("done") == [new_status]
+
+    def test_job_progress_is_reported(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            clerk = JobClerk(
+                worker_manager=RunOnceWorkerManager,
+                status_store=SqliteJobStatusStore(path=f"{tmp_dir}/job_status.db"),
+            )
+            job_status = clerk.run_job(progress_job)
+            clerk.worker_manager_process.join()
+            new_status = clerk.get_job_status(job_status.job_id)
+            assert new_status.status == "done"
+            assert new_status.progress == 0.5
@@ -0,0 +1,127 @@
+import pickle
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from multiprocessing import Manager
+from unittest import TestCase
+
+from inbound.core.job_status_store import ManagerJobStatusStore, SqliteJobStatusStore
+from inbound.core.models import JobStatus
+
+
+def job_status(job_id, status="in_queue", updated_at=None):
+    created_at = datetime(2020, 1, 1)
+    return JobStatus(
+        job_id=job_id,
+        status=status,
+        created_at=created_at,
+        updated_at=updated_at or created_at,
+    )
+
+
+class JobStatusStoreTests:
+    def test_get_returns_added_status(self):
+        self.store.add(job_status("a"))
+        assert self.store.get("a") == job_status("a")
+
+    def test_get_unknown_job_returns_none(self):
+        assert self.store.get("unknown") is None
+
+    def test_update_changes_only_given_fields(self):
+        self.store.add(job_status("a"))
+        self.store.update("a", status="done", job_result={"rows": 1})
+        result = self.store.get("a")
+        assert result.status == "done"
+        assert result.job_result == {"rows": 1}
+        assert result.created_at == datetime(2020, 1, 1)
+        assert result.updated_at > datetime(2020, 1, 1)
+
+    def test_update_progress(self):
+        self.store.add(job_status("a"))
+        self.store.update("a", progress=0.5)
+        assert self.store.get("a").progress == 0.5
+
+    def test_list_by_status(self):
+        self.store.add(job_status("a"))
+        self.store.add(job_status("b"))
+        self.store.update("b", status="running")
+        result = [status.job_id for status in self.store.list_by_status("running")]
+        assert result == ["b"]
+
+    def test_evict_finished_removes_only_old_finished_jobs(self):
+        old = datetime.now() - timedelta(days=2)
+        self.store.add(job_status("old_done", status="done", updated_at=old))
+        self.store.add(job_status("old_running", status="running", updated_at=old))
+        self.store.add(job_status("new_done", status="done", updated_at=datetime.now()))
+        self.store.evict_finished()
+        assert self.store.get("old_done") is None
+        assert self.store.get("old_running") is not None
+        assert self.store.get("new_done") is not None
+
+
+class TestManagerJobStatusStore(JobStatusStoreTests, TestCase):
+    def setUp(self):
+        self.manager = Manager()
+        self.store = ManagerJobStatusStore(
+            manager=self.manager, ttl_seconds=60 * 60 * 24
+        )
+
+    def tearDown(self):
+        self.manager.shutdown()
+
+
+class TestSqliteJobStatusStore(JobStatusStoreTests, TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = SqliteJobStatusStore(
+            path=f"{self.tmp_dir.name}/job_status.db", ttl_seconds=60 * 60 * 24
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_adds_progress_column_to_existing_database(self):
+        path = f"{self.tmp_dir.name}/old_job_status.db"
+        with sqlite3.connect(path) as connection:
+            connection.execute("""
+                create table job_status (
+                    job_id text primary key,
+                    status text not null,
+                    created_at text not null,
+                    updated_at text not null,
+                    job_result blob
+                )
+                """)
+        store = SqliteJobStatusStore(path=path)
+        store.add(job_status("a"))
+        store.update("a", progress=0.25)
+        assert store.get("a").progress == 0.25
+
+    def test_update_from_different_threads(self):
+        store = SqliteJobStatusStore(path=f"{self.tmp_dir.name}/threads.db")
+        store.add(job_status("a"))
+        errors = []
+
+        def report_progress():
+            try:
+                store.update("a", progress=0.5)
+            except Exception as e:
+                errors.append(e)
+
+        # Første kall etter start skjer fra en annen tråd, som report_progress
+        # fra en prefetch-tråd
+        thread = threading.Thread(target=report_progress)
+        thread.start()
+        thread.join()
+        store.update("a", status="done", job_result={"rows": 1})
+        assert errors == []
+        result = store.get("a")
+        assert (result.status, result.progress) == ("done", 0.5)
+
+    def test_pickled_store_opens_its_own_connection(self):
+        self.store.add(job_status("a"))
+        copy = pickle.loads(pickle.dumps(self.store))
+        assert "_local" not in copy.__getstate__()
+        copy.update("a", status="done")
+        assert self.store.get("a").status == "done"
@@ -1,11 +1,12 @@
 import csv
 import datetime
 import io
+import json
 from unittest import TestCase
 
 from inbound.core.models import Description
 from inbound.sinks.csv import CsvSink
-from inbound.taps.mainmanager import MainManagerTap
+from inbound.taps.mainmanager import MainManagerError, MainManagerTap, iter_table_rows
 
 
 class DummySupplier:
@@ -32,3 +33,111 @@ class TestMainManager(TestCase):
         ]
 
         assert result == expected
+
+
+def response_bytes(rows, success=True, message=None, ensure_ascii=True):
+    data_table = json.dumps({"table": rows}, ensure_ascii=ensure_ascii)
+    payload = {
+        "Success": success,
+        "Message": message,
+        "TotalNumberOfRecords": len(rows),
+        "DataTable": data_table,
+    }
+    return json.dumps(payload, ensure_ascii=ensure_ascii).encode("utf-8")
+
+
+def split(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class StreamingSupplier:
+    def __init__(self, data, chunk_size=7):
+        self.data = data
+        self.chunk_size = chunk_size
+
+    def stream(self):
+        return split(self.data, self.chunk_size)
+
+
+rows = [
+    {"id": 1, "navn": 'Å"gate\\ 1', "areal": 12.5, "aktiv": True},
+    {"id": 2, "navn": "emoji 😀 og\nlinjeskift", "koordinater": [1, [2, 3]]},
+    {"id": 3, "navn": None, "tom": {}},
+]
+
+
+class TestMainManagerStreaming(TestCase):
+    def test_rows_are_parsed_for_any_chunk_size(self):
+        for ensure_ascii in (True, False):
+            data = response_bytes(rows, ensure_ascii=ensure_ascii)
+            for size in range(1, 40):
+                result = list(iter_table_rows(split(data, size)))
+                assert [json.loads(raw) for raw in result] == rows
+
+    def test_escaped_surrogate_pairs_split_at_every_offset(self):
+        # DataTable har emojien rått, og det ytre svaret escaper den som
+        # \ud83d\ude00, slik .NET gjør
+        data_table = json.dumps({"table": [{"s": "a😀b😀"}]}, ensure_ascii=False)
+        data = json.dumps({"Success": True, "DataTable": data_table}).encode()
+        for offset in range(1, len(data)):
+            for chunks in ([data[:offset], data[offset:]], split(data, offset)):
+                (raw,) = iter_table_rows(chunks)
+                raw.encode("utf-8")
+                assert json.loads(raw) == {"s": "a😀b😀"}
+
+    def test_rows_are_passed_through_as_they_are(self):
+        data_table = '{"table": [{"a":1,  "b":"x"}, {"c" : [ ]}]}'
+        data = json.dumps({"Success": True, "DataTable": data_table}).encode()
+        result = list(iter_table_rows(split(data, 5)))
+        assert result == ['{"a":1,  "b":"x"}', '{"c" : [ ]}']
+
+    def test_data_table_as_object(self):
+        data = b'{"Success": true, "DataTable": {"table": [{"a": 1}]}}'
+        assert list(iter_table_rows([data])) == ['{"a": 1}']
+
+    def test_unsuccessful_response_raises(self):
+        data = response_bytes([], success=False, message="feil")
+        with self.assertRaisesRegex(MainManagerError, "feil"):
+            list(iter_table_rows([data]))
+
+    def test_truncated_response_raises(self):
+        data = response_bytes(rows)
+        with self.assertRaises(MainManagerError):
+            list(iter_table_rows([data[:-20]]))
+
+    def test_streaming_tap_yields_batches(self):
+        tap = MainManagerTap(
+            table="",
+            username="",
+            password="",
+            data_supplier=StreamingSupplier(response_bytes(rows)),
+            streaming=True,
+            batch_size=2,
+        )
+        result = list(tap.data_generator())
+        assert [len(data) for data in result] == [2, 1]
+        assert [json.loads(row[0]) for data in result for row in data] == rows
+
+    def test_streaming_tap_without_passthrough_matches_old_format(self):
+        data = json.dumps(
+            {"Success": True, "DataTable": DummySupplier().get_data()["DataTable"]}
+        ).encode()
+        streaming_tap = MainManagerTap(
+            table="",
+            username="",
+            password="",
+            data_supplier=StreamingSupplier(data),
+            streaming=True,
+            passthrough=False,
+        )
+        assert list(streaming_tap.data_generator()) == [next(tap.data_generator())]
+
+    def test_streaming_tap_with_empty_table_yields_one_empty_batch(self):
+        tap = MainManagerTap(
+            table="",
+            username="",
+            password="",
+            data_supplier=StreamingSupplier(response_bytes([])),
+            streaming=True,
+        )
+        assert list(tap.data_generator()) == [[]]
@@ -0,0 +1,167 @@
+import threading
+from unittest import TestCase, skipIf
+
+from inbound.core.description_cache import description_cache
+
+try:
+    from inbound.taps.mssql import MSSQLTap, description_from_result_set
+except ImportError:  # pyodbc krever unixODBC
+    MSSQLTap = None
+
+
+class FakeCursor:
+    def __init__(self, executed):
+        self.executed = executed
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, parameters=None):
+        self.executed.append((query, parameters))
+        self.result = [(query,)]
+
+    def fetchmany(self, size):
+        data, self.result = self.result, []
+        return data
+
+
+class FakeConnection:
+    def __init__(self, executed=None):
+        self.executed = executed if executed is not None else []
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self.executed)
+
+    def close(self):
+        self.closed = True
+
+
+class DescribeCursor(FakeCursor):
+    description = [
+        ("is_hidden",),
+        ("name",),
+        ("system_type_name",),
+        ("max_length",),
+        ("precision",),
+        ("scale",),
+        ("is_nullable",),
+    ]
+
+    def fetchall(self):
+        return [(False, "id", "int", 4, 10, 0, False)]
+
+
+class DescribeConnection(FakeConnection):
+    def cursor(self):
+        return DescribeCursor(self.executed)
+
+
+@skipIf(MSSQLTap is None, "pyodbc is not available")
+class TestMSSQLTap(TestCase):
+    def test_rendered_highwatermarks(self):
+        connection = FakeConnection()
+        tap = MSSQLTap(
+            connection,
+            "select * from t where a > {{ highwatermark['a'] }}",
+            highwatermarks=[{"a": 1}, {"a": 2}],
+        )
+        list(tap.data_generator())
+        assert connection.executed == [
+            ("select * from t where a > 1", None),
+            ("select * from t where a > 2", None),
+        ]
+
+    def test_bind_highwatermarks(self):
+        connection = FakeConnection()
+        tap = MSSQLTap(
+            connection,
+            "select * from t where a > {{ bind('a') }}",
+            highwatermarks=[{"a": 1}, {"a": "1; drop table t"}],
+            bind_highwatermarks=True,
+        )
+        list(tap.data_generator())
+        assert connection.executed == [
+            ("select * from t where a > ?", (1,)),
+            ("select * from t where a > ?", ("1; drop table t",)),
+        ]
+
+    def test_description_from_result_set(self):
+        row = {
+            "name": "navn",
+            "system_type_name": "nvarchar(50)",
+            "max_length": 100,
+            "precision": 0,
+            "scale": 0,
+            "is_nullable": True,
+        }
+        result = description_from_result_set(row)
+        assert result.type == "<class 'str'>"
+        assert result.precision == 50
+        assert result.nullable
+
+    def test_description_from_result_set_unknown_type_raises(self):
+        row = {
+            "name": "sted",
+            "system_type_name": "geography",
+            "max_length": -1,
+            "precision": 0,
+            "scale": 0,
+            "is_nullable": True,
+        }
+        with self.assertRaises(ValueError):
+            description_from_result_set(row)
+
+    def test_parallel_queries_return_all_batches_and_row_counts(self):
+        executed = []
+        connections = []
+        threads = set()
+
+        def connection_factory():
+            threads.add(threading.current_thread())
+            connections.append(FakeConnection(executed))
+            return connections[-1]
+
+        tap = MSSQLTap(
+            FakeConnection(),
+            "select {{ highwatermark['a'] }}",
+            highwatermarks=[{"a": i} for i in range(6)],
+            parallel_queries=3,
+            connection_factory=connection_factory,
+        )
+        result = [row for data in tap.data_generator() for row in data]
+        assert sorted(result) == sorted((f"select {i}",) for i in range(6))
+        assert len(connections) == 3
+        assert all(connection.closed for connection in connections)
+        assert threading.current_thread() not in threads
+        queries = tap.run_result()["queries"]
+        assert [query["number"] for query in queries] == list(range(6))
+        assert all(query["rows"] == 1 for query in queries)
+
+    def test_parallel_queries_require_connection_factory(self):
+        with self.assertRaises(ValueError):
+            MSSQLTap(
+                FakeConnection(),
+                "select 1",
+                highwatermarks=[{}, {}],
+                parallel_queries=2,
+            )
+
+    def test_descriptions_are_cached_per_source(self):
+        self.addCleanup(description_cache.invalidate)
+        connection = DescribeConnection()
+        query = "select * from t where a > {{ highwatermark['a'] }}"
+        for a in (1, 2):
+            tap = MSSQLTap(
+                connection,
+                query,
+                highwatermarks=[{"a": a}],
+                description_source="db",
+            )
+            result = tap.column_descriptions()
+            assert [col.name for col in result] == ["id"]
+        assert len(connection.executed) == 1
@@ -0,0 +1,288 @@
+import re
+import threading
+from unittest import TestCase
+
+import pyarrow as pa
+from oracledb import DatabaseError
+
+from inbound.core.description_cache import description_cache
+from inbound.taps.oracle import (
+    OraTap,
+    ora_hash_partition_queries,
+    range_partition_queries,
+)
+
+ROWS = [(i,) for i in range(25)] + [(None,)]
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query):
+        match = re.search(r"ora_hash\(id, (\d+)\) = (\d+)", query)
+        if query.startswith("select min(id)"):
+            ids = [row[0] for row in self.rows if row[0] is not None]
+            self.result = [(min(ids), max(ids))]
+            return
+        if match:
+            buckets, bucket = int(match.group(1)) + 1, int(match.group(2))
+            self.result = [
+                row
+                for row in self.rows
+                if (row[0] is None and bucket == 0)
+                or (row[0] is not None and row[0] % buckets == bucket)
+            ]
+            return
+        lower = re.search(r"id >= (-?\d+)", query)
+        upper = re.search(r"id < (-?\d+)", query)
+        if lower or upper:
+            lower = int(lower.group(1)) if lower else None
+            upper = int(upper.group(1)) if upper else None
+            self.result = [
+                row
+                for row in self.rows
+                if (row[0] is None and "is null" in query)
+                or (
+                    row[0] is not None
+                    and (lower is None or row[0] >= lower)
+                    and (upper is None or row[0] < upper)
+                )
+            ]
+            return
+        self.result = list(self.rows)
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchmany(self, size):
+        data, self.result = self.result[:size], self.result[size:]
+        return data
+
+
+class FakeConnection:
+    def __init__(self, rows=ROWS):
+        self.rows = rows
+        self.closed = False
+        self.threads = set()
+
+    def cursor(self):
+        self.threads.add(threading.current_thread())
+        return FakeCursor(self.rows)
+
+    def close(self):
+        self.closed = True
+
+    def fetch_df_batches(self, statement, size):
+        cursor = FakeCursor(self.rows)
+        cursor.execute(statement)
+        while True:
+            data = cursor.fetchmany(size)
+            yield pa.table({"ID": pa.array([row[0] for row in data], pa.int64())})
+            if len(data) == 0:
+                break
+
+
+class TestPartitionQueries(TestCase):
+    def test_ora_hash_partition_queries(self):
+        queries = ora_hash_partition_queries("select * from t", "id", 3)
+        assert queries == [
+            "select * from (select * from t) where ora_hash(id, 2) = 0 or id is null",
+            "select * from (select * from t) where ora_hash(id, 2) = 1",
+            "select * from (select * from t) where ora_hash(id, 2) = 2",
+        ]
+
+    def test_range_partition_queries_cover_min_to_max(self):
+        queries = range_partition_queries("select * from t", "id", 2, 1, 10)
+        assert queries == [
+            "select * from (select * from t) where id < 6",
+            "select * from (select * from t) where id >= 6 or id is null",
+        ]
+
+    def test_range_partition_queries_with_one_partition_is_the_query(self):
+        queries = range_partition_queries("select * from t", "id", 1, 1, 10)
+        assert queries == ["select * from t"]
+
+
+class TestOraTapPartitions(TestCase):
+    def test_partitioned_tap_requires_key_and_connection_factory(self):
+        with self.assertRaises(ValueError):
+            OraTap(FakeConnection(), "select * from t", partitions=2)
+        with self.assertRaises(ValueError):
+            OraTap(
+                FakeConnection(), "select * from t", partitions=2, partition_key="id"
+            )
+
+    def test_ora_hash_partitions_return_all_rows(self):
+        connections = []
+
+        def connection_factory():
+            connections.append(FakeConnection())
+            return connections[-1]
+
+        tap = OraTap(
+            FakeConnection(),
+            "select * from t",
+            partitions=4,
+            partition_key="id",
+            connection_factory=connection_factory,
+        )
+        rows = [row for data in tap.data_generator() for row in data]
+        assert sorted(rows, key=str) == sorted(ROWS, key=str)
+        assert len(connections) == 4
+        assert all(connection.closed for connection in connections)
+        assert all(
+            threading.current_thread() not in connection.threads
+            for connection in connections
+        )
+
+    def test_range_partitions_return_all_rows(self):
+        tap = OraTap(
+            FakeConnection(),
+            "select * from t",
+            partitions=3,
+            partition_by="range",
+            partition_key="id",
+            connection_factory=FakeConnection,
+        )
+        rows = [row for data in tap.data_generator() for row in data]
+        assert sorted(rows, key=str) == sorted(ROWS, key=str)
+
+    def test_range_partitions_keep_fractional_keys(self):
+        rows = [(-1.5,), (-0.5,), (0.5,), (3.2,), (None,)]
+        tap = OraTap(
+            FakeConnection(rows),
+            "select * from t",
+            partitions=2,
+            partition_by="range",
+            partition_key="id",
+            connection_factory=lambda: FakeConnection(rows),
+        )
+        result = [row for data in tap.data_generator() for row in data]
+        assert sorted(result, key=str) == sorted(rows, key=str)
+
+    def test_unpartitioned_tap_uses_main_connection(self):
+        tap = OraTap(FakeConnection(), "select * from t")
+        rows = [row for data in tap.data_generator() for row in data]
+        assert rows == ROWS
+
+
+class TestOraTapArrow(TestCase):
+    def test_fetch_mode_must_be_known(self):
+        with self.assertRaises(ValueError):
+            OraTap(FakeConnection(), "select * from t", fetch_mode="pandas")
+
+    def test_arrow_fetch_yields_arrow_tables(self):
+        tap = OraTap(
+            FakeConnection(), "select * from t", fetch_mode="arrow", batch_size=10
+        )
+        result = list(tap.data_generator())
+        assert [table.num_rows for table in result] == [10, 10, 6]
+        assert [id for table in result for id in table.column("ID").to_pylist()] == [
+            row[0] for row in ROWS
+        ]
+
+    def test_partitioned_arrow_fetch_returns_all_rows(self):
+        tap = OraTap(
+            FakeConnection(),
+            "select * from t",
+            partitions=2,
+            partition_key="id",
+            connection_factory=FakeConnection,
+            fetch_mode="arrow",
+        )
+        ids = [id for table in tap.data_generator() for id in table["ID"].to_pylist()]
+        assert sorted(ids, key=str) == sorted([row[0] for row in ROWS], key=str)
+
+
+class TestOraTapBindHighwatermarks(TestCase):
+    def test_same_statement_is_executed_with_binds(self):
+        executed = []
+
+        class BindCursor(FakeCursor):
+            def execute(self, query, parameters=None):
+                executed.append((query, parameters))
+                self.result = [(parameters["ID"],)]
+
+        class BindConnection(FakeConnection):
+            def cursor(self):
+                return BindCursor(self.rows)
+
+        class FakeHighwatermark:
+            def generate_query_list(self):
+                return [{"ID": 1}, {"ID": 2}]
+
+        tap = OraTap(
+            BindConnection(),
+            "select * from t where id > {{ bind('ID') }}",
+            highwatermark=FakeHighwatermark(),
+            bind_highwatermarks=True,
+        )
+        result = list(tap.data_generator())
+        assert result == [[(1,)], [(2,)]]
+        assert executed == [
+            ("select * from t where id > :ID", {"ID": 1}),
+            ("select * from t where id > :ID", {"ID": 2}),
+        ]
+
+
+class DescribeCursor(FakeCursor):
+    description = [("ID", "<DbType DB_TYPE_NUMBER>", None, None, 10, 0, True)]
+
+    def __init__(self, rows, calls, parse_error=False):
+        super().__init__(rows)
+        self.calls = calls
+        self.parse_error = parse_error
+
+    def parse(self, query):
+        self.calls.append(("parse", query))
+        if self.parse_error:
+            raise DatabaseError("ORA-00900")
+
+    def execute(self, query):
+        self.calls.append(("execute", query))
+
+
+class DescribeConnection(FakeConnection):
+    def __init__(self, parse_error=False):
+        super().__init__()
+        self.calls = []
+        self.parse_error = parse_error
+
+    def cursor(self):
+        return DescribeCursor(self.rows, self.calls, self.parse_error)
+
+
+class TestOraTapColumnDescriptions(TestCase):
+    def tearDown(self):
+        description_cache.invalidate()
+
+    def test_query_is_parsed_without_executing(self):
+        connection = DescribeConnection()
+        tap = OraTap(connection, "with x as (select 1 id from dual) select * from x")
+        result = tap.column_descriptions()
+        assert [col.name for col in result] == ["ID"]
+        assert connection.calls == [
+            ("parse", "with x as (select 1 id from dual) select * from x")
+        ]
+
+    def test_falls_back_to_empty_query_when_parse_fails(self):
+        connection = DescribeConnection(parse_error=True)
+        tap = OraTap(connection, "select * from t where a = 1")
+        result = tap.column_descriptions()
+        assert [col.name for col in result] == ["ID"]
+        assert connection.calls[-1] == ("execute", "select * from t  where 1=2")
+
+    def test_descriptions_are_cached_per_source(self):
+        connection = DescribeConnection()
+        tap = OraTap(connection, "select * from t", description_source="db")
+        tap.column_descriptions()
+        tap.column_descriptions()
+        assert len(connection.calls) == 1
@@ -0,0 +1,114 @@
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO
+from unittest import TestCase
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from inbound.core.models import Description
+from inbound.sinks.parquet import ParquetWriter, arrow_type
+
+
+def description(name, type, precision=None, scale=None):
+    return Description(
+        name=name, type=type, precision=precision, scale=scale, nullable=True
+    )
+
+
+class TestArrowType(TestCase):
+    def test_number_without_scale_is_decimal(self):
+        result = arrow_type(description("a", "number", precision=10, scale=0))
+        assert result == pa.decimal128(10, 0)
+
+    def test_number_with_scale_is_decimal(self):
+        result = arrow_type(description("a", "number", precision=38, scale=5))
+        assert result == pa.decimal128(38, 5)
+
+    def test_unconstrained_or_negative_scale_number_is_float(self):
+        for precision, scale in ((0, -127), (None, -127), (10, -2)):
+            column = description("a", "number", precision=precision, scale=scale)
+            assert arrow_type(column) == pa.float64()
+
+    def test_datetime_is_timestamp(self):
+        result = arrow_type(description("a", "datetime"))
+        assert result == pa.timestamp("us")
+
+    def test_unknown_type_is_string(self):
+        result = arrow_type(description("a", "footype"))
+        assert result == pa.string()
+
+    def test_variant_raises(self):
+        with self.assertRaises(ValueError):
+            arrow_type(description("a", "variant"))
+
+
+class TestParquetWriter(TestCase):
+    def test_rows_are_written_typed(self):
+        desc = [
+            description("id", "number", precision=38, scale=0),
+            description("amount", "number", precision=38, scale=5),
+            description("updated", "datetime"),
+        ]
+        file = BytesIO()
+        writer = ParquetWriter(file=file, column_description=desc, row_group_rows=1)
+        writer.writerows([(1, 1.5, datetime(2020, 1, 1))])
+        writer.writerows([(2, None, None)])
+        writer.close()
+
+        table = pq.read_table(BytesIO(file.getvalue()))
+        assert table.schema.field("updated").type == pa.timestamp("us")
+        assert table.to_pylist() == [
+            {
+                "id": Decimal(1),
+                "amount": Decimal("1.50000"),
+                "updated": datetime(2020, 1, 1),
+            },
+            {"id": Decimal(2), "amount": None, "updated": None},
+        ]
+
+    def test_values_of_other_types_are_converted(self):
+        desc = [
+            description("amount", "number", precision=38, scale=2),
+            description("name", "varchar"),
+        ]
+        file = BytesIO()
+        writer = ParquetWriter(file=file, column_description=desc)
+        writer.writerows([(Decimal("1.25"), 7)])
+        writer.close()
+
+        table = pq.read_table(BytesIO(file.getvalue()))
+        assert table.to_pylist() == [{"amount": Decimal("1.25"), "name": "7"}]
+
+    def test_decimals_keep_their_precision(self):
+        desc = [description("amount", "number", precision=38, scale=2)]
+        file = BytesIO()
+        writer = ParquetWriter(file=file, column_description=desc)
+        writer.writerows([(Decimal("12345678901234567.89"),), (0.1,), (1.005,)])
+        writer.writerows(pa.table({"AMOUNT": [2.675]}))
+        writer.close()
+
+        table = pq.read_table(BytesIO(file.getvalue()))
+        assert table.column("amount").to_pylist() == [
+            Decimal("12345678901234567.89"),
+            Decimal("0.10"),
+            Decimal("1.01"),
+            Decimal("2.68"),
+        ]
+
+    def test_arrow_batches_are_cast_to_the_schema(self):
+        desc = [
+            description("id", "number", precision=38, scale=0),
+            description("name", "varchar"),
+        ]
+        file = BytesIO()
+        writer = ParquetWriter(file=file, column_description=desc)
+        writer.writerows([(1, "a")])
+        writer.writerows(pa.table({"ID": [2], "NAME": ["b"]}))
+        writer.close()
+
+        table = pq.read_table(BytesIO(file.getvalue()))
+        assert table.to_pylist() == [
+            {"id": Decimal(1), "name": "a"},
+            {"id": Decimal(2), "name": "b"},
+        ]
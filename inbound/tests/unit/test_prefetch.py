@@ -0,0 +1,101 @@
+import threading
+from unittest import TestCase
+
+from inbound.core.prefetch import (
+    BatchBuffer,
+    estimate_batch_size,
+    interleave,
+    prefetch,
+)
+
+
+class TestPrefetch(TestCase):
+    def test_prefetch_yields_all_batches_in_order(self):
+        def generator():
+            for i in range(10):
+                yield [(i,)]
+
+        result = list(prefetch(generator(), max_batches=2))
+        expected = [[(i,)] for i in range(10)]
+        assert result == expected
+
+    def test_prefetch_reads_ahead_on_another_thread(self):
+        threads = []
+
+        def generator():
+            threads.append(threading.current_thread())
+            yield [(1,)]
+
+        list(prefetch(generator()))
+        assert threads[0] is not threading.current_thread()
+
+    def test_tap_errors_are_raised_in_consumer(self):
+        def generator():
+            yield [(1,)]
+            raise ValueError("tap failed")
+
+        data = prefetch(generator())
+        assert next(data) == [(1,)]
+        with self.assertRaises(ValueError):
+            next(data)
+
+    def test_closing_consumer_stops_producer(self):
+        closed = threading.Event()
+
+        def generator():
+            try:
+                while True:
+                    yield [(1,)]
+            finally:
+                closed.set()
+
+        data = prefetch(generator(), max_batches=1)
+        next(data)
+        data.close()
+        assert closed.wait(timeout=5)
+
+    def test_buffer_respects_max_bytes(self):
+        batch = [(1,)] * 10
+        buffer = BatchBuffer(max_batches=10, max_bytes=estimate_batch_size(batch))
+        assert buffer.put(batch)
+
+        second_put = threading.Thread(target=buffer.put, args=(batch,))
+        second_put.start()
+        second_put.join(timeout=0.2)
+        assert second_put.is_alive()
+
+        buffer.get()
+        second_put.join(timeout=5)
+        assert not second_put.is_alive()
+
+    def test_estimate_batch_size_of_empty_batch(self):
+        assert estimate_batch_size([]) == 0
+
+
+class TestInterleave(TestCase):
+    def test_interleave_yields_batches_from_every_generator(self):
+        def generator(start):
+            for i in range(start, start + 3):
+                yield [(i,)]
+
+        result = list(interleave([generator(0), generator(10)], max_batches=2))
+        expected = [[(i,)] for i in (0, 1, 2, 10, 11, 12)]
+        assert sorted(result) == expected
+
+    def test_error_in_one_generator_stops_the_others(self):
+        closed = threading.Event()
+
+        def endless():
+            try:
+                while True:
+                    yield [(1,)]
+            finally:
+                closed.set()
+
+        def failing():
+            raise ValueError("slice failed")
+            yield
+
+        with self.assertRaises(ValueError):
+            list(interleave([endless(), failing()], max_batches=1))
+        assert closed.wait(timeout=5)
@@ -1,9 +1,24 @@
+import csv
+import gzip
+import os
+import re
+import tempfile
 from datetime import datetime
-from io import StringIO
+from io import BytesIO, StringIO
 from unittest import TestCase
 
+import pyarrow as pa
+import pyarrow.parquet as pq
+import zstandard
+
 from inbound.core.models import Description
-from inbound.sinks.snowflake import SnowSink
+from inbound.sinks.snowflake import (
+    FileHandler,
+    SnowHandler,
+    SnowSink,
+    file_format_for,
+    put_options_for,
+)
 
 
 class MockSnowHandler:
@@ -15,6 +30,7 @@ class MockSnowHandler:
         schema: str,
         file_path: str,
         file_name: str,
+        staging_format: str = None,
     ): ...
     def ingest_from_table(self, table, to_table): ...
     def drop_table(self, table): ...
@@ -331,3 +347,344 @@ class TestSnowSink(TestCase):
             transient_table_postfix="__override",
         )
         assert sink.table == "foo.bar.baz"
+
+    def test_pipelined_ingest_uploads_every_batch(self):
+        class RecordingSnowHandler(MockSnowHandler):
+            def __init__(self):
+                self.uploaded = []
+
+            def ingest_file_to_table(
+                self,
+                table,
+                database,
+                schema,
+                file_path,
+                file_name,
+                staging_format=None,
+            ):
+                self.uploaded.append(file_name)
+
+        class SpoolFileHandler(MockFileHandler):
+            def __init__(self):
+                super().__init__()
+                self.created = []
+                self.deleted = []
+
+            def numbered_file_name(self, number):
+                return f"inbound_{number}.csv"
+
+            def create_file(self, file_name=None):
+                self.created.append(file_name)
+                return StringIO(newline="")
+
+            def delete_file(self, file_name=None):
+                self.deleted.append(file_name)
+
+        def generator():
+            for i in range(3):
+                yield [(i,)]
+
+        snow_handler = RecordingSnowHandler()
+        file_handler = SpoolFileHandler()
+        sink = SnowSink(
+            "foo.bar.baz",
+            transient=False,
+            connection_handler=snow_handler,
+            file_handler=file_handler,
+            tmp_file_max_size=4,
+            max_uploads_in_flight=1,
+        )
+        run_result = sink.ingest(
+            data_generator=generator(), column_description=mock_desc
+        )
+
+        assert [batch["number"] for batch in run_result] == [0, 1, 2, 3]
+        expected_files = ["inbound_0.csv", "inbound_1.csv"] * 2
+        assert file_handler.created == expected_files
+        assert snow_handler.uploaded == expected_files
+        assert sorted(file_handler.deleted) == ["inbound_0.csv", "inbound_1.csv"]
+
+    def test_pipelined_ingest_raises_upload_errors(self):
+        class FailingSnowHandler(MockSnowHandler):
+            def ingest_file_to_table(
+                self,
+                table,
+                database,
+                schema,
+                file_path,
+                file_name,
+                staging_format=None,
+            ):
+                raise Exception("put failed")
+
+        class SpoolFileHandler(MockFileHandler):
+            def numbered_file_name(self, number):
+                return f"inbound_{number}.csv"
+
+            def create_file(self, file_name=None):
+                return StringIO(newline="")
+
+            def delete_file(self, file_name=None): ...
+
+        sink = SnowSink(
+            "foo.bar.baz",
+            transient=False,
+            connection_handler=FailingSnowHandler(),
+            file_handler=SpoolFileHandler(),
+            max_uploads_in_flight=2,
+        )
+        with self.assertRaises(Exception):
+            sink.ingest(data_generator=mock_generator(), column_description=mock_desc)
+
+
+class TestFileHandler(TestCase):
+    def test_numbered_file_name(self):
+        file_handler = FileHandler(file_path="/tmp/inbound", file_name="inbound.csv")
+        assert file_handler.numbered_file_name(3) == "inbound_3.csv"
+
+    def test_numbered_file_pattern(self):
+        file_handler = FileHandler(file_path="/tmp/inbound", file_name="inbound.csv")
+        pattern = file_handler.numbered_file_pattern()
+        assert re.fullmatch(pattern, "inbound/inbound_12.csv.gz")
+        assert not re.fullmatch(pattern, "inbound/inbound.csv.gz")
+
+    def test_gzip_compression_adds_suffix(self):
+        file_handler = FileHandler(file_name="inbound.csv", compression="gzip")
+        assert file_handler.file_name == "inbound.csv.gz"
+        assert file_handler.numbered_file_name(1) == "inbound_1.csv.gz"
+
+    def test_gzip_compressed_file_is_readable(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_handler = FileHandler(file_path=tmp_dir, compression="gzip")
+            file = file_handler.create_file()
+            writer = csv.writer(file)
+            writer.writerows([("a",), (1,)] * 1000)
+            file_handler.close_file(file)
+
+            with gzip.open(file_handler.full_file_name, "rt", newline="") as f:
+                result = f.read()
+            assert result == "a\r\n1\r\n" * 1000
+            assert os.path.getsize(file_handler.full_file_name) < len(result)
+
+    def test_zstd_compressed_file_is_readable(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_handler = FileHandler(file_path=tmp_dir, compression="zstd")
+            file = file_handler.create_file()
+            file.write("foo\r\n")
+            file_handler.close_file(file)
+
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+            with open(file_handler.full_file_name, "rb") as f:
+                result = decompressor.decompress(f.read())
+            assert result == b"foo\r\n"
+
+    def test_compressed_file_tell_counts_compressed_bytes(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_handler = FileHandler(file_path=tmp_dir, compression="gzip")
+            file = file_handler.create_file()
+            file.write("a" * 1024 * 1024)
+            size = file.tell()
+            file_handler.close_file(file)
+            assert 0 < size < 1024 * 1024
+
+    def test_put_options_for_compressed_files(self):
+        assert put_options_for("inbound.csv") == "AUTO_COMPRESS=TRUE"
+        assert (
+            put_options_for("inbound.csv.gz")
+            == "AUTO_COMPRESS=FALSE SOURCE_COMPRESSION=GZIP"
+        )
+        assert (
+            put_options_for("inbound.csv.zst")
+            == "AUTO_COMPRESS=FALSE SOURCE_COMPRESSION=ZSTD"
+        )
+
+
+class TestSnowSinkSingleCopy(TestCase):
+    def test_single_copy_puts_every_file_and_copies_once(self):
+        class RecordingSnowHandler(MockSnowHandler):
+            def __init__(self):
+                self.put = []
+                self.copied = []
+
+            def put_file(
+                self,
+                table,
+                database,
+                schema,
+                file_path,
+                file_name,
+                stage_path=None,
+                staging_format=None,
+            ):
+                self.put.append((file_name, stage_path))
+
+            def copy_into_table(
+                self, table, database, schema, stage_path, pattern, file_format
+            ):
+                self.copied.append((table, stage_path, pattern))
+
+        class NumberedFileHandler(MockFileHandler):
+            def __init__(self):
+                super().__init__()
+                self.deleted = []
+
+            def numbered_file_name(self, number):
+                return f"inbound_{number}.csv"
+
+            def numbered_file_pattern(self):
+                return "pattern"
+
+            def create_file(self, file_name=None):
+                return StringIO(newline="")
+
+            def delete_file(self, file_name=None):
+                self.deleted.append(file_name)
+
+        def generator():
+            for i in range(3):
+                yield [(i,)]
+
+        snow_handler = RecordingSnowHandler()
+        file_handler = NumberedFileHandler()
+        sink = SnowSink(
+            "foo.bar.baz",
+            transient=False,
+            connection_handler=snow_handler,
+            file_handler=file_handler,
+            tmp_file_max_size=4,
+            max_uploads_in_flight=2,
+            single_copy=True,
+        )
+        sink.ingest(data_generator=generator(), column_description=mock_desc)
+
+        expected_files = [f"inbound_{i}.csv" for i in range(4)]
+        assert sorted(snow_handler.put) == [(f, "inbound") for f in expected_files]
+        assert sorted(file_handler.deleted) == expected_files
+        assert snow_handler.copied == [("baz__tmp", "inbound", "pattern")]
+
+
+class TestSnowSinkArrow(TestCase):
+    def test_arrow_batches_are_written_as_csv(self):
+        class RecordingFileHandler(MockFileHandler):
+            def create_file(self):
+                self.file = StringIO(newline="")
+                return self.file
+
+        desc = [
+            Description(name="a", type="number", precision=38, scale=0, nullable=True),
+            Description(
+                name="b", type="varchar", precision=None, scale=None, nullable=True
+            ),
+        ]
+
+        def generator():
+            yield pa.table({"a": [1, 2], "b": ["x,y", None]})
+
+        file_handler = RecordingFileHandler()
+        sink = SnowSink(
+            "foo.bar.baz",
+            transient=False,
+            connection_handler=MockSnowHandler(),
+            file_handler=file_handler,
+        )
+        run_result = sink.ingest(data_generator=generator(), column_description=desc)
+
+        assert run_result[0]["rows"] == 2
+        rows = list(csv.reader(StringIO(file_handler.file.getvalue())))
+        assert rows == [["a", "b"], ["1", "x,y"], ["2", ""]]
+
+
+class TestSnowSinkParquet(TestCase):
+    def test_parquet_staging_writes_parquet_files(self):
+        class ParquetFileHandler(MockFileHandler):
+            def __init__(self):
+                super().__init__(file_name="inbound.parquet")
+                self.files = []
+
+            def create_file(self, binary=False):
+                assert binary
+                self.files.append(BytesIO())
+                return self.files[-1]
+
+            def close_file(self, file): ...
+
+        desc = [
+            Description(name="a", type="number", precision=38, scale=0, nullable=True),
+            Description(
+                name="b", type="varchar", precision=None, scale=None, nullable=True
+            ),
+        ]
+
+        def generator():
+            yield [(1, "x"), (2, None)]
+
+        file_handler = ParquetFileHandler()
+        sink = SnowSink(
+            "foo.bar.baz",
+            transient=False,
+            connection_handler=MockSnowHandler(),
+            file_handler=file_handler,
+            staging_format="parquet",
+        )
+        run_result = sink.ingest(data_generator=generator(), column_description=desc)
+
+        assert run_result[0]["rows"] == 2
+        table = pq.read_table(BytesIO(file_handler.files[0].getvalue()))
+        assert table.column_names == ["a", "b"]
+        assert table.to_pylist() == [{"a": 1, "b": "x"}, {"a": 2, "b": None}]
+
+    def test_parquet_staging_format_wins_over_file_name(self):
+        class RecordingCursor:
+            def __init__(self, queries):
+                self.queries = queries
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args): ...
+
+            def execute(self, query):
+                self.queries.append(" ".join(query.split()))
+
+        class RecordingConnection:
+            def __init__(self):
+                self.queries = []
+
+            def cursor(self):
+                return RecordingCursor(self.queries)
+
+        desc = [
+            Description(name="a", type="number", precision=38, scale=0, nullable=True)
+        ]
+
+        def generator():
+            yield [(1,)]
+
+        connection = RecordingConnection()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sink = SnowSink(
+                "foo.bar.baz",
+                transient=False,
+                connection_handler=SnowHandler(connection),
+                file_handler=FileHandler(file_path=tmp_dir),
+                staging_format="parquet",
+            )
+            sink.ingest(data_generator=generator(), column_description=desc)
+
+        put = [query for query in connection.queries if query.startswith("PUT")]
+        copy = [query for query in connection.queries if query.startswith("COPY")]
+        assert "inbound.csv" in put[0]
+        assert "AUTO_COMPRESS=FALSE" in put[0]
+        assert "TYPE = PARQUET" in copy[0]
+        assert file_format_for("inbound.csv", "parquet") == file_format_for(
+            "inbound.parquet"
+        )
+
+    def test_unknown_staging_format_raises(self):
+        with self.assertRaises(ValueError):
+            SnowSink(
+                "foo.bar.baz",
+                transient=False,
+                connection_handler=MockSnowHandler(),
+                staging_format="json",
+            )